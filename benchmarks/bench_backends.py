@@ -0,0 +1,191 @@
+# Licensed under the Apache License, Version 2.0 (the "License");
+# you may not use this file except in compliance with the License.
+# You may obtain a copy of the License at
+#
+# http://www.apache.org/licenses/LICENSE-2.0
+#
+# Unless required by applicable law or agreed to in writing, software
+# distributed under the License is distributed on an "AS IS" BASIS,
+# WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.
+# See the License for the specific language governing permissions and
+# limitations under the License.
+
+""" Measures the overhead of the Python layer around MetaMap.
+
+    Runs the backends against the stand-in executables in
+    benchmarks/stubs (no UMLS install needed) and reports, per batch
+    size, the mean latency of one extract_concepts call, the sentence
+    and concept throughput and the peak Python memory allocated during
+    the call. Latency is timed without tracemalloc; peak memory comes
+    from one separate traced call. Corpus.load is measured on the same
+    volume of MMI output and reported in rows.
+
+        python benchmarks/bench_backends.py --batch-sizes 1,10,100,1000
+
+    --save-baseline writes the results to a JSON file; --baseline
+    compares against such a file and exits with status 1 if a latency or
+    peak grew by more than --threshold (a fraction, default 0.25).
+
+    The stand-ins read FAKE_METAMAP_STARTUP, FAKE_METAMAP_DELAY and
+    FAKE_METAMAP_CONCEPTS from the environment; --startup, --delay and
+    --concepts set them for the run.
+"""
+
+import argparse
+import gc
+import json
+import os
+import sys
+import time
+import tracemalloc
+
+HERE = os.path.dirname(os.path.abspath(__file__))
+sys.path.insert(0, os.path.join(HERE, os.pardir))
+
+from pymetamap import MetaMap, MetaMapLite, Corpus
+
+METAMAP = os.path.join(HERE, 'stubs', 'metamap')
+METAMAP_HOME = os.path.join(HERE, 'stubs', 'public_mm_lite')
+
+BACKENDS = {
+    'subprocess': lambda: MetaMap.get_instance(METAMAP),
+    'persistent': lambda: MetaMap.get_instance(METAMAP, backend='persistent'),
+    'pool': lambda: MetaMap.get_instance(METAMAP, backend='pool', pool_size=4),
+    'lite': lambda: MetaMapLite.get_instance(METAMAP_HOME),
+    'lite-persistent': lambda: MetaMapLite.get_instance(METAMAP_HOME, backend='persistent'),
+}
+
+SENTENCES = [
+    'John had a huge heart attack',
+    'Patient denies fever or chills',
+    'History of diabetes and hypertension',
+    'Chest pain radiating to the left arm',
+    'Started on aspirin daily',
+]
+
+
+def make_batch(size):
+    sentences = [SENTENCES[i % len(SENTENCES)] + ' ' + str(i) for i in range(size)]
+    return sentences, list(range(size))
+
+
+def measure(function, repeat):
+    """ Returns (mean seconds, peak bytes, result of the last call). The
+        timed calls run without tracemalloc, whose hooks slow down every
+        allocation; the peak comes from one more call with tracing on.
+    """
+    seconds = list()
+    result = None
+    for _ in range(repeat):
+        gc.collect()
+        started = time.perf_counter()
+        result = function()
+        seconds.append(time.perf_counter() - started)
+    gc.collect()
+    tracemalloc.start()
+    try:
+        function()
+        peak = tracemalloc.get_traced_memory()[1]
+    finally:
+        tracemalloc.stop()
+    return sum(seconds) / len(seconds), peak, result
+
+
+def report(name, batch_size, seconds, peak, concepts):
+    print('{0:<16} {1:>7} {2:>10.4f} {3:>12,.0f} {4:>12,.0f} {5:>10.1f}'.format(
+        name, batch_size, seconds, batch_size / seconds, concepts / seconds, peak / 1024.0))
+
+
+def report_load(rows, seconds, peak):
+    print('{0:<16} {1:>7} {2:>10} {3:>12} {4:>12}'.format(
+        'parser', 'rows', 'latency s', 'rows/s', 'peak KiB'))
+    print('{0:<16} {1:>7} {2:>10.4f} {3:>12,.0f} {4:>12.1f}'.format(
+        'Corpus.load', rows, seconds, rows / seconds, peak / 1024.0))
+
+
+def regressions(results, baseline, threshold):
+    """ Returns a message for every result whose latency or peak exceeds
+        its baseline by more than threshold (a fraction).
+    """
+    messages = list()
+    for key, result in sorted(results.items()):
+        if key not in baseline:
+            continue
+        for measurement in ('seconds', 'peak'):
+            limit = baseline[key][measurement] * (1 + threshold)
+            if result[measurement] > limit:
+                messages.append('{0}: {1} {2:.6g} exceeds baseline {3:.6g} by more than {4:.0%}'.format(
+                    key, measurement, result[measurement], baseline[key][measurement], threshold))
+    return messages
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.split('\n')[0])
+    parser.add_argument('--batch-sizes', default='1,10,100,1000',
+                        help='comma separated batch sizes (default: %(default)s)')
+    parser.add_argument('--backends', default=','.join(sorted(BACKENDS)),
+                        help='comma separated backends (default: %(default)s)')
+    parser.add_argument('--repeat', type=int, default=3)
+    parser.add_argument('--startup', type=float, default=0.0,
+                        help='simulated startup time of the tool in seconds')
+    parser.add_argument('--delay', type=float, default=0.0,
+                        help='simulated processing time per sentence in seconds')
+    parser.add_argument('--concepts', type=int, default=3,
+                        help='concepts emitted per sentence')
+    parser.add_argument('--save-baseline', metavar='PATH',
+                        help='write the results to PATH as JSON')
+    parser.add_argument('--baseline', metavar='PATH',
+                        help='compare against results saved with --save-baseline')
+    parser.add_argument('--threshold', type=float, default=0.25,
+                        help='allowed growth over the baseline (default: %(default)s)')
+    args = parser.parse_args()
+
+    os.environ['FAKE_METAMAP_STARTUP'] = str(args.startup)
+    os.environ['FAKE_METAMAP_DELAY'] = str(args.delay)
+    os.environ['FAKE_METAMAP_CONCEPTS'] = str(args.concepts)
+    batch_sizes = [int(size) for size in args.batch_sizes.split(',')]
+
+    results = dict()
+    print('{0:<16} {1:>7} {2:>10} {3:>12} {4:>12} {5:>10}'.format(
+        'backend', 'batch', 'latency s', 'sentences/s', 'concepts/s', 'peak KiB'))
+    mmi_lines = None
+    for name in args.backends.split(','):
+        backend = BACKENDS[name]()
+        try:
+            for batch_size in batch_sizes:
+                sentences, ids = make_batch(batch_size)
+                seconds, peak, (concepts, error) = measure(
+                    lambda: backend.extract_concepts(sentences, ids), args.repeat)
+                if error is not None:
+                    print('{0}: {1}'.format(name, error))
+                report(name, batch_size, seconds, peak, len(concepts))
+                results['{0}/{1}'.format(name, batch_size)] = {'seconds': seconds, 'peak': peak}
+                if name == 'subprocess' and batch_size == max(batch_sizes):
+                    mmi_lines = ['|'.join(concept) for concept in concepts]
+        finally:
+            if hasattr(backend, 'close'):
+                backend.close()
+
+    if mmi_lines is None:
+        sentences, ids = make_batch(max(batch_sizes))
+        concepts, error = BACKENDS['subprocess']().extract_concepts(sentences, ids)
+        mmi_lines = ['|'.join(concept) for concept in concepts]
+    seconds, peak, concepts = measure(lambda: Corpus.load(mmi_lines), args.repeat)
+    print('')
+    report_load(len(mmi_lines), seconds, peak)
+    results['Corpus.load/{0}'.format(len(mmi_lines))] = {'seconds': seconds, 'peak': peak}
+
+    if args.save_baseline:
+        with open(args.save_baseline, 'w') as baseline_file:
+            json.dump(results, baseline_file, indent=2, sort_keys=True)
+    if args.baseline:
+        with open(args.baseline) as baseline_file:
+            messages = regressions(results, json.load(baseline_file), args.threshold)
+        for message in messages:
+            print('REGRESSION ' + message)
+        if messages:
+            sys.exit(1)
+
+
+if __name__ == '__main__':
+    main()
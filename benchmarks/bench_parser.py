@@ -0,0 +1,99 @@
+# Licensed under the Apache License, Version 2.0 (the "License");
+# you may not use this file except in compliance with the License.
+# You may obtain a copy of the License at
+#
+# http://www.apache.org/licenses/LICENSE-2.0
+#
+# Unless required by applicable law or agreed to in writing, software
+# distributed under the License is distributed on an "AS IS" BASIS,
+# WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.
+# See the License for the specific language governing permissions and
+# limitations under the License.
+
+""" Measures MMI parsing throughput in lines/second.
+
+    Compares Corpus.load and CorpusLite.load against the previous
+    implementation, which split every line twice and built each concept
+    from a throwaway dict(zip(...)).
+
+        python benchmarks/bench_parser.py [--lines N] [--repeat N]
+"""
+
+import argparse
+import os
+import sys
+import timeit
+
+sys.path.insert(0, os.path.join(os.path.dirname(os.path.abspath(__file__)), os.pardir))
+
+from pymetamap import Corpus, CorpusLite, ConceptMMI, ConceptAA, ConceptUA, ConceptLiteMMI
+from pymetamap.Concept import FIELD_NAMES_MMI, FIELD_NAMES_AA, FIELD_NAMES_UA
+from pymetamap.ConceptLite import FIELD_NAMES_MMI as FIELD_NAMES_LITE
+
+
+def legacy_load(stream):
+    corpus = list()
+    for line in stream:
+        fields = line.split('|')
+        if fields[1] == 'MMI':
+            corpus.append(ConceptMMI(**dict(zip(FIELD_NAMES_MMI, line.split('|')))))
+        elif fields[1] == 'AA':
+            corpus.append(ConceptAA(**dict(zip(FIELD_NAMES_AA, line.split('|')))))
+        else:
+            corpus.append(ConceptUA(**dict(zip(FIELD_NAMES_UA, line.split('|')))))
+    return corpus
+
+
+def legacy_load_lite(stream):
+    corpus = list()
+    for line in stream:
+        fields = line.split('|')
+        if fields[1] == 'MMI':
+            corpus.append(ConceptLiteMMI(**dict(zip(FIELD_NAMES_LITE, line.split('|')))))
+    return corpus
+
+
+def make_lines(count):
+    lines = list()
+    for i in range(count):
+        if i % 50 == 49:
+            lines.append('{0}|AA|MI|myocardial infarction|1|2|2|21|{1}:2'.format(i // 5, i % 300))
+        else:
+            lines.append('{0}|MMI|{1:.2f}|Myocardial Infarction|C{2:07d}|[dsyn]|'
+                         '["Heart attack"-tx-1-"heart attack"-noun-0]|TX|{3}/12|'
+                         'C14.280.647.500;C14.907.585.500'.format(i // 5, (i % 1000) / 10.0, i % 5000, i % 300))
+    return lines
+
+
+def make_lite_lines(count):
+    return ['{0}|MMI|3.5|Myocardial Infarction|C{1:07d}|dsyn|'
+            '"heart attack"-text-0-"heart attack"-NN-0|{2}/12|'.format(i // 5, i % 5000, i % 300)
+            for i in range(count)]
+
+
+def measure(name, function, lines, repeat):
+    seconds = min(timeit.repeat(lambda: function(lines), number=1, repeat=repeat))
+    rate = len(lines) / seconds
+    print('{0:<24} {1:>12,.0f} lines/s'.format(name, rate))
+    return rate
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.split('\n')[0])
+    parser.add_argument('--lines', type=int, default=200000)
+    parser.add_argument('--repeat', type=int, default=5)
+    args = parser.parse_args()
+
+    lines = make_lines(args.lines)
+    before = measure('legacy Corpus.load', legacy_load, lines, args.repeat)
+    after = measure('Corpus.load', Corpus.load, lines, args.repeat)
+    print('{0:<24} {1:>12.2f}x'.format('speedup', after / before))
+
+    lines = make_lite_lines(args.lines)
+    before = measure('legacy CorpusLite.load', legacy_load_lite, lines, args.repeat)
+    after = measure('CorpusLite.load', CorpusLite.load, lines, args.repeat)
+    print('{0:<24} {1:>12.2f}x'.format('speedup', after / before))
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,244 @@
+# Licensed under the Apache License, Version 2.0 (the "License");
+# you may not use this file except in compliance with the License.
+# You may obtain a copy of the License at
+#
+# http://www.apache.org/licenses/LICENSE-2.0
+#
+# Unless required by applicable law or agreed to in writing, software
+# distributed under the License is distributed on an "AS IS" BASIS,
+# WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.
+# See the License for the specific language governing permissions and
+# limitations under the License.
+
+""" Stand-in for the MetaMap and MetaMapLite executables.
+
+    Emits plausible MMI rows for every input line without needing a UMLS
+    install, so the Python layer can be measured and exercised on its
+    own. Behaviour is controlled with environment variables:
+
+        FAKE_METAMAP_STARTUP    seconds to sleep before reading input (0)
+        FAKE_METAMAP_DELAY      seconds to sleep per input line (0)
+        FAKE_METAMAP_CONCEPTS   concepts emitted per input line (3)
+        FAKE_METAMAP_FAIL_ON    exit with status 1 on a line containing this
+        FAKE_METAMAP_HANG_ON    stop responding on a line containing this
+        FAKE_METAMAP_EMPTY_ON   emit no concepts for a line containing this
+
+    --JSONn (with -c for candidate lists) and MetaMapLite's
+    --outputformat=json and brat are emitted as well as MMI; a concept
+    after the word 'no' is negated.
+
+    With --tagger_server (and --WSD_SERVER with -y) every line is also
+    sent to that server, on the port in TAGGER_SERVER_PORT (or
+    WSD_SERVER_PORT), and its reply awaited; see fake_server.py.
+
+    Every other input line with text produces at least one concept, so
+    the sentinel sentences of the persistent backends are answered.
+"""
+
+import json
+import os
+import socket
+import sys
+import time
+
+# MetaMap options which take a value.
+VALUE_OPTIONS = set(['-Q', '-V', '--prune', '-e', '-R', '-J', '-k', '--no_nums',
+                     '--restrict_to_sources', '--tagger_server', '--WSD_SERVER'])
+
+CONCEPTS = [
+    ('C0027051', 'Myocardial Infarction', '[dsyn]', 'C14.280.647.500;C14.907.585.500'),
+    ('C0015967', 'Fever', '[sosy]', 'C23.888.119.344'),
+    ('C0030193', 'Pain', '[sosy]', 'C23.888.592.612'),
+    ('C0011849', 'Diabetes Mellitus', '[dsyn]', 'C18.452.394.750;C19.246'),
+    ('C0020538', 'Hypertensive disease', '[dsyn]', 'C14.907.489'),
+    ('C0004057', 'Aspirin', '[orch,phsu]', 'D02.455.426.559.389.657.109'),
+]
+
+
+def parse_arguments(arguments):
+    options = dict()
+    positional = list()
+    arguments = iter(arguments)
+    for argument in arguments:
+        if argument in VALUE_OPTIONS:
+            options[argument] = next(arguments, '')
+        elif argument.startswith('-'):
+            name, _, value = argument.partition('=')
+            options[name] = value
+        else:
+            positional.append(argument)
+    return options, positional
+
+
+def emit(line, with_ids, lite, out, settings):
+    line = line.rstrip('\r\n')
+    if not line.strip():
+        return
+    if settings['fail_on'] and settings['fail_on'] in line:
+        out.flush()
+        sys.exit(1)
+    if settings['hang_on'] and settings['hang_on'] in line:
+        out.flush()
+        time.sleep(10 ** 6)
+    if settings['delay']:
+        time.sleep(settings['delay'])
+    if settings['empty_on'] and settings['empty_on'] in line:
+        return
+    for server in settings['servers']:
+        server.write(b'tag\n')
+        server.flush()
+        server.readline()
+
+    if with_ids:
+        # MetaMap echoes the id exactly as it was written.
+        identifier, _, text = line.partition('|')
+    else:
+        identifier, text = ('USER' if lite else '00000000'), line
+    words = [word for word in text.replace("'", ' ').split() if word.isalpha()] or [text.strip()]
+
+    rows = list()
+    for number in range(max(1, settings['concepts'])):
+        cui, name, semtypes, tree_codes = CONCEPTS[(len(text) + number) % len(CONCEPTS)]
+        word = words[number % len(words)]
+        rows.append((number, cui, name, semtypes, tree_codes, word, max(text.find(word), 0)))
+
+    if settings['format'] == 'json' and lite:
+        write_lite_json(identifier, text, rows, out)
+    elif settings['format'] == 'json':
+        write_json(identifier, text, rows, out, settings)
+    elif settings['format'] == 'brat':
+        write_brat(rows, out)
+    else:
+        for number, cui, name, semtypes, tree_codes, word, start in rows:
+            if lite:
+                out.write('{0}|MMI|{1:.1f}|{2}|{3}|{4}|"{5}"-text-{6}-"{5}"-NN-0|{7}/{8}|\n'.format(
+                    identifier, 3.5 - number * 0.25, name, cui, semtypes.strip('[]'),
+                    word, number, start, len(word)))
+            else:
+                out.write('{0}|MMI|{1:.2f}|{2}|{3}|{4}|["{5}"-tx-{6}-"{5}"-noun-0]|TX|{7}/{8}|{9}\n'.format(
+                    identifier, 14.64 - number, name, cui, semtypes, word, number + 1,
+                    start, len(word), tree_codes))
+    out.flush()
+
+
+def negated(text, start):
+    """ A concept is negated when 'no' is the word before it. """
+    return [word.strip('\'"') for word in text[:start].split()[-1:]] == ['no']
+
+
+def write_json(identifier, text, rows, out, settings):
+    """ Writes one element of the AllDocuments array of --JSONn output,
+        with one utterance and one phrase per concept.
+    """
+    phrases = list()
+    negations = list()
+    for number, cui, name, semtypes, tree_codes, word, start in rows:
+        candidate = {'CandidateScore': str(-1000 + number * 50), 'CandidateCUI': cui,
+                     'CandidateMatched': word, 'CandidatePreferred': name,
+                     'MatchedWords': [word.lower()], 'SemTypes': semtypes.strip('[]').split(','),
+                     'MatchMaps': [], 'IsHead': 'yes', 'IsOverMatch': 'no', 'Sources': ['MSH'],
+                     'ConceptPIs': [{'StartPos': str(start), 'Length': str(len(word))}],
+                     'Status': '0', 'Negated': '1' if negated(text, start) else '0'}
+        phrases.append({'PhraseText': word, 'SyntaxUnits': [],
+                        'PhraseStartPos': str(start), 'PhraseLength': str(len(word)),
+                        'Candidates': [candidate] if settings['candidates'] else [],
+                        'Mappings': [{'MappingScore': candidate['CandidateScore'],
+                                      'MappingCandidates': [candidate]}]})
+        if negated(text, start):
+            trigger = text.rfind('no', 0, start)
+            negations.append({'NegType': 'nega', 'NegTrigger': 'no',
+                              'NegTriggerPIs': [{'StartPos': str(trigger), 'Length': '2'}],
+                              'NegConcepts': [{'NegConcCUI': cui, 'NegConcMatched': word}],
+                              'NegConcPIs': [{'StartPos': str(start), 'Length': str(len(word))}]})
+    document = {'Document': {'CmdLine': {'Command': 'metamap', 'Options': []}, 'AAs': [],
+                             'Negations': negations,
+                             'Utterances': [{'PMID': identifier, 'UttSection': 'tx', 'UttNum': '1',
+                                             'UttText': text, 'UttStartPos': '0',
+                                             'UttLength': str(len(text)), 'Phrases': phrases}]}}
+    if settings['documents']:
+        out.write(',')
+    settings['documents'] += 1
+    out.write(json.dumps(document, separators=(',', ':')))
+
+
+def write_lite_json(identifier, text, rows, out):
+    """ Writes the entities of one input line as a JSON array. """
+    entities = list()
+    for number, cui, name, semtypes, tree_codes, word, start in rows:
+        entities.append({'matchedtext': word, 'docid': identifier, 'fieldid': 'text',
+                         'start': start, 'length': len(word), 'id': 'en{0}'.format(number),
+                         'negated': negated(text, start),
+                         'evlist': [{'score': 0, 'matchedtext': word, 'start': start,
+                                     'length': len(word), 'id': 'ev{0}'.format(number),
+                                     'conceptinfo': {'conceptstring': word, 'cui': cui,
+                                                     'preferredname': name, 'sources': ['MSH'],
+                                                     'semantictypes': semtypes.strip('[]').split(',')}}]})
+    out.write(json.dumps(entities) + '\n')
+
+
+def write_brat(rows, out):
+    for number, cui, name, semtypes, tree_codes, word, start in rows:
+        out.write('T{0}\t{1} {2} {3}\t{4}\n'.format(number + 1, semtypes.strip('[]').split(',')[0],
+                                                   start, start + len(word), word))
+        out.write('#{0}\tAnnotatorNotes T{0}\t{1}:{2}\n'.format(number + 1, name, cui))
+
+
+def connect_servers(options):
+    servers = list()
+    for option, variable, port, needed in (('--tagger_server', 'TAGGER_SERVER_PORT', 1795, True),
+                                           ('--WSD_SERVER', 'WSD_SERVER_PORT', 5554, '-y' in options)):
+        if option in options and needed:
+            connection = socket.create_connection(
+                (options[option], int(os.environ.get(variable, port))))
+            servers.append(connection.makefile('rwb'))
+    return servers
+
+
+def main(lite):
+    options, positional = parse_arguments(sys.argv[1:])
+    settings = {'delay': float(os.environ.get('FAKE_METAMAP_DELAY', '0')),
+                'concepts': int(os.environ.get('FAKE_METAMAP_CONCEPTS', '3')),
+                'fail_on': os.environ.get('FAKE_METAMAP_FAIL_ON'),
+                'hang_on': os.environ.get('FAKE_METAMAP_HANG_ON'),
+                'empty_on': os.environ.get('FAKE_METAMAP_EMPTY_ON'),
+                'servers': connect_servers(options),
+                'format': 'mmi', 'candidates': '-c' in options, 'documents': 0}
+    if '--JSONn' in options or options.get('--outputformat') == 'json':
+        settings['format'] = 'json'
+    elif options.get('--outputformat') == 'brat':
+        settings['format'] = 'brat'
+    time.sleep(float(os.environ.get('FAKE_METAMAP_STARTUP', '0')))
+
+    if lite:
+        with_ids = options.get('--inputformat') == 'sldiwi'
+    else:
+        with_ids = '--sldiID' in options
+        # MetaMap echoes its command line to stdout, even with --silent.
+        sys.stdout.write('/opt/public_mm/bin/SKRrun.20 ' + ' '.join(sys.argv[1:]) + '\n')
+        if settings['format'] == 'json':
+            sys.stdout.write('{"AllDocuments":[')
+        sys.stdout.flush()
+
+    if lite and '--pipe' not in options and positional:
+        # MetaMapLite writes <input>.mmi next to the input file.
+        with open(positional[0]) as input_file:
+            lines = input_file.readlines()
+        with open(os.path.splitext(positional[0])[0] + '.mmi', 'w') as output_file:
+            for line in lines:
+                emit(line, with_ids, lite, output_file, settings)
+    elif not lite and len(positional) >= 2:
+        with open(positional[0]) as input_file, open(positional[1], 'w') as output_file:
+            for line in input_file:
+                emit(line, with_ids, lite, output_file, settings)
+    else:
+        for line in iter(sys.stdin.readline, ''):
+            emit(line, with_ids, lite, sys.stdout, settings)
+    if not lite and settings['format'] == 'json':
+        sys.stdout.write(']}\n')
+
+
+if __name__ == '__main__':
+    lite = sys.argv[1:2] == ['--lite']
+    if lite:
+        del sys.argv[1]
+    main(lite)
@@ -0,0 +1,48 @@
+# Licensed under the Apache License, Version 2.0 (the "License");
+# you may not use this file except in compliance with the License.
+# You may obtain a copy of the License at
+#
+# http://www.apache.org/licenses/LICENSE-2.0
+#
+# Unless required by applicable law or agreed to in writing, software
+# distributed under the License is distributed on an "AS IS" BASIS,
+# WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.
+# See the License for the specific language governing permissions and
+# limitations under the License.
+
+""" Stand-in for the SKR/MedPost tagger and WSD servers.
+
+        python fake_server.py PORT
+
+    Answers every line it receives with one line. Requests from all
+    connections are served one at a time, each taking
+    FAKE_SERVER_DELAY seconds (0.01), so a single server becomes the
+    bottleneck when many MetaMap processes share it.
+"""
+
+import os
+import socketserver
+import sys
+import threading
+import time
+
+LOCK = threading.Lock()
+DELAY = float(os.environ.get('FAKE_SERVER_DELAY', '0.01'))
+
+
+class Handler(socketserver.StreamRequestHandler):
+    def handle(self):
+        for line in self.rfile:
+            with LOCK:
+                time.sleep(DELAY)
+            self.wfile.write(b'ok\n')
+            self.wfile.flush()
+
+
+class Server(socketserver.ThreadingTCPServer):
+    allow_reuse_address = True
+    daemon_threads = True
+
+
+if __name__ == '__main__':
+    Server(('localhost', int(sys.argv[1])), Handler).serve_forever()
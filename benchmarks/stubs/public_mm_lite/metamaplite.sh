@@ -0,0 +1,3 @@
+#!/bin/bash
+# Stand-in for MetaMapLite's metamaplite.sh; see ../fake_metamap.py.
+exec python3 "$(dirname "$0")/../fake_metamap.py" --lite "$@"
@@ -0,0 +1,144 @@
+# Licensed under the Apache License, Version 2.0 (the "License");
+# you may not use this file except in compliance with the License.
+# You may obtain a copy of the License at
+#
+# http://www.apache.org/licenses/LICENSE-2.0
+#
+# Unless required by applicable law or agreed to in writing, software
+# distributed under the License is distributed on an "AS IS" BASIS,
+# WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.
+# See the License for the specific language governing permissions and
+# limitations under the License.
+
+import collections
+import itertools
+import time
+
+
+class AdaptiveBatcher(object):
+    def __init__(self, metamap, target_latency=None, max_overhead=0.1,
+                 initial_batch=10, min_batch=1, max_batch=10000, window=20,
+                 max_growth=2.0):
+        """ Feeds a stream of sentences of any length to metamap (any
+            MetaMap or MetaMapLite backend) in batches whose size is
+            tuned from the observed latencies.
+
+            Every successful batch is modelled as a fixed overhead
+            (process startup, mostly) plus a cost per character, fitted
+            over the last window batches. Batches are then sized so the
+            overhead is at most max_overhead of the batch's time, which
+            keeps throughput within that fraction of the best possible,
+            and, if target_latency is given, so a batch is expected to
+            take no longer than target_latency seconds. Batches always
+            hold between min_batch and max_batch sentences, and a batch
+            has at most max_growth times the characters of the last
+            successful one, so a poor early fit cannot jump straight to
+            max_batch.
+        """
+        if not 1 <= min_batch <= initial_batch <= max_batch:
+            raise ValueError("Batch sizes must satisfy 1 <= min_batch <= "
+                             "initial_batch <= max_batch.")
+        if not 0 < max_overhead < 1:
+            raise ValueError("max_overhead must be between 0 and 1.")
+        if max_growth <= 1:
+            raise ValueError("max_growth must be greater than 1.")
+        self.metamap = metamap
+        self.target_latency = target_latency
+        self.max_overhead = max_overhead
+        self.initial_batch = initial_batch
+        self.min_batch = min_batch
+        self.max_batch = max_batch
+        self.max_growth = max_growth
+        self.history = collections.deque(maxlen=window)
+        self.batch_chars = None
+
+    def model(self):
+        """ Returns (overhead, seconds_per_char) fitted by least squares
+            to the recent batches, or None before there is enough data.
+        """
+        if not self.history:
+            return None
+        points = [(chars, seconds) for _, chars, seconds in self.history]
+        count = float(len(points))
+        mean_chars = sum(chars for chars, _ in points) / count
+        mean_seconds = sum(seconds for _, seconds in points) / count
+        spread = sum((chars - mean_chars) ** 2 for chars, _ in points)
+        if spread > 0:
+            per_char = sum((chars - mean_chars) * (seconds - mean_seconds)
+                           for chars, seconds in points) / spread
+            overhead = mean_seconds - per_char * mean_chars
+        else:
+            per_char = overhead = -1
+        if per_char <= 0 or overhead < 0:
+            # Too few or too noisy points: attribute everything to the
+            # characters, which errs towards smaller batches.
+            return (0.0, mean_seconds / max(mean_chars, 1.0))
+        return (overhead, per_char)
+
+    def _next_chars(self):
+        """ Returns the character budget of the next batch, or None to
+            use initial_batch sentences.
+        """
+        model = self.model()
+        if model is None:
+            return None
+        overhead, per_char = model
+        last = self.history[-1][1]
+        limit = self.max_growth * last
+        if overhead > 0.0:
+            chars = min(overhead * (1 - self.max_overhead) / (self.max_overhead * per_char), limit)
+        elif len(self.history) > 1 and len(set(chars for _, chars, _ in self.history)) == 1:
+            # Every recent batch had the same size, leaving nothing to
+            # fit on: the size has settled, so keep it.
+            chars = last
+        else:
+            # Explore: grow until there is enough spread to fit on.
+            chars = limit
+        if self.target_latency is not None:
+            chars = min(chars, max(self.target_latency - overhead, 0.0) / per_char)
+        return max(int(chars), 1)
+
+    def _batches(self, documents):
+        documents = iter(documents)
+        pending = None
+        while True:
+            budget = self._next_chars()
+            batch = list()
+            chars = 0
+            while len(batch) < self.max_batch:
+                if budget is None and len(batch) >= self.initial_batch:
+                    break
+                if budget is not None and chars >= budget and len(batch) >= self.min_batch:
+                    break
+                if pending is None:
+                    pending = next(documents, None)
+                    if pending is None:
+                        break
+                batch.append(pending)
+                chars += len(pending[1])
+                pending = None
+            if not batch:
+                return
+            self.batch_chars = budget
+            yield batch
+
+    def run(self, sentences, ids=None, **options):
+        """ Yields (concepts, error) for every batch of sentences, in
+            input order; options are passed on to extract_concepts.
+            sentences may be an unbounded iterable. Without ids,
+            sentences are numbered by their position in the stream.
+        """
+        if ids is None:
+            ids = itertools.count()
+        for batch in self._batches(zip(ids, sentences)):
+            batch_ids = [identifier for identifier, _ in batch]
+            batch_sentences = [sentence for _, sentence in batch]
+            started = time.perf_counter()
+            concepts, error = self.metamap.extract_concepts(batch_sentences, batch_ids,
+                                                            **options)
+            seconds = time.perf_counter() - started
+            if error is None:
+                # Failed batches end early and would skew the model.
+                self.history.append((len(batch), sum(len(sentence) for sentence in batch_sentences),
+                                     seconds))
+            yield (concepts, error)
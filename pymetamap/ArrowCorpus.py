@@ -0,0 +1,241 @@
+# Licensed under the Apache License, Version 2.0 (the "License");
+# you may not use this file except in compliance with the License.
+# You may obtain a copy of the License at
+#
+# http://www.apache.org/licenses/LICENSE-2.0
+#
+# Unless required by applicable law or agreed to in writing, software
+# distributed under the License is distributed on an "AS IS" BASIS,
+# WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.
+# See the License for the specific language governing permissions and
+# limitations under the License.
+
+import itertools
+from .Concept import parse_semtypes, parse_spans
+
+# Imported on first use, so that importing pymetamap does not load it.
+pyarrow = None
+
+BATCH_ROWS = 65536
+
+# Fields with few distinct values, stored dictionary encoded.
+DICTIONARY_FIELDS = ('mm', 'preferred_name', 'cui', 'semtypes', 'location', 'tree_codes')
+
+# Columns added to the text fields of the concepts.
+TYPED_COLUMNS = ('score_value', 'pos_start', 'pos_length', 'semtype_list', 'other_fields')
+
+# Schema metadata key naming the corpus class a file was written from.
+CORPUS_KEY = b'pymetamap.corpus'
+
+
+def _require_pyarrow():
+    global pyarrow
+    if pyarrow is not None:
+        return
+    try:
+        import pyarrow
+        import pyarrow.compute
+        import pyarrow.ipc
+        import pyarrow.parquet
+    except ImportError:
+        pyarrow = None
+        raise ImportError("pyarrow is required for Arrow and Parquet support "
+                          "(pip install pymetamap[arrow])")
+
+
+def _score(concept):
+    try:
+        return float(concept.score)
+    except ValueError:
+        return None
+
+
+def _record_batch(concepts, field_names):
+    """ Builds one RecordBatch from MMI and AA/UA concepts. MMI rows fill
+        the field columns and the typed columns; the fields of other
+        rows go to other_fields.
+    """
+    columns = dict((name, list()) for name in field_names)
+    score_value = list()
+    pos_start = list()
+    pos_length = list()
+    semtype_list = list()
+    other_fields = list()
+    for concept in concepts:
+        if concept[1] == 'MMI':
+            for name, value in zip(field_names, concept):
+                columns[name].append(value)
+            score_value.append(_score(concept))
+            spans = parse_spans(concept.pos_info)
+            pos_start.append(spans[0][0] if spans else None)
+            pos_length.append(spans[0][1] if spans else None)
+            semtype_list.append(parse_semtypes(concept.semtypes))
+            other_fields.append(None)
+        else:
+            for name in field_names:
+                columns[name].append(None)
+            columns['index'][-1] = concept[0]
+            columns['mm'][-1] = concept[1]
+            score_value.append(None)
+            pos_start.append(None)
+            pos_length.append(None)
+            semtype_list.append(None)
+            other_fields.append(list(concept))
+
+    arrays = list()
+    for name in field_names:
+        array = pyarrow.array(columns[name], type=pyarrow.string())
+        if name in DICTIONARY_FIELDS:
+            array = array.dictionary_encode()
+        arrays.append(array)
+    arrays.append(pyarrow.array(score_value, type=pyarrow.float64()))
+    arrays.append(pyarrow.array(pos_start, type=pyarrow.int32()))
+    arrays.append(pyarrow.array(pos_length, type=pyarrow.int32()))
+    arrays.append(pyarrow.array(semtype_list, type=pyarrow.list_(pyarrow.string())))
+    arrays.append(pyarrow.array(other_fields, type=pyarrow.list_(pyarrow.string())))
+    names = list(field_names) + list(TYPED_COLUMNS)
+    return pyarrow.RecordBatch.from_arrays(arrays, names=names)
+
+
+def to_arrow(corpus, field_names, path=None):
+    """ Returns the concepts of corpus as a pyarrow Table with a string
+        column per field plus typed score_value, pos_start/pos_length
+        (first span) and semtype_list columns. If path is given, the
+        table is also written there as an Arrow IPC file, which
+        ArrowCorpus.open can memory-map.
+    """
+    _require_pyarrow()
+    batches = list()
+    concepts = iter(corpus)
+    while True:
+        chunk = list(itertools.islice(concepts, BATCH_ROWS))
+        if not chunk:
+            break
+        batches.append(_record_batch(chunk, field_names))
+    if not batches:
+        batches.append(_record_batch([], field_names))
+    metadata = {CORPUS_KEY: corpus.__class__.__name__.encode('utf8')}
+    schema = batches[0].schema.with_metadata(metadata)
+    table = pyarrow.Table.from_batches(batches, schema=schema)
+    if path is not None:
+        # IPC files allow a single dictionary per column.
+        options = pyarrow.ipc.IpcWriteOptions(unify_dictionaries=True)
+        with pyarrow.ipc.new_file(path, schema, options=options) as writer:
+            writer.write_table(table)
+    return table
+
+
+def to_parquet(corpus, field_names, path, **options):
+    """ Writes the table built by to_arrow to a Parquet file; options
+        are passed on to pyarrow.parquet.write_table.
+    """
+    pyarrow.parquet.write_table(to_arrow(corpus, field_names), path, **options)
+
+
+def _to_pylist(column):
+    """ ChunkedArray.to_pylist, decoding every dictionary value once. """
+    if not pyarrow.types.is_dictionary(column.type):
+        return column.to_pylist()
+    values = list()
+    for chunk in column.chunks:
+        dictionary = chunk.dictionary.to_pylist() + [None]
+        values.extend(dictionary[index] for index in
+                      chunk.indices.fill_null(len(dictionary) - 1).to_pylist())
+    return values
+
+
+class ArrowCorpus(object):
+    def __init__(self, table, corpus_class):
+        """ Read-only, lazily decoded view of a table written by to_arrow.
+            Concepts are only built when accessed; the underlying
+            pyarrow Table is available as table for columnar analytics.
+        """
+        _require_pyarrow()
+        self.table = table
+        self.corpus_class = corpus_class
+        self.field_names = [name for name in table.column_names
+                            if name not in TYPED_COLUMNS]
+
+    @classmethod
+    def open(this_class, path, corpus_class):
+        """ Opens an Arrow IPC file, memory-mapped so nothing is copied or
+            decoded up front, or a Parquet file.
+        """
+        _require_pyarrow()
+        with open(path, 'rb') as probe:
+            magic = probe.read(4)
+        if magic == b'PAR1':
+            table = pyarrow.parquet.read_table(path, memory_map=True)
+        else:
+            table = pyarrow.ipc.open_file(pyarrow.memory_map(path, 'r')).read_all()
+        written = (table.schema.metadata or {}).get(CORPUS_KEY)
+        if written is not None and written.decode('utf8') != corpus_class.__name__:
+            raise ValueError("{0} holds a {1}, not a {2}".format(
+                path, written.decode('utf8'), corpus_class.__name__))
+        return this_class(table, corpus_class)
+
+    def __len__(self):
+        return self.table.num_rows
+
+    def _concepts(self, table):
+        make = self.corpus_class.make_concept
+        columns = [_to_pylist(table.column(name)) for name in self.field_names]
+        others = table.column('other_fields').to_pylist()
+        for row, fields in enumerate(zip(*columns)):
+            if others[row] is not None:
+                yield make(others[row])
+            else:
+                yield make(fields)
+
+    def __getitem__(self, row):
+        if row < 0:
+            row += len(self)
+        if not 0 <= row < len(self):
+            raise IndexError('ArrowCorpus index out of range')
+        return next(self._concepts(self.table.slice(row, 1)))
+
+    def __iter__(self):
+        for start in range(0, len(self), BATCH_ROWS):
+            for concept in self._concepts(self.table.slice(start, BATCH_ROWS)):
+                yield concept
+
+    def filter(self, min_score=None, max_score=None, cuis=None, semtypes=None):
+        """ Returns a new ArrowCorpus with the rows whose score is within
+            [min_score, max_score], whose CUI is in cuis and which have at
+            least one semantic type in semtypes, evaluated on the columns
+            without building any concept.
+        """
+        compute = pyarrow.compute
+        table = self.table
+        mask = None
+        conditions = list()
+        if min_score is not None:
+            conditions.append(compute.greater_equal(table.column('score_value'), min_score))
+        if max_score is not None:
+            conditions.append(compute.less_equal(table.column('score_value'), max_score))
+        if cuis is not None:
+            cuis = [cuis] if isinstance(cuis, str) else list(cuis)
+            conditions.append(compute.is_in(table.column('cui').cast(pyarrow.string()),
+                                            value_set=pyarrow.array(cuis, type=pyarrow.string())))
+        if semtypes is not None:
+            semtypes = [semtypes] if isinstance(semtypes, str) else list(semtypes)
+            column = table.column('semtype_list').combine_chunks()
+            hits = compute.is_in(column.flatten(),
+                                 value_set=pyarrow.array(semtypes, type=pyarrow.string()))
+            # Count the matching semantic types of every row.
+            counts = pyarrow.concat_arrays([pyarrow.array([0], type=pyarrow.int64()),
+                                            compute.cumulative_sum(hits.cast(pyarrow.int64()))])
+            offsets = compute.subtract(column.offsets, column.offsets[0])
+            matches = compute.subtract(compute.take(counts, offsets[1:]),
+                                       compute.take(counts, offsets[:-1]))
+            conditions.append(compute.greater(matches, 0))
+        for condition in conditions:
+            condition = compute.fill_null(condition, False)
+            mask = condition if mask is None else compute.and_(mask, condition)
+        if mask is None:
+            return self
+        return self.__class__(table.filter(mask), self.corpus_class)
+
+    def to_corpus(self):
+        """ Decodes every concept into a regular corpus_class list. """
+        return self.corpus_class(self)
@@ -0,0 +1,197 @@
+# Licensed under the Apache License, Version 2.0 (the "License");
+# you may not use this file except in compliance with the License.
+# You may obtain a copy of the License at
+#
+# http://www.apache.org/licenses/LICENSE-2.0
+#
+# Unless required by applicable law or agreed to in writing, software
+# distributed under the License is distributed on an "AS IS" BASIS,
+# WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.
+# See the License for the specific language governing permissions and
+# limitations under the License.
+
+import asyncio
+import os
+import multiprocessing
+import time
+import weakref
+from .SubprocessBackend import SubprocessBackend
+from .Concept import Corpus, skip_header
+from .Cache import lookup_cached, store_cached
+from .ProcessIO import WRITE_CHUNK_SIZE
+from .Instrumentation import CallStats, NULL_STATS
+
+# MMI rows can be much longer than asyncio's default 64 KiB line limit.
+LINE_LIMIT = 16 * 1024 * 1024
+
+
+async def write_input_async(stream, input_lines, chunk_size=WRITE_CHUNK_SIZE, stats=None):
+    """ Asynchronous counterpart of ProcessIO.write_input. """
+    written = 0
+    try:
+        chunk = list()
+        size = 0
+        for line in input_lines:
+            chunk.append(line)
+            size += len(line)
+            if size >= chunk_size:
+                data = b''.join(chunk)
+                stream.write(data)
+                written += len(data)
+                await stream.drain()
+                chunk = list()
+                size = 0
+        if chunk:
+            data = b''.join(chunk)
+            stream.write(data)
+            written += len(data)
+            await stream.drain()
+    except (BrokenPipeError, ConnectionResetError):
+        pass
+    finally:
+        stream.close()
+        if stats is not None:
+            stats.add('bytes_in', written)
+
+
+async def run_process_async(command, lines, input_lines=None,
+                            input_filename=None, cwd=None, stats=None, env=None):
+    """ Runs command with input_lines (or the contents of input_filename)
+        on stdin, appending its decoded stdout lines to lines as they
+        arrive, and returns its exit status. The process is killed if
+        the coroutine is cancelled, e.g. by a timeout. env is the
+        environment of the process (default: this one's).
+    """
+    if stats is None:
+        stats = NULL_STATS
+    started = time.perf_counter()
+    if input_filename is not None:
+        stats.add('bytes_in', os.path.getsize(input_filename))
+        with open(input_filename, 'rb') as input_file:
+            process = await asyncio.create_subprocess_exec(*command, stdin=input_file,
+                                                           stdout=asyncio.subprocess.PIPE,
+                                                           cwd=cwd, env=env, limit=LINE_LIMIT)
+    else:
+        process = await asyncio.create_subprocess_exec(*command, stdin=asyncio.subprocess.PIPE,
+                                                       stdout=asyncio.subprocess.PIPE,
+                                                       cwd=cwd, env=env, limit=LINE_LIMIT)
+    stats.add_time('spawn', time.perf_counter() - started)
+    started = time.perf_counter()
+    writer = None
+    try:
+        if input_filename is None:
+            writer = asyncio.ensure_future(write_input_async(process.stdin, input_lines or (),
+                                                             stats=stats))
+        async for line in process.stdout:
+            stats.add('bytes_out', len(line))
+            lines.append(line.decode('utf8', 'replace').rstrip('\r\n'))
+        returncode = await process.wait()
+        if writer is not None:
+            await writer
+        return returncode
+    finally:
+        stats.add_time('metamap', time.perf_counter() - started)
+        if writer is not None and not writer.done():
+            writer.cancel()
+        if process.returncode is None:
+            process.kill()
+            await process.wait()
+
+
+class AsyncSubprocessBackend(object):
+    def __init__(self, metamap_filename, version=None, max_concurrency=None,
+                 timeout=None, instrumentation=None, cache=None,
+                 deduplicate=False, servers=None, server_index=0):
+        """ asyncio interface to MetaMap. extract_concepts is a coroutine
+            that runs metamap through asyncio.create_subprocess_exec, so
+            many documents can be in flight without a thread each. At
+            most max_concurrency metamap processes (default: the number
+            of CPUs) run at once; further calls wait for a free slot.
+            timeout is the default per-request limit in seconds.
+
+            cache, deduplicate and servers work as for SubprocessBackend,
+            which builds the commands and is available as metamap. Cache
+            lookups run on the event loop.
+        """
+        self.metamap = SubprocessBackend(metamap_filename, version, cache=cache,
+                                         instrumentation=instrumentation,
+                                         deduplicate=deduplicate, servers=servers,
+                                         server_index=server_index)
+        if max_concurrency is None:
+            max_concurrency = multiprocessing.cpu_count()
+        if max_concurrency < 1:
+            raise ValueError("max_concurrency must be positive.")
+        self.max_concurrency = max_concurrency
+        self.timeout = timeout
+        self._limiters = weakref.WeakKeyDictionary()
+
+    def _get_limiter(self):
+        # asyncio primitives are bound to the event loop they are first
+        # used in, so each loop (e.g. each asyncio.run()) gets its own.
+        loop = asyncio.get_running_loop()
+        limiter = self._limiters.get(loop)
+        if limiter is None:
+            limiter = self._limiters[loop] = asyncio.Semaphore(self.max_concurrency)
+        return limiter
+
+    async def extract_concepts(self, sentences=None, ids=None, filename=None,
+                               timeout=None, **options):
+        """ Coroutine version of SubprocessBackend.extract_concepts; it
+            takes the same options and returns (concepts, error). A
+            request taking longer than timeout seconds (default: the
+            backend's timeout) is killed and whatever was processed is
+            returned along with the error. Cancelling the coroutine
+            kills its metamap process.
+        """
+        metamap = self.metamap
+        command = metamap._build_command(sentences=sentences, ids=ids,
+                                         filename=filename, **options)
+        if timeout is None:
+            timeout = self.timeout
+
+        stats = None
+        if metamap.instrumentation is not None:
+            stats = CallStats(self.__class__.__name__)
+        started = time.perf_counter()
+        if sentences is not None and stats is not None:
+            sentences = stats.count('sentences', sentences)
+        if sentences is not None and (metamap.cache is not None or metamap.deduplicate):
+            command, fingerprint = metamap._cached_command(command)
+            lookup, misses = lookup_cached(metamap.cache, fingerprint, sentences, ids, stats)
+            concepts, error = (Corpus(), None)
+            if misses:
+                concepts, error = await self._run(command, misses, list(range(len(misses))),
+                                                  None, timeout, stats)
+            concepts, error = store_cached(metamap.cache, lookup, concepts, error, Corpus, stats)
+        else:
+            concepts, error = await self._run(command, sentences, ids, filename, timeout, stats)
+        metamap._record(stats, started, concepts, error)
+        return (concepts, error)
+
+    async def _run(self, command, sentences, ids, filename, timeout, stats):
+        """ Runs one metamap process, once a slot is free, over the
+            sentences or filename and returns (concepts, error).
+        """
+        lines = list()
+        error = None
+        async with self._get_limiter():
+            command, env = self.metamap._server_options(command)
+            if sentences is not None:
+                run = run_process_async(command, lines,
+                                        input_lines=self.metamap._format_input(sentences, ids),
+                                        stats=stats, env=env)
+            else:
+                run = run_process_async(command, lines, input_filename=filename,
+                                        stats=stats, env=env)
+            try:
+                returncode = await asyncio.wait_for(run, timeout)
+                if returncode != 0:
+                    error = "ERROR: MetaMap failed"
+            except asyncio.TimeoutError:
+                error = "ERROR: MetaMap did not finish within {0} seconds".format(timeout)
+
+        parse_started = time.perf_counter()
+        concepts = Corpus.load(skip_header(lines))
+        if stats is not None:
+            stats.add_time('parse', time.perf_counter() - parse_started)
+        return (concepts, error)
@@ -0,0 +1,123 @@
+# Licensed under the Apache License, Version 2.0 (the "License");
+# you may not use this file except in compliance with the License.
+# You may obtain a copy of the License at
+#
+# http://www.apache.org/licenses/LICENSE-2.0
+#
+# Unless required by applicable law or agreed to in writing, software
+# distributed under the License is distributed on an "AS IS" BASIS,
+# WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.
+# See the License for the specific language governing permissions and
+# limitations under the License.
+
+import asyncio
+import multiprocessing
+import time
+import weakref
+from .SubprocessBackendLite import SubprocessBackendLite
+from .AsyncSubprocessBackend import run_process_async
+from .ConceptLite import CorpusLite
+from .Cache import lookup_cached, store_cached
+from .Instrumentation import CallStats
+
+
+class AsyncSubprocessBackendLite(object):
+    def __init__(self, metamap_home, max_concurrency=None, timeout=None,
+                 instrumentation=None, cache=None, deduplicate=False):
+        """ asyncio interface to MetaMapLite. extract_concepts is a
+            coroutine that runs metamaplite.sh in --pipe mode through
+            asyncio.create_subprocess_exec. At most max_concurrency
+            processes (default: the number of CPUs) run at once.
+            timeout is the default per-request limit in seconds.
+
+            cache and deduplicate work as for SubprocessBackendLite,
+            which builds the commands and is available as metamap.
+        """
+        self.metamap = SubprocessBackendLite(metamap_home=metamap_home, cache=cache,
+                                             instrumentation=instrumentation,
+                                             deduplicate=deduplicate)
+        if max_concurrency is None:
+            max_concurrency = multiprocessing.cpu_count()
+        if max_concurrency < 1:
+            raise ValueError("max_concurrency must be positive.")
+        self.max_concurrency = max_concurrency
+        self.timeout = timeout
+        self._limiters = weakref.WeakKeyDictionary()
+
+    def _get_limiter(self):
+        # asyncio primitives are bound to the event loop they are first
+        # used in, so each loop (e.g. each asyncio.run()) gets its own.
+        loop = asyncio.get_running_loop()
+        limiter = self._limiters.get(loop)
+        if limiter is None:
+            limiter = self._limiters[loop] = asyncio.Semaphore(self.max_concurrency)
+        return limiter
+
+    async def extract_concepts(self, sentences=None, ids=None, filename=None,
+                               restrict_to_sts=None, restrict_to_sources=None,
+                               timeout=None):
+        """ Coroutine version of SubprocessBackendLite.extract_concepts
+            returning (concepts, error). A request taking longer than
+            timeout seconds (default: the backend's timeout) is killed
+            and whatever was processed is returned along with the error.
+            Cancelling the coroutine kills its process.
+        """
+        if (sentences is not None and filename is not None) or \
+                (sentences is None and filename is None):
+            raise ValueError("You must either pass a list of sentences "
+                             "OR a filename.")
+        if timeout is None:
+            timeout = self.timeout
+
+        metamap = self.metamap
+        options = metamap._build_options(ids=ids, restrict_to_sts=restrict_to_sts,
+                                         restrict_to_sources=restrict_to_sources)
+        stats = None
+        if metamap.instrumentation is not None:
+            stats = CallStats(self.__class__.__name__)
+        started = time.perf_counter()
+        if sentences is not None and stats is not None:
+            sentences = stats.count('sentences', sentences)
+        if sentences is not None and (metamap.cache is not None or metamap.deduplicate):
+            options, fingerprint = metamap._cached_options(options, ids)
+            lookup, misses = lookup_cached(metamap.cache, fingerprint, sentences, ids, stats)
+            concepts, error = (CorpusLite(), None)
+            if misses:
+                concepts, error = await self._run(options, misses, list(range(len(misses))),
+                                                  None, timeout, stats)
+            concepts, error = store_cached(metamap.cache, lookup, concepts, error,
+                                           CorpusLite, stats)
+        else:
+            concepts, error = await self._run(options, sentences, ids, filename, timeout, stats)
+        metamap._record(stats, started, concepts, error)
+        return (concepts, error)
+
+    async def _run(self, options, sentences, ids, filename, timeout, stats):
+        """ Runs one metamaplite.sh process, once a slot is free, over
+            the sentences or filename and returns (concepts, error).
+        """
+        command = self.metamap._pipe_command(options)
+        lines = list()
+        error = None
+        async with self._get_limiter():
+            if sentences is not None:
+                run = run_process_async(command, lines,
+                                        input_lines=self.metamap._format_input(sentences, ids),
+                                        cwd=self.metamap.metamap_home, stats=stats)
+            else:
+                run = run_process_async(command, lines, input_filename=filename,
+                                        cwd=self.metamap.metamap_home, stats=stats)
+            try:
+                returncode = await asyncio.wait_for(run, timeout)
+                if returncode != 0:
+                    error = "ERROR: MetaMapLite failed"
+            except asyncio.TimeoutError:
+                error = "ERROR: MetaMapLite did not finish within {0} seconds".format(timeout)
+
+        # Only keep MMI rows; anything else on stdout is logging.
+        parse_started = time.perf_counter()
+        lines = [line for line in lines if line.split('|', 2)[1:2] == ['MMI']]
+        concepts = CorpusLite.load(lines)
+        if stats is not None:
+            stats.add_time('parse', time.perf_counter() - parse_started)
+        return (concepts, error)
@@ -0,0 +1,180 @@
+# Licensed under the Apache License, Version 2.0 (the "License");
+# you may not use this file except in compliance with the License.
+# You may obtain a copy of the License at
+#
+# http://www.apache.org/licenses/LICENSE-2.0
+#
+# Unless required by applicable law or agreed to in writing, software
+# distributed under the License is distributed on an "AS IS" BASIS,
+# WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.
+# See the License for the specific language governing permissions and
+# limitations under the License.
+
+import glob
+import itertools
+import json
+import os
+import time
+from .MetaMapLite import MetaMapLite
+from .Concept import Corpus
+from .ConceptLite import CorpusLite
+
+
+class BulkJob(object):
+    def __init__(self, metamap, input_filename, output_dir, chunk_size=10000,
+                 worker_index=0, worker_count=1, **options):
+        """ Resumable processing of a large sldi/sldiID input file. The
+            file is split into chunks of chunk_size lines; chunk n is
+            processed by the worker with worker_index n % worker_count,
+            so several processes (or machines sharing output_dir) can
+            split the work. Each finished chunk's MMI output is written
+            to output_dir and recorded in the worker's append-only
+            manifest; running the job again skips recorded chunks.
+
+            metamap is any MetaMap or MetaMapLite instance and options
+            are passed on to its extract_concepts.
+        """
+        if chunk_size < 1:
+            raise ValueError("chunk_size must be positive.")
+        if worker_count < 1 or not 0 <= worker_index < worker_count:
+            raise ValueError("worker_index must be in range(worker_count).")
+        self.metamap = metamap
+        self.input_filename = os.path.abspath(input_filename)
+        self.output_dir = output_dir
+        self.chunk_size = chunk_size
+        self.worker_index = worker_index
+        self.worker_count = worker_count
+        self.options = options
+        if isinstance(metamap, MetaMapLite):
+            self.corpus_class = CorpusLite
+        else:
+            self.corpus_class = Corpus
+        self.manifest_filename = os.path.join(
+            output_dir, 'manifest-{0}-of-{1}.jsonl'.format(worker_index, worker_count))
+
+    def _header(self):
+        # Chunk numbers only mean the same lines while these match.
+        return {'input': self.input_filename,
+                'size': os.path.getsize(self.input_filename),
+                'chunk_size': self.chunk_size}
+
+    def _read_manifests(self):
+        """ Returns {chunk: entry} for the chunks completed by any worker
+            and raises ValueError if a manifest belongs to another input
+            or chunk size.
+        """
+        header = self._header()
+        completed = dict()
+        pattern = os.path.join(self.output_dir, 'manifest-*-of-*.jsonl')
+        for filename in sorted(glob.glob(pattern)):
+            with open(filename) as manifest:
+                for number, line in enumerate(manifest):
+                    try:
+                        entry = json.loads(line)
+                    except ValueError:
+                        # A line cut short by a crash; it was never acknowledged.
+                        continue
+                    if number == 0:
+                        if entry != header:
+                            raise ValueError("{0} was written for a different input file or "
+                                             "chunk_size: {1}".format(filename, entry))
+                        continue
+                    if entry.get('error') is None:
+                        completed[entry['chunk']] = entry
+        return completed
+
+    def _append_manifest(self, entry):
+        new = not os.path.exists(self.manifest_filename)
+        cut_short = False
+        if not new:
+            with open(self.manifest_filename, 'rb') as manifest:
+                manifest.seek(0, os.SEEK_END)
+                if manifest.tell() > 0:
+                    manifest.seek(-1, os.SEEK_END)
+                    cut_short = manifest.read(1) != b'\n'
+        with open(self.manifest_filename, 'a') as manifest:
+            if new:
+                manifest.write(json.dumps(self._header(), sort_keys=True) + '\n')
+            elif cut_short:
+                # End the line a crash cut short, so it stays unreadable
+                # on its own instead of swallowing this entry.
+                manifest.write('\n')
+            manifest.write(json.dumps(entry, sort_keys=True) + '\n')
+            manifest.flush()
+            os.fsync(manifest.fileno())
+
+    def output_filename(self, chunk):
+        return os.path.join(self.output_dir, 'chunk-{0:06d}.mmi'.format(chunk))
+
+    def _iter_chunks(self):
+        """ Yields (chunk, first_line, lines) for every chunk of the input. """
+        with open(self.input_filename, 'rb') as input_file:
+            for chunk in itertools.count():
+                lines = list(itertools.islice(input_file, self.chunk_size))
+                if not lines:
+                    return
+                yield (chunk, chunk * self.chunk_size, lines)
+
+    def completed_chunks(self):
+        """ Returns the sorted numbers of the chunks completed so far. """
+        if not os.path.isdir(self.output_dir):
+            return []
+        return sorted(self._read_manifests())
+
+    def run(self, max_chunks=None):
+        """ Processes this worker's pending chunks, at most max_chunks of
+            them, and returns the manifest entries written. A failed
+            chunk is recorded with its error and retried on the next
+            run; its partial output is not kept.
+        """
+        if not os.path.isdir(self.output_dir):
+            os.makedirs(self.output_dir)
+        completed = self._read_manifests()
+        entries = list()
+        for chunk, first_line, lines in self._iter_chunks():
+            if chunk % self.worker_count != self.worker_index or chunk in completed:
+                continue
+            if max_chunks is not None and len(entries) >= max_chunks:
+                break
+            entries.append(self._run_chunk(chunk, first_line, lines))
+        return entries
+
+    def _run_chunk(self, chunk, first_line, lines):
+        output_filename = self.output_filename(chunk)
+        input_filename = output_filename[:-len('.mmi')] + '.in'
+        started = time.time()
+        try:
+            with open(input_filename, 'wb') as input_file:
+                for line in lines:
+                    input_file.write(line if line.endswith(b'\n') else line + b'\n')
+            concepts, error = self.metamap.extract_concepts(filename=input_filename,
+                                                            **self.options)
+        finally:
+            if os.path.exists(input_filename):
+                os.remove(input_filename)
+
+        entry = {'chunk': chunk, 'first_line': first_line, 'lines': len(lines),
+                 'seconds': round(time.time() - started, 3), 'error': error}
+        if error is None:
+            # Written under a temporary name and renamed, so an output
+            # file is either complete or absent.
+            partial_filename = output_filename + '.partial'
+            with open(partial_filename, 'w') as output_file:
+                for concept in concepts:
+                    output_file.write(concept.as_mmi() + '\n')
+                output_file.flush()
+                os.fsync(output_file.fileno())
+            os.replace(partial_filename, output_filename)
+            entry['output'] = os.path.basename(output_filename)
+            entry['concepts'] = len(concepts)
+        self._append_manifest(entry)
+        return entry
+
+    def iter_concepts(self):
+        """ Yields the concepts of all completed chunks in input order,
+            reading one chunk file at a time.
+        """
+        for chunk, entry in sorted(self._read_manifests().items()):
+            with open(os.path.join(self.output_dir, entry['output'])) as output_file:
+                for concept in self.corpus_class.iter_load(output_file):
+                    yield concept
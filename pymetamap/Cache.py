@@ -0,0 +1,277 @@
+# Licensed under the Apache License, Version 2.0 (the "License");
+# you may not use this file except in compliance with the License.
+# You may obtain a copy of the License at
+#
+# http://www.apache.org/licenses/LICENSE-2.0
+#
+# Unless required by applicable law or agreed to in writing, software
+# distributed under the License is distributed on an "AS IS" BASIS,
+# WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.
+# See the License for the specific language governing permissions and
+# limitations under the License.
+
+import collections
+import hashlib
+import json
+import sqlite3
+import threading
+import time
+
+
+def normalize_text(text):
+    """ Normalizes a sentence for use in a cache key. Only trailing
+        whitespace is dropped, since anything else would shift the
+        pos_info offsets of the cached concepts.
+    """
+    return text.rstrip()
+
+
+def cache_key(text, fingerprint):
+    """ Returns the cache key for a sentence annotated with the option
+        set described by fingerprint.
+    """
+    digest = hashlib.sha256()
+    digest.update(fingerprint.encode('utf8'))
+    digest.update(b'\0')
+    digest.update(normalize_text(text).encode('utf8'))
+    return digest.hexdigest()
+
+
+class MemoryCache(object):
+    def __init__(self, max_entries=100000, max_bytes=None):
+        """ In-memory LRU cache of per-sentence concept rows. The least
+            recently used sentences are evicted once more than
+            max_entries sentences or, if given, an estimated max_bytes
+            of row text are held.
+        """
+        self.max_entries = max_entries
+        self.max_bytes = max_bytes
+        self.hits = 0
+        self.misses = 0
+        self.evictions = 0
+        self.size = 0
+        self._entries = collections.OrderedDict()
+        self._lock = threading.Lock()
+
+    def __len__(self):
+        return len(self._entries)
+
+    @staticmethod
+    def _sizeof(rows):
+        return 64 + sum(sum(len(field) for field in row) for row in rows)
+
+    def get(self, key):
+        with self._lock:
+            rows = self._entries.get(key)
+            if rows is None:
+                self.misses += 1
+                return None
+            self._entries.move_to_end(key)
+            self.hits += 1
+            return rows
+
+    def put(self, key, rows):
+        rows = tuple(tuple(row) for row in rows)
+        with self._lock:
+            previous = self._entries.pop(key, None)
+            if previous is not None:
+                self.size -= self._sizeof(previous)
+            self._entries[key] = rows
+            self.size += self._sizeof(rows)
+            while self._entries and (len(self._entries) > self.max_entries or
+                                     (self.max_bytes is not None and self.size > self.max_bytes)):
+                _, evicted = self._entries.popitem(last=False)
+                self.size -= self._sizeof(evicted)
+                self.evictions += 1
+
+    def update(self, items):
+        for key, rows in items:
+            self.put(key, rows)
+
+    def stats(self):
+        return {'hits': self.hits, 'misses': self.misses,
+                'entries': len(self._entries), 'bytes': self.size,
+                'evictions': self.evictions}
+
+
+class SQLiteCache(object):
+    def __init__(self, path):
+        """ Persistent cache of per-sentence concept rows stored in the
+            SQLite database at path, which can be shared across runs
+            and processes.
+        """
+        self.path = path
+        self.hits = 0
+        self.misses = 0
+        self._lock = threading.Lock()
+        self._connection = sqlite3.connect(path, check_same_thread=False)
+        with self._lock:
+            self._connection.execute('PRAGMA journal_mode=WAL')
+            self._connection.execute('PRAGMA synchronous=NORMAL')
+            self._connection.execute('CREATE TABLE IF NOT EXISTS concepts '
+                                     '(key TEXT PRIMARY KEY, rows TEXT NOT NULL)')
+            self._connection.commit()
+
+    def __len__(self):
+        with self._lock:
+            return self._connection.execute('SELECT COUNT(*) FROM concepts').fetchone()[0]
+
+    def get(self, key):
+        with self._lock:
+            row = self._connection.execute('SELECT rows FROM concepts WHERE key = ?',
+                                           (key,)).fetchone()
+            if row is None:
+                self.misses += 1
+                return None
+            self.hits += 1
+        return tuple(tuple(fields) for fields in json.loads(row[0]))
+
+    def put(self, key, rows):
+        self.update([(key, rows)])
+
+    def update(self, items):
+        items = [(key, json.dumps([list(row) for row in rows])) for key, rows in items]
+        with self._lock:
+            self._connection.executemany('INSERT OR REPLACE INTO concepts (key, rows) '
+                                         'VALUES (?, ?)', items)
+            self._connection.commit()
+
+    def close(self):
+        with self._lock:
+            self._connection.close()
+
+    def stats(self):
+        return {'hits': self.hits, 'misses': self.misses, 'entries': len(self)}
+
+
+class TieredCache(object):
+    def __init__(self, memory=None, persistent=None):
+        """ Looks sentences up in the memory tier first and then in the
+            persistent tier, promoting persistent hits into memory.
+            Either tier may be omitted.
+        """
+        self.memory = memory
+        self.persistent = persistent
+        self.hits = 0
+        self.misses = 0
+
+    def get(self, key):
+        rows = None
+        if self.memory is not None:
+            rows = self.memory.get(key)
+        if rows is None and self.persistent is not None:
+            rows = self.persistent.get(key)
+            if rows is not None and self.memory is not None:
+                self.memory.put(key, rows)
+        if rows is None:
+            self.misses += 1
+        else:
+            self.hits += 1
+        return rows
+
+    def put(self, key, rows):
+        self.update([(key, rows)])
+
+    def update(self, items):
+        items = list(items)
+        if self.memory is not None:
+            self.memory.update(items)
+        if self.persistent is not None:
+            self.persistent.update(items)
+
+    def stats(self):
+        stats = {'hits': self.hits, 'misses': self.misses}
+        if self.memory is not None:
+            stats['memory'] = self.memory.stats()
+        if self.persistent is not None:
+            stats['persistent'] = self.persistent.stats()
+        return stats
+
+
+# The state extract_cached keeps between looking sentences up and
+# storing what MetaMap found for the misses.
+CachedLookup = collections.namedtuple('CachedLookup', ['ids', 'keys', 'rows', 'positions'])
+
+
+def extract_cached(cache, fingerprint, sentences, ids, run, corpus_class, stats=None):
+    """ Serves the sentences found in cache and passes only the misses,
+        each distinct sentence once, to run(sentences, ids), which must
+        return (concepts, error). The rows of every sentence are
+        re-stitched to the caller's id (or position, without ids) and
+        returned as (corpus_class, error) in input order. Results of a
+        failed run are returned but not cached. Lookups are recorded in
+        stats, if given.
+
+        With cache None, nothing is looked up or stored and only the
+        duplicate sentences of this call are collapsed.
+    """
+    lookup, misses = lookup_cached(cache, fingerprint, sentences, ids, stats)
+    concepts, error = (corpus_class(), None)
+    if misses:
+        concepts, error = run(misses, list(range(len(misses))))
+    return store_cached(cache, lookup, concepts, error, corpus_class, stats)
+
+
+def lookup_cached(cache, fingerprint, sentences, ids, stats=None):
+    """ First half of extract_cached, for callers that cannot pass a
+        blocking run: returns (lookup, misses) where misses are the
+        distinct sentences to run MetaMap on, with ids
+        range(len(misses)). Pass its result and lookup to store_cached.
+    """
+    started = time.perf_counter()
+    sentences = list(sentences)
+    if ids is None:
+        ids = list(range(len(sentences)))
+    else:
+        ids = list(ids)
+
+    if cache is None:
+        keys = [normalize_text(sentence) for sentence in sentences]
+        rows = [None] * len(keys)
+    else:
+        keys = [cache_key(sentence, fingerprint) for sentence in sentences]
+        rows = [cache.get(key) for key in keys]
+
+    misses = collections.OrderedDict()
+    for position, key in enumerate(keys):
+        if rows[position] is None and key not in misses:
+            misses[key] = position
+    if stats is not None:
+        stats.add('duplicate_sentences', len(keys) - len(set(keys)))
+        if cache is not None:
+            stats.add('cache_hits', len(rows) - sum(1 for row in rows if row is None))
+            stats.add('cache_misses', sum(1 for row in rows if row is None))
+            stats.add_time('cache', time.perf_counter() - started)
+    positions = list(misses.values())
+    return (CachedLookup(ids, keys, rows, positions),
+            [sentences[position] for position in positions])
+
+
+def store_cached(cache, lookup, concepts, error, corpus_class, stats=None):
+    """ Second half of extract_cached: stores the (concepts, error) of
+        the misses of lookup unless error is set and returns the
+        concepts of every sentence as (corpus_class, error).
+    """
+    rows = list(lookup.rows)
+    if lookup.positions:
+        found = collections.defaultdict(list)
+        for concept in concepts:
+            found[int(str(concept.index).strip('\'"'))].append(tuple(concept[1:]))
+        computed = dict((lookup.keys[position], tuple(found.get(number, ())))
+                        for number, position in enumerate(lookup.positions))
+        if error is None and cache is not None:
+            started = time.perf_counter()
+            cache.update(computed.items())
+            if stats is not None:
+                stats.add_time('cache', time.perf_counter() - started)
+        for position, key in enumerate(lookup.keys):
+            if rows[position] is None:
+                rows[position] = computed[key]
+
+    corpus = corpus_class()
+    for identifier, sentence_rows in zip(lookup.ids, rows):
+        # The index MetaMap echoes for an id written by _format_input.
+        index = '{0!r}'.format(identifier)
+        for row in sentence_rows:
+            corpus.append(corpus_class.make_concept((index,) + tuple(row)))
+    return (corpus, error)
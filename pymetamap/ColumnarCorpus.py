@@ -0,0 +1,275 @@
+# Licensed under the Apache License, Version 2.0 (the "License");
+# you may not use this file except in compliance with the License.
+# You may obtain a copy of the License at
+#
+# http://www.apache.org/licenses/LICENSE-2.0
+#
+# Unless required by applicable law or agreed to in writing, software
+# distributed under the License is distributed on an "AS IS" BASIS,
+# WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.
+# See the License for the specific language governing permissions and
+# limitations under the License.
+
+from array import array
+from .Concept import Corpus, ConceptMMI, parse_semtypes, parse_spans
+from .ConceptLite import ConceptLiteMMI
+
+try:
+    import numpy
+except ImportError:
+    numpy = None
+
+KIND_MMI = 0
+KIND_LITE = 1
+KIND_OTHER = 2
+
+# Fields with few distinct values, stored as codes into the shared
+# string table.
+INTERNED_COLUMNS = ('index', 'mm', 'preferred_name', 'cui', 'semtypes', 'location',
+                    'tree_codes')
+
+# Fields that are nearly unique per row, stored as plain lists.
+TEXT_COLUMNS = ('trigger', 'pos_info')
+
+
+def score_decimals(text, score):
+    """ Returns the number of decimals which formats score back into
+        text, e.g. 2 for '3.50', or -1 if no number of decimals does.
+    """
+    integer, point, fraction = text.partition('.')
+    decimals = len(fraction) if point else 0
+    if decimals < 100 and '{0:.{1}f}'.format(score, decimals) == text:
+        return decimals
+    return -1
+
+
+class StringTable(object):
+    """ Interns strings into integer codes. """
+    def __init__(self):
+        self.codes = dict()
+        self.strings = list()
+
+    def __len__(self):
+        return len(self.strings)
+
+    def code(self, string):
+        code = self.codes.get(string)
+        if code is None:
+            code = len(self.strings)
+            self.codes[string] = code
+            self.strings.append(string)
+        return code
+
+
+class ColumnarCorpus(object):
+    def __init__(self, strings=None):
+        """ Compact, column-oriented alternative to Corpus. Scores are
+            stored as floats (with their number of decimals, so the
+            text round-trips), the first pos_info span as integer
+            start/length columns, fields with few distinct values (CUIs,
+            names, semantic types, ids) as integer codes into a shared
+            string table, and trigger and pos_info, which are nearly
+            unique per row, as plain lists. Iterating yields the same
+            Concept objects as Corpus.
+
+            AA and UA rows are kept as they are, outside the columns.
+        """
+        if strings is None:
+            strings = StringTable()
+        self.strings = strings
+        self.kind = array('b')
+        self.score = array('d')
+        self.score_decimals = array('b')
+        # Score text that is not a number formatted with some decimals.
+        self.score_text = dict()
+        self.pos_start = array('i')
+        self.pos_length = array('i')
+        self.semtype_offsets = array('i', [0])
+        self.semtype_codes = array('i')
+        self.columns = dict((name, array('i')) for name in INTERNED_COLUMNS)
+        self.columns.update((name, list()) for name in TEXT_COLUMNS)
+        self.others = dict()
+
+    @classmethod
+    def load(this_class, stream):
+        """ Builds a ColumnarCorpus from MetaMap MMI/AA/UA lines. """
+        corpus = this_class()
+        corpus.extend(Corpus.iter_load(stream))
+        return corpus
+
+    @classmethod
+    def from_corpus(this_class, corpus):
+        """ Builds a ColumnarCorpus from a Corpus or CorpusLite. """
+        columnar = this_class()
+        columnar.extend(corpus)
+        return columnar
+
+    def __len__(self):
+        return len(self.kind)
+
+    def append(self, concept):
+        row = len(self.kind)
+        if isinstance(concept, ConceptMMI):
+            kind = KIND_MMI
+        elif isinstance(concept, ConceptLiteMMI):
+            kind = KIND_LITE
+        else:
+            kind = KIND_OTHER
+            self.others[row] = concept
+        self.kind.append(kind)
+
+        if kind == KIND_OTHER:
+            self.score.append(float('nan'))
+            self.score_decimals.append(-1)
+            self.pos_start.append(-1)
+            self.pos_length.append(-1)
+            self.semtype_offsets.append(len(self.semtype_codes))
+            for name in INTERNED_COLUMNS:
+                self.columns[name].append(-1)
+            for name in TEXT_COLUMNS:
+                self.columns[name].append(None)
+            return
+
+        code = self.strings.code
+        try:
+            score = float(concept.score)
+        except ValueError:
+            score = float('nan')
+        decimals = score_decimals(concept.score, score)
+        self.score.append(score)
+        self.score_decimals.append(decimals)
+        if decimals < 0:
+            self.score_text[row] = concept.score
+        spans = parse_spans(concept.pos_info)
+        start, length = spans[0] if spans else (-1, -1)
+        self.pos_start.append(start)
+        self.pos_length.append(length)
+        for semtype in parse_semtypes(concept.semtypes):
+            self.semtype_codes.append(code(semtype))
+        self.semtype_offsets.append(len(self.semtype_codes))
+        for name in INTERNED_COLUMNS:
+            self.columns[name].append(code(getattr(concept, name, '')))
+        for name in TEXT_COLUMNS:
+            self.columns[name].append(getattr(concept, name))
+
+    def extend(self, concepts):
+        for concept in concepts:
+            self.append(concept)
+
+    def __getitem__(self, row):
+        """ Returns the concept of a row, or a ColumnarCorpus for a slice. """
+        if isinstance(row, slice):
+            return self.take(range(*row.indices(len(self))))
+        if row < 0:
+            row += len(self)
+        if not 0 <= row < len(self):
+            raise IndexError('ColumnarCorpus index out of range')
+        kind = self.kind[row]
+        if kind == KIND_OTHER:
+            return self.others[row]
+
+        strings = self.strings.strings
+        fields = dict((name, strings[self.columns[name][row]]) for name in INTERNED_COLUMNS)
+        for name in TEXT_COLUMNS:
+            fields[name] = self.columns[name][row]
+        decimals = self.score_decimals[row]
+        if decimals < 0:
+            fields['score'] = self.score_text[row]
+        else:
+            fields['score'] = '{0:.{1}f}'.format(self.score[row], decimals)
+        if kind == KIND_LITE:
+            del fields['location']
+            return ConceptLiteMMI(**fields)
+        return ConceptMMI(**fields)
+
+    def __iter__(self):
+        for row in range(len(self)):
+            yield self[row]
+
+    def semtypes(self, row):
+        """ Returns the list of semantic types of a row. """
+        strings = self.strings.strings
+        start, end = self.semtype_offsets[row], self.semtype_offsets[row + 1]
+        return [strings[code] for code in self.semtype_codes[start:end]]
+
+    def take(self, rows):
+        """ Returns a new ColumnarCorpus with the given rows, sharing
+            this corpus's string table.
+        """
+        subset = self.__class__(self.strings)
+        for row in rows:
+            row = int(row)
+            position = len(subset.kind)
+            subset.kind.append(self.kind[row])
+            subset.score.append(self.score[row])
+            subset.score_decimals.append(self.score_decimals[row])
+            if row in self.score_text:
+                subset.score_text[position] = self.score_text[row]
+            subset.pos_start.append(self.pos_start[row])
+            subset.pos_length.append(self.pos_length[row])
+            start, end = self.semtype_offsets[row], self.semtype_offsets[row + 1]
+            subset.semtype_codes.extend(self.semtype_codes[start:end])
+            subset.semtype_offsets.append(len(subset.semtype_codes))
+            for name in INTERNED_COLUMNS + TEXT_COLUMNS:
+                subset.columns[name].append(self.columns[name][row])
+            if self.kind[row] == KIND_OTHER:
+                subset.others[position] = self.others[row]
+        return subset
+
+    def _codes(self, strings):
+        if isinstance(strings, str):
+            strings = [strings]
+        return set(self.strings.codes[string] for string in strings
+                   if string in self.strings.codes)
+
+    def select(self, min_score=None, max_score=None, cuis=None, semtypes=None):
+        """ Returns the row numbers matching every given condition, as an
+            array('i'): score within [min_score, max_score], CUI in cuis
+            and at least one semantic type in semtypes. Uses NumPy when
+            available.
+        """
+        if numpy is not None:
+            return self._select_numpy(min_score, max_score, cuis, semtypes)
+
+        rows = range(len(self))
+        if min_score is not None:
+            rows = [row for row in rows if self.score[row] >= min_score]
+        if max_score is not None:
+            rows = [row for row in rows if self.score[row] <= max_score]
+        if cuis is not None:
+            codes = self._codes(cuis)
+            cui_column = self.columns['cui']
+            rows = [row for row in rows if cui_column[row] in codes]
+        if semtypes is not None:
+            codes = self._codes(semtypes)
+            offsets = self.semtype_offsets
+            rows = [row for row in rows
+                    if not codes.isdisjoint(self.semtype_codes[offsets[row]:offsets[row + 1]])]
+        return array('i', rows)
+
+    def _select_numpy(self, min_score, max_score, cuis, semtypes):
+        rows = array('i')
+        if len(self) == 0:
+            return rows
+        mask = numpy.ones(len(self), dtype=bool)
+        score = numpy.frombuffer(self.score, dtype=numpy.float64)
+        if min_score is not None:
+            mask &= score >= min_score
+        if max_score is not None:
+            mask &= score <= max_score
+        if cuis is not None:
+            codes = numpy.array(sorted(self._codes(cuis)), dtype=numpy.intc)
+            mask &= numpy.isin(numpy.frombuffer(self.columns['cui'], dtype=numpy.intc), codes)
+        if semtypes is not None:
+            codes = numpy.array(sorted(self._codes(semtypes)), dtype=numpy.intc)
+            offsets = numpy.frombuffer(self.semtype_offsets, dtype=numpy.intc)
+            hits = numpy.isin(numpy.frombuffer(self.semtype_codes, dtype=numpy.intc), codes)
+            # Count the matching semantic types of every row.
+            counts = numpy.concatenate(([0], numpy.cumsum(hits)))
+            mask &= (counts[offsets[1:]] - counts[offsets[:-1]]) > 0
+        rows.frombytes(numpy.flatnonzero(mask).astype(numpy.intc).tobytes())
+        return rows
+
+    def filter(self, min_score=None, max_score=None, cuis=None, semtypes=None):
+        """ Returns a new ColumnarCorpus with the rows matching select(). """
+        return self.take(self.select(min_score, max_score, cuis, semtypes))
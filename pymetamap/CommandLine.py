@@ -0,0 +1,270 @@
+# Licensed under the Apache License, Version 2.0 (the "License");
+# you may not use this file except in compliance with the License.
+# You may obtain a copy of the License at
+#
+# http://www.apache.org/licenses/LICENSE-2.0
+#
+# Unless required by applicable law or agreed to in writing, software
+# distributed under the License is distributed on an "AS IS" BASIS,
+# WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.
+# See the License for the specific language governing permissions and
+# limitations under the License.
+
+""" Bulk annotation from the command line.
+
+        pymetamap --metamap /opt/public_mm/bin/metamap16 notes.txt > notes.mmi
+        pymetamap --lite /opt/public_mm_lite --input-format jsonl \\
+            --output-format jsonl --workers 8 notes.jsonl -o concepts.jsonl
+
+    Documents are read from the given files (or stdin) as sldi lines,
+    sldiID lines (id|text) or JSON lines, sent to MetaMap in batches on
+    --workers concurrent backends and written out in input order as
+    soon as each batch is done. Progress is reported on stderr.
+"""
+
+import argparse
+import collections
+import itertools
+import json
+import os
+import sys
+import threading
+import time
+from concurrent.futures import ThreadPoolExecutor
+from .MetaMap import MetaMap
+from .MetaMapLite import MetaMapLite
+from .Cache import MemoryCache, SQLiteCache, TieredCache
+
+
+def build_parser():
+    parser = argparse.ArgumentParser(
+        prog='pymetamap',
+        description='Annotate documents with MetaMap or MetaMapLite.')
+    program = parser.add_mutually_exclusive_group(required=True)
+    program.add_argument('--metamap', metavar='PATH',
+                         help='absolute path of the metamap binary')
+    program.add_argument('--lite', metavar='DIR',
+                         help='absolute path of the public_mm_lite directory')
+    parser.add_argument('inputs', nargs='*', default=['-'], metavar='FILE',
+                        help="input files; '-' or none reads stdin")
+    parser.add_argument('-o', '--output', default='-',
+                        help="output file; '-' (the default) writes stdout")
+    parser.add_argument('--input-format', choices=['sldi', 'sldiID', 'jsonl'], default='sldi',
+                        help='sldi: one document per line, numbered by line; '
+                             'sldiID: id|text lines; jsonl: JSON objects')
+    parser.add_argument('--id-field', default='id', help='id key of JSON input (default: id)')
+    parser.add_argument('--text-field', default='text', help='text key of JSON input (default: text)')
+    parser.add_argument('--output-format', choices=['mmi', 'jsonl'], default='mmi')
+    parser.add_argument('--backend', choices=['subprocess', 'persistent'], default='subprocess',
+                        help='persistent keeps one MetaMap process per worker alive')
+    parser.add_argument('--workers', type=int, default=1,
+                        help='number of batches processed concurrently (default: 1)')
+    parser.add_argument('--batch-size', type=int, default=100,
+                        help='documents per MetaMap call (default: 100)')
+    parser.add_argument('--cache', metavar='PATH',
+                        help='SQLite database caching results across runs')
+    parser.add_argument('--memory-cache', type=int, default=0, metavar='N',
+                        help='also keep the N most recently used documents in memory')
+    parser.add_argument('--deduplicate', action='store_true',
+                        help='send identical documents of a batch to MetaMap once')
+    parser.add_argument('--restrict-to-sts', metavar='LIST',
+                        help='comma separated semantic types to keep')
+    parser.add_argument('--restrict-to-sources', metavar='LIST',
+                        help='comma separated sources to keep')
+    parser.add_argument('--word-sense-disambiguation', action='store_true',
+                        help='MetaMap only: enable word sense disambiguation (-y)')
+    parser.add_argument('--composite-phrase', type=int, default=4, metavar='N',
+                        help='MetaMap only: composite phrase length (default: 4)')
+    parser.add_argument('--progress-interval', type=float, default=10.0, metavar='SECONDS',
+                        help='seconds between progress reports; 0 disables them')
+    return parser
+
+
+def read_documents(inputs, input_format, id_field='id', text_field='text'):
+    """ Yields (id, text) for every document of the input files. sldi
+        documents are numbered by their position across all inputs.
+    """
+    number = itertools.count()
+    for name in inputs:
+        if name == '-':
+            stream = sys.stdin
+        else:
+            stream = open(name)
+        try:
+            for line in stream:
+                line = line.rstrip('\r\n')
+                if not line.strip():
+                    continue
+                if input_format == 'jsonl':
+                    document = json.loads(line)
+                    yield (document[id_field], document[text_field])
+                elif input_format == 'sldiID':
+                    identifier, _, text = line.partition('|')
+                    yield (identifier, text)
+                else:
+                    yield (next(number), line)
+        finally:
+            if stream is not sys.stdin:
+                stream.close()
+
+
+def iter_batches(documents, batch_size):
+    documents = iter(documents)
+    while True:
+        batch = list(itertools.islice(documents, batch_size))
+        if not batch:
+            return
+        yield batch
+
+
+def format_concept(concept, output_format):
+    if output_format == 'jsonl':
+        fields = concept._asdict()
+        fields['index'] = fields['index'].strip('\'"')
+        return json.dumps(fields, sort_keys=True)
+    return concept.as_mmi()
+
+
+class Progress(object):
+    def __init__(self, interval, stream=None):
+        """ Prints document and concept throughput to stream (default:
+            stderr) at most every interval seconds.
+        """
+        self.interval = interval
+        self.stream = sys.stderr if stream is None else stream
+        self.started = time.time()
+        self.reported = self.started
+        self.documents = 0
+        self.concepts = 0
+        self.errors = 0
+
+    def update(self, documents, concepts, error):
+        self.documents += documents
+        self.concepts += concepts
+        if error is not None:
+            self.errors += 1
+            self.stream.write(error + '\n')
+        now = time.time()
+        if self.interval and now - self.reported >= self.interval:
+            self.reported = now
+            self.report()
+
+    def report(self):
+        elapsed = max(time.time() - self.started, 1e-9)
+        self.stream.write('{0} documents, {1} concepts, {2} failed batches in {3:.1f}s '
+                          '({4:.1f} documents/s, {5:.1f} concepts/s)\n'.format(
+                              self.documents, self.concepts, self.errors, elapsed,
+                              self.documents / elapsed, self.concepts / elapsed))
+        self.stream.flush()
+
+
+def make_backends(arguments, cache):
+    """ Returns one backend per worker and the options for their
+        extract_concepts.
+    """
+    options = dict()
+    restrict_to_sts = arguments.restrict_to_sts.split(',') if arguments.restrict_to_sts else []
+    restrict_to_sources = arguments.restrict_to_sources.split(',') if arguments.restrict_to_sources else []
+    if arguments.lite:
+        metamap_home = os.path.abspath(arguments.lite)
+        backends = [MetaMapLite.get_instance(metamap_home, backend=arguments.backend, cache=cache,
+                                             deduplicate=arguments.deduplicate)
+                    for _ in range(arguments.workers)]
+        options.update(restrict_to_sts=restrict_to_sts, restrict_to_sources=restrict_to_sources)
+    else:
+        metamap_filename = os.path.abspath(arguments.metamap)
+        backends = [MetaMap.get_instance(metamap_filename, backend=arguments.backend, cache=cache,
+                                         deduplicate=arguments.deduplicate)
+                    for _ in range(arguments.workers)]
+        options.update(restrict_to_sts=restrict_to_sts, restrict_to_sources=restrict_to_sources,
+                       word_sense_disambiguation=arguments.word_sense_disambiguation,
+                       composite_phrase=arguments.composite_phrase)
+    return backends, options
+
+
+def make_cache(arguments):
+    memory = None
+    persistent = None
+    if arguments.memory_cache > 0:
+        memory = MemoryCache(max_entries=arguments.memory_cache)
+    if arguments.cache:
+        persistent = SQLiteCache(arguments.cache)
+    if memory is not None and persistent is not None:
+        return TieredCache(memory, persistent)
+    return memory or persistent
+
+
+def annotate(backends, options, batches, output, output_format, progress):
+    """ Runs the batches on the backends, one worker thread each, and
+        writes the concepts to output in input order. At most two
+        batches per worker are in flight, so memory use does not grow
+        with the input.
+    """
+    idle = collections.deque(backends)
+    lock = threading.Lock()
+
+    def run(batch):
+        with lock:
+            backend = idle.popleft()
+        try:
+            ids = [identifier for identifier, _ in batch]
+            sentences = [text for _, text in batch]
+            return backend.extract_concepts(sentences, ids, **options)
+        finally:
+            with lock:
+                idle.append(backend)
+
+    pending = collections.deque()
+    with ThreadPoolExecutor(max_workers=len(backends)) as executor:
+        for batch in batches:
+            pending.append((len(batch), executor.submit(run, batch)))
+            while len(pending) > 2 * len(backends) or (pending and pending[0][1].done()):
+                write_result(pending.popleft(), output, output_format, progress)
+        while pending:
+            write_result(pending.popleft(), output, output_format, progress)
+
+
+def write_result(item, output, output_format, progress):
+    documents, future = item
+    concepts, error = future.result()
+    for concept in concepts:
+        output.write(format_concept(concept, output_format) + '\n')
+    output.flush()
+    progress.update(documents, len(concepts), error)
+
+
+def main(argv=None):
+    parser = build_parser()
+    arguments = parser.parse_args(argv)
+    if arguments.workers < 1 or arguments.batch_size < 1:
+        parser.error('--workers and --batch-size must be positive')
+
+    cache = make_cache(arguments)
+    backends, options = make_backends(arguments, cache)
+    documents = read_documents(arguments.inputs, arguments.input_format,
+                               arguments.id_field, arguments.text_field)
+    progress = Progress(arguments.progress_interval)
+    if arguments.output == '-':
+        output = sys.stdout
+    else:
+        output = open(arguments.output, 'w')
+    try:
+        annotate(backends, options, iter_batches(documents, arguments.batch_size),
+                 output, arguments.output_format, progress)
+    finally:
+        if output is not sys.stdout:
+            output.close()
+        for backend in backends:
+            if hasattr(backend, 'close'):
+                backend.close()
+        if hasattr(cache, 'close'):
+            cache.close()
+        elif hasattr(cache, 'persistent'):
+            cache.persistent.close()
+    if arguments.progress_interval:
+        progress.report()
+    return 1 if progress.errors else 0
+
+
+if __name__ == '__main__':
+    sys.exit(main())
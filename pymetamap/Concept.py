@@ -10,6 +10,8 @@
 # See the License for the specific language governing permissions and
 # limitations under the License.
 
+import itertools
+import re
 from collections import namedtuple
 
 FIELD_NAMES_MMI = ('index', 'mm', 'score', 'preferred_name', 'cui', 'semtypes',
@@ -23,6 +25,79 @@ FIELD_NAMES_UA = ('index', 'ua', 'short_form', 'long_form', 'num_tokens_short_fo
                   'num_chars_short_form', 'num_tokens_long_form',
                   'num_chars_long_form', 'pos_info')
 
+# Trigger text may itself contain '|'; surplus fields are merged back there.
+TRIGGER_FIELD_MMI = FIELD_NAMES_MMI.index('trigger')
+
+
+def fit_fields(fields, size, merge_at=None):
+    """ Adjusts the fields of a split row to exactly size fields. Surplus
+        fields are merged back into the field at merge_at (or dropped if
+        merge_at is None) and missing trailing fields are left empty.
+    """
+    if len(fields) > size:
+        if merge_at is None:
+            del fields[size:]
+        else:
+            end = merge_at + len(fields) - size + 1
+            fields[merge_at:end] = ['|'.join(fields[merge_at:end])]
+    elif len(fields) < size:
+        fields.extend([''] * (size - len(fields)))
+    return fields
+
+
+Trigger = namedtuple('Trigger', ('text', 'location', 'word_index', 'matched_text',
+                                 'part_of_speech', 'negated'))
+
+# "<text>"-<location>-<word index>-"<matched text>"[-<part of speech>-<negated>]
+TRIGGER_PATTERN = re.compile(r'"(.*?)"-(\w+)-(\d+)-"(.*?)"(?:-([^-,\]]*)-(\d+))?(?=,|\]|$)')
+SPAN_PATTERN = re.compile(r'(\d+)[/:](\d+)')
+
+
+def parse_semtypes(semtypes):
+    """ Splits a semtypes field such as '[dsyn,sosy]' into a list. """
+    semtypes = semtypes.strip('[]')
+    if not semtypes:
+        return []
+    return semtypes.split(',')
+
+
+def parse_spans(pos_info):
+    """ Returns the (start, length) spans of a pos_info field such as
+        '1:12', '228/6;136/5' or '[4061/10,4075/11],[5000/3]'.
+    """
+    return [(int(start), int(length)) for start, length in SPAN_PATTERN.findall(pos_info)]
+
+
+def parse_triggers(trigger):
+    """ Returns the Trigger tuples of a trigger field such as
+        '["Heart attack"-tx-1-"heart attack"-noun-0]'. part_of_speech
+        and negated are None for MetaMap versions that omit them.
+    """
+    triggers = list()
+    for text, location, word_index, matched_text, part_of_speech, negated \
+            in TRIGGER_PATTERN.findall(trigger):
+        triggers.append(Trigger(text, location, int(word_index), matched_text,
+                                part_of_speech if negated else None,
+                                negated == '1' if negated else None))
+    return triggers
+
+
+class lazy_attribute(object):
+    """ Computes an attribute on first access and caches it on the
+        instance, so that unused parsed fields cost nothing.
+    """
+    def __init__(self, function):
+        self.function = function
+        self.name = function.__name__
+        self.__doc__ = function.__doc__
+
+    def __get__(self, instance, owner):
+        if instance is None:
+            return self
+        value = self.function(instance)
+        instance.__dict__[self.name] = value
+        return value
+
 class ConceptMMI(namedtuple('Concept', FIELD_NAMES_MMI)):
     def __repr__(self):
         items = [(field, getattr(self, field, None)) for field in FIELD_NAMES_MMI]
@@ -30,12 +105,27 @@ class ConceptMMI(namedtuple('Concept', FIELD_NAMES_MMI)):
         return '%s(%s)' % (self.__class__.__name__, ', '.join(fields))
 
     def as_mmi(self):
-        return '|'.join([get(field) for field in FIELD_NAMES_MMI])
+        return '|'.join(self)
+
+    @lazy_attribute
+    def semtype_list(self):
+        """ Semantic types as a list, e.g. ['dsyn']. """
+        return parse_semtypes(self.semtypes)
+
+    @lazy_attribute
+    def spans(self):
+        """ pos_info as a list of (start, length) tuples. """
+        return parse_spans(self.pos_info)
+
+    @lazy_attribute
+    def triggers(self):
+        """ trigger as a list of Trigger tuples. """
+        return parse_triggers(self.trigger)
 
     @classmethod
     def from_mmi(this_class, line):
-         fields = line.split('|')
-         return this_class(**dict(zip(FIELD_NAMES_MMI, fields)))
+         fields = fit_fields(line.split('|'), len(FIELD_NAMES_MMI), TRIGGER_FIELD_MMI)
+         return this_class._make(fields)
 
 class ConceptAA(namedtuple('Concept', FIELD_NAMES_AA)):
     def __repr__(self):
@@ -44,12 +134,17 @@ class ConceptAA(namedtuple('Concept', FIELD_NAMES_AA)):
         return '%s(%s)' % (self.__class__.__name__, ', '.join(fields))
 
     def as_mmi(self):
-        return '|'.join([get(field) for field in FIELD_NAMES_AA])
+        return '|'.join(self)
+
+    @lazy_attribute
+    def spans(self):
+        """ pos_info as a list of (start, length) tuples. """
+        return parse_spans(self.pos_info)
 
     @classmethod
     def from_mmi(this_class, line):
-         fields = line.split('|')
-         return this_class(**dict(zip(FIELD_NAMES_AA, fields)))
+         fields = fit_fields(line.split('|'), len(FIELD_NAMES_AA))
+         return this_class._make(fields)
 
 class ConceptUA(namedtuple('Concept', FIELD_NAMES_UA)):
     def __repr__(self):
@@ -58,25 +153,97 @@ class ConceptUA(namedtuple('Concept', FIELD_NAMES_UA)):
         return '%s(%s)' % (self.__class__.__name__, ', '.join(fields))
 
     def as_mmi(self):
-        return '|'.join([get(field) for field in FIELD_NAMES_UA])
+        return '|'.join(self)
+
+    @lazy_attribute
+    def spans(self):
+        """ pos_info as a list of (start, length) tuples. """
+        return parse_spans(self.pos_info)
 
     @classmethod
     def from_mmi(this_class, line):
-         fields = line.split('|')
-         return this_class(**dict(zip(FIELD_NAMES_UA, fields)))
+         fields = fit_fields(line.split('|'), len(FIELD_NAMES_UA))
+         return this_class._make(fields)
 
 class Corpus(list):
+    @staticmethod
+    def make_concept(fields):
+        """ Builds the concept for a complete sequence of row fields. """
+        if fields[1] == 'MMI':
+            return ConceptMMI._make(fields)
+        elif fields[1] == 'AA':
+            return ConceptAA._make(fields)
+        return ConceptUA._make(fields)
+
     @classmethod
     def load(this_class, stream):
-        stream = iter(stream)
-        corpus = this_class()
+        return this_class(this_class.iter_load(stream))
+
+    def to_arrow(self, path=None):
+        """ Returns the concepts as a pyarrow Table and, if path is
+            given, writes it there as an Arrow IPC file. Requires pyarrow.
+        """
+        from .ArrowCorpus import to_arrow
+        return to_arrow(self, FIELD_NAMES_MMI, path)
+
+    def to_parquet(self, path, **options):
+        """ Writes the concepts to a Parquet file. Requires pyarrow. """
+        from .ArrowCorpus import to_parquet
+        to_parquet(self, FIELD_NAMES_MMI, path, **options)
+
+    @classmethod
+    def open(this_class, path):
+        """ Returns an ArrowCorpus over a file written by to_arrow or
+            to_parquet. Arrow files are memory-mapped and concepts are
+            only built when accessed.
+        """
+        from .ArrowCorpus import ArrowCorpus
+        return ArrowCorpus.open(path, this_class)
+
+    @classmethod
+    def iter_load(this_class, stream):
+        """ Generator version of load which parses one line at a time.
+            Each line is split once and the concept is built positionally.
+        """
+        size_mmi = len(FIELD_NAMES_MMI)
+        size_aa = len(FIELD_NAMES_AA)
+        size_ua = len(FIELD_NAMES_UA)
+        make_mmi = ConceptMMI._make
+        make_aa = ConceptAA._make
+        make_ua = ConceptUA._make
         for line in stream:
+            line = line.rstrip('\r\n')
+            if not line:
+                continue
             fields = line.split('|')
-            if fields[1] == 'MMI':
-                corpus.append(ConceptMMI.from_mmi(line))
-            elif fields[1] == 'AA':
-                corpus.append(ConceptAA.from_mmi(line))
+            kind = fields[1]
+            if kind == 'MMI':
+                if len(fields) != size_mmi:
+                    fit_fields(fields, size_mmi, TRIGGER_FIELD_MMI)
+                yield make_mmi(fields)
+            elif kind == 'AA':
+                if len(fields) != size_aa:
+                    fit_fields(fields, size_aa)
+                yield make_aa(fields)
             else:
-                corpus.append(ConceptUA.from_mmi(line))
+                if len(fields) != size_ua:
+                    fit_fields(fields, size_ua)
+                yield make_ua(fields)
+
+
+def skip_header(lines):
+    """ Drops the lines MetaMap writes before the first MMI, AA or UA row
+        (its command line and version banner, even with --silent).
+    """
+    def is_header(line):
+        fields = line.split('|', 2)
+        return len(fields) < 2 or fields[1] not in ['MMI', 'AA', 'UA']
+    return itertools.dropwhile(is_header, lines)
+
 
-        return corpus
+def group_by_index(concepts, corpus_class):
+    """ Groups consecutive concepts sharing an index into
+        (index, corpus_class) pairs.
+    """
+    for index, group in itertools.groupby(concepts, key=lambda concept: concept.index):
+        yield (index, corpus_class(group))
@@ -10,9 +10,13 @@
 # limitations under the License.
 
 from collections import namedtuple
+from .Concept import fit_fields, lazy_attribute, parse_semtypes, parse_spans, parse_triggers
 
 FIELD_NAMES_MMI = ('index', 'mm', 'score', 'preferred_name', 'cui', 'semtypes', 'trigger', 'pos_info', 'tree_codes')
 
+# Trigger text may itself contain '|'; surplus fields are merged back there.
+TRIGGER_FIELD_MMI = FIELD_NAMES_MMI.index('trigger')
+
 
 class ConceptLiteMMI(namedtuple('Concept', FIELD_NAMES_MMI)):
     def __repr__(self):
@@ -21,25 +25,76 @@ class ConceptLiteMMI(namedtuple('Concept', FIELD_NAMES_MMI)):
         return '%s(%s)' % (self.__class__.__name__, ', '.join(fields))
 
     def as_mmi(self):
-        return '|'.join([get(field) for field in FIELD_NAMES_MMI])
+        return '|'.join(self)
+
+    @lazy_attribute
+    def semtype_list(self):
+        """ Semantic types as a list, e.g. ['dsyn']. """
+        return parse_semtypes(self.semtypes)
+
+    @lazy_attribute
+    def spans(self):
+        """ pos_info as a list of (start, length) tuples. """
+        return parse_spans(self.pos_info)
+
+    @lazy_attribute
+    def triggers(self):
+        """ trigger as a list of Trigger tuples. """
+        return parse_triggers(self.trigger)
 
     @classmethod
     def from_mmi(this_class, line):
-         fields = line.split('|')
-         return this_class(**dict(zip(FIELD_NAMES_MMI, fields)))
+         fields = fit_fields(line.split('|'), len(FIELD_NAMES_MMI), TRIGGER_FIELD_MMI)
+         return this_class._make(fields)
 
 
 class CorpusLite(list):
+    @staticmethod
+    def make_concept(fields):
+        """ Builds the concept for a complete sequence of row fields. """
+        return ConceptLiteMMI._make(fields)
+
     @classmethod
     def load(this_class, stream):
-        stream = iter(stream)
-        corpus = this_class()
+        return this_class(this_class.iter_load(stream))
+
+    def to_arrow(self, path=None):
+        """ Returns the concepts as a pyarrow Table and, if path is
+            given, writes it there as an Arrow IPC file. Requires pyarrow.
+        """
+        from .ArrowCorpus import to_arrow
+        return to_arrow(self, FIELD_NAMES_MMI, path)
+
+    def to_parquet(self, path, **options):
+        """ Writes the concepts to a Parquet file. Requires pyarrow. """
+        from .ArrowCorpus import to_parquet
+        to_parquet(self, FIELD_NAMES_MMI, path, **options)
+
+    @classmethod
+    def open(this_class, path):
+        """ Returns an ArrowCorpus over a file written by to_arrow or
+            to_parquet. Arrow files are memory-mapped and concepts are
+            only built when accessed.
+        """
+        from .ArrowCorpus import ArrowCorpus
+        return ArrowCorpus.open(path, this_class)
+
+    @classmethod
+    def iter_load(this_class, stream):
+        """ Generator version of load which parses one line at a time.
+            Each line is split once and the concept is built positionally.
+        """
+        size = len(FIELD_NAMES_MMI)
+        make = ConceptLiteMMI._make
         for line in stream:
+            line = line.rstrip('\r\n')
+            if not line:
+                continue
             fields = line.split('|')
             if fields[1] == 'MMI':
-                corpus.append(ConceptLiteMMI.from_mmi(line))
+                if len(fields) != size:
+                    fit_fields(fields, size, TRIGGER_FIELD_MMI)
+                yield make(fields)
             else:
                 print("THISIS A TEST:",line)
                 assert False, "Implemented only for MMI"
-
-        return corpus
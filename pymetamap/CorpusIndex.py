@@ -0,0 +1,185 @@
+# Licensed under the Apache License, Version 2.0 (the "License");
+# you may not use this file except in compliance with the License.
+# You may obtain a copy of the License at
+#
+# http://www.apache.org/licenses/LICENSE-2.0
+#
+# Unless required by applicable law or agreed to in writing, software
+# distributed under the License is distributed on an "AS IS" BASIS,
+# WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.
+# See the License for the specific language governing permissions and
+# limitations under the License.
+
+import bisect
+import collections
+from array import array
+from .Concept import parse_semtypes, parse_spans
+
+
+def normalize_id(identifier):
+    """ Returns an index field without the quotes MetaMap may add. """
+    return str(identifier).strip('\'"')
+
+
+class CorpusIndex(object):
+    def __init__(self, concepts):
+        """ Read-only indexes over the concepts of a Corpus, CorpusLite
+            or ColumnarCorpus: posting lists of rows by CUI, semantic
+            type and id, rows sorted by score, and per id an interval
+            index over the pos_info spans. Queries return concepts in
+            corpus order without scanning the whole corpus.
+
+            Ids are compared without the quotes MetaMap puts around
+            them, e.g. index('d1') finds rows indexed "'d1'".
+
+            concepts is kept as it is, not copied, when it supports
+            len() and indexing by row; anything else is read into a
+            list.
+        """
+        if not (hasattr(concepts, '__len__') and hasattr(concepts, '__getitem__')):
+            concepts = list(concepts)
+        self.concepts = concepts
+        self.by_cui = collections.defaultdict(lambda: array('i'))
+        self.by_semtype = collections.defaultdict(lambda: array('i'))
+        self.by_id = collections.defaultdict(lambda: array('i'))
+        scored = list()
+        spans = collections.defaultdict(list)
+        for row, concept in enumerate(self.concepts):
+            identifier = normalize_id(concept.index)
+            self.by_id[identifier].append(row)
+            cui = getattr(concept, 'cui', None)
+            if cui:
+                self.by_cui[cui].append(row)
+            for semtype in set(parse_semtypes(getattr(concept, 'semtypes', ''))):
+                self.by_semtype[semtype].append(row)
+            try:
+                scored.append((float(concept.score), row))
+            except (AttributeError, ValueError):
+                pass
+            for start, length in parse_spans(concept.pos_info):
+                spans[identifier].append((start, start + length, row))
+
+        scored.sort()
+        self.scores = array('d', [score for score, _ in scored])
+        self.score_rows = array('i', [row for _, row in scored])
+        # Per id: span starts and rows sorted by start, plus a tree of
+        # the largest end offset below each node (the ends themselves
+        # are its leaves), so overlaps are found without visiting the
+        # spans that end before the query range.
+        self.spans = dict()
+        for identifier, entries in spans.items():
+            entries.sort()
+            size = 1
+            while size < len(entries):
+                size *= 2
+            ends = array('i', [-1]) * (2 * size)
+            ends[size:size + len(entries)] = array('i', [end for _, end, _ in entries])
+            for node in range(size - 1, 0, -1):
+                ends[node] = max(ends[2 * node], ends[2 * node + 1])
+            self.spans[identifier] = (array('i', [start for start, _, _ in entries]),
+                                      array('i', [row for _, _, row in entries]),
+                                      ends, size)
+
+    def __len__(self):
+        return len(self.concepts)
+
+    def _take(self, rows):
+        return [self.concepts[row] for row in sorted(rows)]
+
+    def ids(self, cui=None, semtype=None):
+        """ Returns the distinct ids, in corpus order, with a concept for
+            cui and/or semtype.
+        """
+        seen = collections.OrderedDict()
+        for concept in self.query(cuis=cui, semtypes=semtype):
+            seen[normalize_id(concept.index)] = None
+        return list(seen)
+
+    def _score_bounds(self, min_score, max_score):
+        """ Returns the slice of score_rows within [min_score, max_score]. """
+        low = 0 if min_score is None else bisect.bisect_left(self.scores, min_score)
+        high = len(self.scores) if max_score is None else bisect.bisect_right(self.scores, max_score)
+        return (low, high)
+
+    def query(self, cuis=None, semtypes=None, ids=None, min_score=None, max_score=None):
+        """ Returns the concepts matching every given condition: CUI in
+            cuis, at least one semantic type in semtypes, id in ids and
+            score within [min_score, max_score]. cuis, semtypes and ids
+            may be single strings or collections. Candidates come from
+            the most selective index and are checked against the rest.
+        """
+        conditions = list()
+        if cuis is not None:
+            cuis = set([cuis] if isinstance(cuis, str) else cuis)
+            conditions.append((self.by_cui, cuis, lambda concept:
+                               getattr(concept, 'cui', None) in cuis))
+        if semtypes is not None:
+            semtypes = set([semtypes] if isinstance(semtypes, str) else semtypes)
+            conditions.append((self.by_semtype, semtypes, lambda concept:
+                               not semtypes.isdisjoint(parse_semtypes(getattr(concept, 'semtypes', '')))))
+        if ids is not None:
+            ids = set(normalize_id(identifier)
+                      for identifier in ([ids] if isinstance(ids, str) else ids))
+            conditions.append((self.by_id, ids, lambda concept:
+                               normalize_id(concept.index) in ids))
+
+        if min_score is not None or max_score is not None:
+            conditions.append((None, None, lambda concept:
+                               self._in_range(concept, min_score, max_score)))
+        if not conditions:
+            return list(self.concepts)
+
+        sizes = list()
+        for index, values, _ in conditions:
+            if index is None:
+                low, high = self._score_bounds(min_score, max_score)
+                sizes.append(high - low)
+            else:
+                sizes.append(sum(len(index.get(value, ())) for value in values))
+        index, values, _ = conditions.pop(sizes.index(min(sizes)))
+        if index is None:
+            low, high = self._score_bounds(min_score, max_score)
+            rows = self.score_rows[low:high]
+        else:
+            rows = set()
+            for value in values:
+                rows.update(index.get(value, ()))
+
+        checks = [check for _, _, check in conditions]
+        return [concept for concept in self._take(rows)
+                if all(check(concept) for check in checks)]
+
+    @staticmethod
+    def _in_range(concept, min_score, max_score):
+        try:
+            score = float(concept.score)
+        except (AttributeError, ValueError):
+            return False
+        return (min_score is None or score >= min_score) and \
+            (max_score is None or score <= max_score)
+
+    def overlapping(self, identifier, start, end):
+        """ Returns the concepts of identifier with a pos_info span
+            overlapping the character range [start, end).
+        """
+        entries = self.spans.get(normalize_id(identifier))
+        if entries is None:
+            return []
+        starts, rows, ends, size = entries
+        # Spans at positions below high start before end; of those,
+        # descend only into subtrees holding a span ending after start.
+        high = bisect.bisect_left(starts, end)
+        found = set()
+        pending = [1]
+        while pending:
+            node = pending.pop()
+            if ends[node] <= start:
+                continue
+            depth = node.bit_length() - 1
+            if (node - (1 << depth)) * (size >> depth) >= high:
+                continue
+            if node >= size:
+                found.add(rows[node - size])
+            else:
+                pending.extend((2 * node, 2 * node + 1))
+        return self._take(found)
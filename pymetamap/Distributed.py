@@ -0,0 +1,344 @@
+# Licensed under the Apache License, Version 2.0 (the "License");
+# you may not use this file except in compliance with the License.
+# You may obtain a copy of the License at
+#
+# http://www.apache.org/licenses/LICENSE-2.0
+#
+# Unless required by applicable law or agreed to in writing, software
+# distributed under the License is distributed on an "AS IS" BASIS,
+# WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.
+# See the License for the specific language governing permissions and
+# limitations under the License.
+
+""" Spreading extract_concepts over several machines.
+
+    A Coordinator splits the sentences into batches and serves them over
+    TCP; Workers on any number of hosts lease a batch, run it on their
+    own MetaMap or MetaMapLite backend and send the MMI rows back. A
+    batch whose worker fails, disconnects or does not answer within
+    lease_timeout is leased again. Results are delivered once per batch
+    and in input order, however many attempts a batch took.
+
+    Messages are JSON objects, one per line. A worker sends
+    {"type": "lease"} and gets {"type": "batch", ...}, {"type": "wait"}
+    or {"type": "done"}; it answers a batch with {"type": "result", ...}
+    and gets {"type": "ack"}.
+
+        pymetamap-worker --metamap /opt/public_mm/bin/metamap16 --connect coordinator:7700
+"""
+
+import argparse
+import collections
+import itertools
+import json
+import os
+import socket
+import socketserver
+import threading
+import time
+from .MetaMap import MetaMap
+from .MetaMapLite import MetaMapLite
+from .Concept import Corpus
+from .ConceptLite import CorpusLite
+
+
+def send_message(stream, message):
+    stream.write(json.dumps(message).encode('utf8') + b'\n')
+    stream.flush()
+
+
+def receive_message(stream):
+    line = stream.readline()
+    if not line:
+        raise EOFError("connection closed")
+    return json.loads(line.decode('utf8'))
+
+
+class _Handler(socketserver.StreamRequestHandler):
+    def handle(self):
+        coordinator = self.server.coordinator
+        connection = next(coordinator._connections)
+        try:
+            while True:
+                try:
+                    message = receive_message(self.rfile)
+                except (EOFError, ValueError, IOError, OSError):
+                    return
+                if message.get('type') == 'lease':
+                    reply = coordinator._lease(connection)
+                elif message.get('type') == 'result':
+                    reply = coordinator._complete(message)
+                else:
+                    reply = {'type': 'error', 'error': 'unknown message type'}
+                try:
+                    send_message(self.wfile, reply)
+                except (IOError, OSError):
+                    return
+        finally:
+            coordinator._release(connection)
+
+
+class _Server(socketserver.ThreadingTCPServer):
+    allow_reuse_address = True
+    daemon_threads = True
+
+
+class Coordinator(object):
+    def __init__(self, host='localhost', port=0, batch_size=100, lease_timeout=600,
+                 max_attempts=3, max_pending=None):
+        """ Serves sentence batches to Workers on host:port (port 0
+            picks a free port; see address). A lease that is not
+            answered within lease_timeout seconds, or whose worker
+            disconnects, is given to another worker. A batch that fails,
+            times out or loses its worker max_attempts times in all is
+            delivered with its last error. At most
+            max_pending batches (by default 64) are held in memory, so
+            the input may be any iterable.
+        """
+        if batch_size < 1 or max_attempts < 1:
+            raise ValueError("batch_size and max_attempts must be positive.")
+        self.batch_size = batch_size
+        self.lease_timeout = lease_timeout
+        self.max_attempts = max_attempts
+        self.max_pending = max_pending or 64
+        self.retries = 0
+        self._condition = threading.Condition()
+        self._connections = itertools.count()
+        self._numbers = itertools.count()
+        self._queue = collections.deque()
+        self._batches = dict()
+        self._leases = dict()
+        self._attempts = collections.Counter()
+        self._results = dict()
+        self._closed = False
+        self._server = _Server((host, port), _Handler)
+        self._server.coordinator = self
+        self._thread = threading.Thread(target=self._server.serve_forever)
+        self._thread.daemon = True
+        self._thread.start()
+
+    @property
+    def address(self):
+        """ (host, port) the coordinator listens on. """
+        return self._server.server_address[:2]
+
+    def close(self):
+        """ Tells polling workers to exit and stops serving. """
+        with self._condition:
+            self._closed = True
+        # Connected workers keep being answered, with 'done'.
+        self._server.shutdown()
+        self._server.server_close()
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, exc_type, exc_value, traceback):
+        self.close()
+
+    def _expire_leases(self):
+        now = time.time()
+        for number, (connection, attempt, deadline) in list(self._leases.items()):
+            if deadline <= now:
+                del self._leases[number]
+                self._lost(number, "ERROR: batch {0} was not answered within {1} seconds".format(
+                    number, self.lease_timeout))
+
+    def _lost(self, number, error):
+        """ Leases again a batch whose lease expired or whose worker
+            disconnected, or delivers it with error once it has been
+            leased max_attempts times. Called with the lock held.
+        """
+        if self._attempts[number] >= self.max_attempts:
+            self._results[number] = (Corpus(), error)
+            self._condition.notify_all()
+        else:
+            self._queue.appendleft(number)
+            self.retries += 1
+
+    def _lease(self, connection):
+        with self._condition:
+            self._expire_leases()
+            while self._queue:
+                number = self._queue.popleft()
+                if number not in self._batches or number in self._results \
+                        or number in self._leases:
+                    continue
+                self._attempts[number] += 1
+                attempt = self._attempts[number]
+                self._leases[number] = (connection, attempt, time.time() + self.lease_timeout)
+                sentences, ids, options = self._batches[number]
+                return {'type': 'batch', 'batch': number, 'attempt': attempt,
+                        'sentences': sentences, 'ids': ids, 'options': options}
+            if self._closed:
+                return {'type': 'done'}
+            return {'type': 'wait'}
+
+    def _complete(self, message):
+        number = message['batch']
+        with self._condition:
+            if number in self._results or number not in self._batches:
+                # A late answer for a batch that was already delivered.
+                return {'type': 'ack'}
+            lease = self._leases.get(number)
+            current = lease is not None and lease[1] == message['attempt']
+            error = message.get('error')
+            if error is not None:
+                if current:
+                    del self._leases[number]
+                if self._attempts[number] < self.max_attempts or (lease is not None and not current):
+                    # Retry, unless a newer attempt is already running.
+                    if current:
+                        self._queue.append(number)
+                        self.retries += 1
+                    return {'type': 'ack'}
+            corpus_class = CorpusLite if message.get('lite') else Corpus
+            self._results[number] = (corpus_class.load(message.get('mmi', [])), error)
+            self._leases.pop(number, None)
+            self._condition.notify_all()
+        return {'type': 'ack'}
+
+    def _release(self, connection):
+        """ Leases again the batches held by a disconnected worker. """
+        with self._condition:
+            for number, lease in list(self._leases.items()):
+                if lease[0] == connection:
+                    del self._leases[number]
+                    self._lost(number, "ERROR: worker disconnected while running batch {0}".format(
+                        number))
+
+    def _submit(self, sentences, ids, options):
+        number = next(self._numbers)
+        with self._condition:
+            self._batches[number] = (sentences, ids, options)
+            self._queue.append(number)
+        return number
+
+    def _wait(self, number):
+        with self._condition:
+            while number not in self._results:
+                self._condition.wait(1.0)
+                self._expire_leases()
+            result = self._results.pop(number)
+            del self._batches[number]
+            self._attempts.pop(number, None)
+        return result
+
+    def run(self, sentences, ids=None, **options):
+        """ Yields (concepts, error) for every batch of batch_size
+            sentences, in input order, as the workers finish them;
+            options are passed on to the workers' extract_concepts and
+            must be JSON serializable.
+        """
+        sentences = iter(sentences)
+        ids = iter(ids) if ids is not None else None
+        pending = collections.deque()
+        while True:
+            while len(pending) < self.max_pending:
+                batch = list(itertools.islice(sentences, self.batch_size))
+                if not batch:
+                    break
+                batch_ids = None
+                if ids is not None:
+                    batch_ids = list(itertools.islice(ids, len(batch)))
+                pending.append(self._submit(batch, batch_ids, options))
+            if not pending:
+                return
+            yield self._wait(pending.popleft())
+
+    def extract_concepts(self, sentences, ids=None, **options):
+        """ Returns (concepts, error) for all sentences, like a backend's
+            extract_concepts; error is that of the first failed batch.
+        """
+        concepts = None
+        error = None
+        for batch_concepts, batch_error in self.run(sentences, ids, **options):
+            if concepts is None:
+                concepts = batch_concepts
+            else:
+                concepts.extend(batch_concepts)
+            if error is None:
+                error = batch_error
+        return (concepts if concepts is not None else Corpus(), error)
+
+
+class Worker(object):
+    def __init__(self, metamap, address, poll_interval=1.0):
+        """ Runs batches leased from the Coordinator at address, a
+            (host, port) pair, on metamap (any MetaMap or MetaMapLite
+            backend).
+        """
+        self.metamap = metamap
+        self.address = tuple(address)
+        self.poll_interval = poll_interval
+        self.batches = 0
+
+    def run(self, max_batches=None):
+        """ Processes batches until the coordinator is done or closes
+            the connection, or max_batches have been run. Returns the
+            number of batches run.
+        """
+        connection = socket.create_connection(self.address)
+        stream = connection.makefile('rwb')
+        lite = isinstance(self.metamap, MetaMapLite)
+        count = 0
+        try:
+            while max_batches is None or count < max_batches:
+                try:
+                    send_message(stream, {'type': 'lease'})
+                    message = receive_message(stream)
+                except (EOFError, IOError, OSError):
+                    break
+                if message['type'] == 'done':
+                    break
+                if message['type'] != 'batch':
+                    time.sleep(self.poll_interval)
+                    continue
+                try:
+                    concepts, error = self.metamap.extract_concepts(
+                        message['sentences'], message['ids'], **message['options'])
+                except Exception as e:
+                    concepts, error = ([], "ERROR: {0}".format(e))
+                try:
+                    send_message(stream, {'type': 'result', 'batch': message['batch'],
+                                          'attempt': message['attempt'], 'lite': lite,
+                                          'mmi': [concept.as_mmi() for concept in concepts],
+                                          'error': error})
+                    receive_message(stream)
+                except (EOFError, IOError, OSError):
+                    break
+                count += 1
+                self.batches += 1
+        finally:
+            stream.close()
+            connection.close()
+        return count
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(
+        prog='pymetamap-worker',
+        description='Run MetaMap batches leased from a pymetamap Coordinator.')
+    program = parser.add_mutually_exclusive_group(required=True)
+    program.add_argument('--metamap', metavar='PATH',
+                         help='absolute path of the metamap binary')
+    program.add_argument('--lite', metavar='DIR',
+                         help='absolute path of the public_mm_lite directory')
+    parser.add_argument('--connect', required=True, metavar='HOST:PORT',
+                        help='address of the coordinator')
+    parser.add_argument('--batch-timeout', type=float, metavar='SECONDS',
+                        help='kill a MetaMap process running longer than this')
+    parser.add_argument('--poll-interval', type=float, default=1.0, metavar='SECONDS',
+                        help='seconds to wait when no batch is available (default: 1)')
+    arguments = parser.parse_args(argv)
+
+    host, _, port = arguments.connect.rpartition(':')
+    if arguments.lite:
+        metamap = MetaMapLite.get_instance(os.path.abspath(arguments.lite),
+                                           batch_timeout=arguments.batch_timeout)
+    else:
+        metamap = MetaMap.get_instance(os.path.abspath(arguments.metamap),
+                                       batch_timeout=arguments.batch_timeout)
+    Worker(metamap, (host, int(port)), arguments.poll_interval).run()
+    return 0
+
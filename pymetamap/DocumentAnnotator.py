@@ -0,0 +1,123 @@
+# Licensed under the Apache License, Version 2.0 (the "License");
+# you may not use this file except in compliance with the License.
+# You may obtain a copy of the License at
+#
+# http://www.apache.org/licenses/LICENSE-2.0
+#
+# Unless required by applicable law or agreed to in writing, software
+# distributed under the License is distributed on an "AS IS" BASIS,
+# WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.
+# See the License for the specific language governing permissions and
+# limitations under the License.
+
+import re
+from .MetaMapLite import MetaMapLite
+from .Concept import Corpus, SPAN_PATTERN
+from .ConceptLite import CorpusLite
+from .SubprocessBackend import input_offsets
+
+PARAGRAPH_PATTERN = re.compile(r'\S(?:(?!\n[ \t\r\f\v]*\n).)*', re.S)
+SENTENCE_PATTERN = re.compile(r'\S.*?(?:[.!?]+["\')\]]*(?=\s)|$)', re.S)
+# MetaMap reads one sentence per line.
+LINE_BREAKS = re.compile(r'[\r\n\t\f\v]')
+
+
+def segment_text(text, max_length=1000):
+    """ Splits text into (start, segment) pairs where segment is
+        text[start:start + len(segment)] with leading and trailing
+        whitespace removed. Paragraphs (separated by blank lines) are
+        kept whole when they fit in max_length characters, longer ones
+        are split into sentences, and sentences still longer than that
+        are cut at the last whitespace before the limit.
+    """
+    if max_length < 1:
+        raise ValueError("max_length must be positive.")
+    segments = list()
+    for paragraph in PARAGRAPH_PATTERN.finditer(text):
+        if len(paragraph.group().rstrip()) <= max_length:
+            pieces = [paragraph]
+        else:
+            pieces = SENTENCE_PATTERN.finditer(text, paragraph.start(), paragraph.end())
+        for piece in pieces:
+            start = piece.start()
+            segment = piece.group().rstrip()
+            while len(segment) > max_length:
+                cut = segment.rfind(' ', 1, max_length + 1)
+                if cut <= 0:
+                    cut = max_length
+                head = segment[:cut].rstrip()
+                segments.append((start, head))
+                rest = segment[cut:]
+                start += cut + len(rest) - len(rest.lstrip())
+                segment = rest.lstrip()
+            if segment:
+                segments.append((start, segment))
+    return segments
+
+
+def remap_pos_info(pos_info, start, offsets=None):
+    """ Rewrites the spans of a pos_info field, given as offsets into a
+        segment as it was written to MetaMap, to offsets into the
+        document the segment starts at start in. offsets maps input
+        offsets to segment offsets (see input_offsets); None means
+        they are the same.
+    """
+    def remap(match):
+        begin, length = int(match.group(1)), int(match.group(2))
+        end = begin + length
+        if offsets is not None:
+            begin = offsets[min(begin, len(offsets) - 1)]
+            end = offsets[min(end, len(offsets) - 1)]
+        separator = match.group(0)[len(match.group(1))]
+        return '{0}{1}{2}'.format(start + begin, separator, end - begin)
+    return SPAN_PATTERN.sub(remap, pos_info)
+
+
+class DocumentAnnotator(object):
+    def __init__(self, metamap, max_segment_length=1000):
+        """ Annotates whole documents with metamap (any MetaMap or
+            MetaMapLite backend). Each document is cut into segments of
+            at most max_segment_length characters by segment_text, all
+            segments are sent in a single extract_concepts call (so a
+            pool backend processes them in parallel) and the concepts
+            are returned with the document's id as index and pos_info
+            rewritten to offsets into the document.
+        """
+        self.metamap = metamap
+        self.max_segment_length = max_segment_length
+        if isinstance(metamap, MetaMapLite):
+            self.corpus_class = CorpusLite
+            self.input_offsets = None
+        else:
+            self.corpus_class = Corpus
+            self.input_offsets = input_offsets
+
+    def extract_concepts(self, documents, ids=None, **options):
+        """ Returns (concepts, error) for a list of documents; options
+            are passed on to the backend's extract_concepts. Without
+            ids, documents are identified by their position.
+        """
+        documents = list(documents)
+        if ids is None:
+            ids = list(range(len(documents)))
+        segments = list()
+        for identifier, document in zip(ids, documents):
+            for start, segment in segment_text(document, self.max_segment_length):
+                segments.append((identifier, start, LINE_BREAKS.sub(' ', segment)))
+        if not segments:
+            return (self.corpus_class(), None)
+
+        concepts, error = self.metamap.extract_concepts(
+            [segment for _, _, segment in segments], list(range(len(segments))), **options)
+
+        remapped = self.corpus_class()
+        offsets = dict()
+        for concept in concepts:
+            number = int(str(concept.index).strip('\'"'))
+            identifier, start, segment = segments[number]
+            if number not in offsets and self.input_offsets is not None:
+                offsets[number] = self.input_offsets(segment)
+            remapped.append(concept._replace(
+                index=str(identifier),
+                pos_info=remap_pos_info(concept.pos_info, start, offsets.get(number))))
+        return (remapped, error)
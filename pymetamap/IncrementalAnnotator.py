@@ -0,0 +1,210 @@
+# Licensed under the Apache License, Version 2.0 (the "License");
+# you may not use this file except in compliance with the License.
+# You may obtain a copy of the License at
+#
+# http://www.apache.org/licenses/LICENSE-2.0
+#
+# Unless required by applicable law or agreed to in writing, software
+# distributed under the License is distributed on an "AS IS" BASIS,
+# WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.
+# See the License for the specific language governing permissions and
+# limitations under the License.
+
+import hashlib
+import json
+import sqlite3
+import threading
+import time
+from .MetaMapLite import MetaMapLite
+from .Concept import Corpus
+from .ConceptLite import CorpusLite
+
+# SQLite's default limit on host parameters per statement is 999.
+LOOKUP_CHUNK_SIZE = 500
+
+
+def content_hash(text):
+    """ Returns the hash identifying the exact text of a document. """
+    return hashlib.sha256(text.encode('utf8')).hexdigest()
+
+
+def describe_backend(metamap):
+    """ Returns what identifies the output of metamap: its class, the
+        program it runs and its version. Wrappers with a metamap
+        attribute (e.g. DocumentAnnotator) are described recursively.
+    """
+    description = {'class': metamap.__class__.__name__}
+    for name in ('metamap_filename', 'metamap_home', 'version', 'max_segment_length'):
+        if hasattr(metamap, name):
+            description[name] = getattr(metamap, name)
+    if hasattr(metamap, 'metamap'):
+        description['metamap'] = describe_backend(metamap.metamap)
+    return description
+
+
+class IncrementalAnnotator(object):
+    def __init__(self, metamap, path, data_version=None, batch_size=1000):
+        """ Keeps the concepts of a document collection up to date in the
+            SQLite manifest at path. For every document id the manifest
+            holds the hash of the text, the fingerprint of the backend,
+            options and data_version it was annotated with, and the
+            resulting concepts. refresh() only sends documents that are
+            new or whose entry no longer matches to metamap, in batches
+            of batch_size, and reuses the stored concepts for the rest.
+
+            metamap is any MetaMap or MetaMapLite instance, or a
+            DocumentAnnotator for long documents. data_version names
+            the installed MetaMap/UMLS data release (e.g. '2020AA'),
+            which pymetamap cannot detect; change it after installing
+            new data to re-annotate every document.
+        """
+        if batch_size < 1:
+            raise ValueError("batch_size must be positive.")
+        self.metamap = metamap
+        self.path = path
+        self.data_version = data_version
+        self.batch_size = batch_size
+        if hasattr(metamap, 'corpus_class'):
+            self.corpus_class = metamap.corpus_class
+        elif isinstance(metamap, MetaMapLite):
+            self.corpus_class = CorpusLite
+        else:
+            self.corpus_class = Corpus
+        self.reused = 0
+        self.annotated = 0
+        self._lock = threading.Lock()
+        self._connection = sqlite3.connect(path, check_same_thread=False)
+        with self._lock:
+            self._connection.execute('PRAGMA journal_mode=WAL')
+            self._connection.execute('PRAGMA synchronous=NORMAL')
+            self._connection.execute('CREATE TABLE IF NOT EXISTS documents '
+                                     '(id TEXT PRIMARY KEY, content_hash TEXT NOT NULL, '
+                                     'fingerprint TEXT NOT NULL, rows TEXT NOT NULL, '
+                                     'updated REAL NOT NULL)')
+            self._connection.commit()
+
+    def __len__(self):
+        with self._lock:
+            return self._connection.execute('SELECT COUNT(*) FROM documents').fetchone()[0]
+
+    def fingerprint(self, options):
+        """ Returns the fingerprint of annotating with the given
+            extract_concepts options.
+        """
+        description = {'backend': describe_backend(self.metamap),
+                       'data_version': self.data_version,
+                       'options': options}
+        encoded = json.dumps(description, sort_keys=True, default=repr)
+        return hashlib.sha256(encoded.encode('utf8')).hexdigest()
+
+    def _lookup(self, ids):
+        """ Returns {id: (content_hash, fingerprint, rows)} for the ids
+            found in the manifest.
+        """
+        entries = dict()
+        with self._lock:
+            for start in range(0, len(ids), LOOKUP_CHUNK_SIZE):
+                chunk = ids[start:start + LOOKUP_CHUNK_SIZE]
+                query = ('SELECT id, content_hash, fingerprint, rows FROM documents '
+                         'WHERE id IN ({0})'.format(','.join('?' * len(chunk))))
+                for identifier, digest, fingerprint, rows in \
+                        self._connection.execute(query, chunk):
+                    entries[identifier] = (digest, fingerprint, rows)
+        return entries
+
+    def _annotate(self, documents, ids, digests, fingerprint, options):
+        """ Runs metamap over one batch of documents and stores the rows
+            of every document if it succeeded. Returns ({id: rows},
+            error).
+        """
+        concepts, error = self.metamap.extract_concepts(documents, list(range(len(documents))),
+                                                        **options)
+        found = dict((identifier, list()) for identifier in ids)
+        for concept in concepts:
+            found[ids[int(str(concept.index).strip('\'"'))]].append(list(concept[1:]))
+        if error is None:
+            now = time.time()
+            entries = [(identifier, digest, fingerprint, json.dumps(found[identifier]), now)
+                       for identifier, digest in zip(ids, digests)]
+            with self._lock:
+                self._connection.executemany('INSERT OR REPLACE INTO documents '
+                                             '(id, content_hash, fingerprint, rows, updated) '
+                                             'VALUES (?, ?, ?, ?, ?)', entries)
+                self._connection.commit()
+        return (found, error)
+
+    def refresh(self, documents, ids, remove_missing=False, **options):
+        """ Returns (concepts, error) for the documents, identified by
+            ids, in input order; options are passed on to the backend's
+            extract_concepts. Concepts are indexed by document id.
+            Batches that fail are returned but not stored, so they are
+            retried by the next refresh; error is that of the first
+            failed batch.
+
+            With remove_missing, documents in the manifest whose id is
+            not in ids are deleted from it, for when documents holds the
+            whole collection.
+        """
+        documents = list(documents)
+        ids = [str(identifier) for identifier in ids]
+        if len(ids) != len(documents):
+            raise ValueError("ids and documents must have the same length.")
+        if len(set(ids)) != len(ids):
+            raise ValueError("ids must be unique.")
+
+        fingerprint = self.fingerprint(options)
+        digests = [content_hash(document) for document in documents]
+        entries = self._lookup(ids)
+        rows = dict()
+        stale = list()
+        for position, identifier in enumerate(ids):
+            entry = entries.get(identifier)
+            if entry is not None and entry[0] == digests[position] and entry[1] == fingerprint:
+                rows[identifier] = json.loads(entry[2])
+            else:
+                stale.append(position)
+        self.reused += len(ids) - len(stale)
+        self.annotated += len(stale)
+
+        error = None
+        for start in range(0, len(stale), self.batch_size):
+            batch = stale[start:start + self.batch_size]
+            found, batch_error = self._annotate([documents[position] for position in batch],
+                                                [ids[position] for position in batch],
+                                                [digests[position] for position in batch],
+                                                fingerprint, options)
+            rows.update(found)
+            if error is None:
+                error = batch_error
+
+        if remove_missing:
+            self.remove_missing(ids)
+
+        corpus = self.corpus_class()
+        for identifier in ids:
+            for row in rows[identifier]:
+                corpus.append(self.corpus_class.make_concept([identifier] + list(row)))
+        return (corpus, error)
+
+    def remove(self, ids):
+        """ Deletes the given document ids from the manifest. """
+        with self._lock:
+            self._connection.executemany('DELETE FROM documents WHERE id = ?',
+                                         [(str(identifier),) for identifier in ids])
+            self._connection.commit()
+
+    def remove_missing(self, ids):
+        """ Deletes every document whose id is not in ids from the
+            manifest.
+        """
+        keep = set(str(identifier) for identifier in ids)
+        with self._lock:
+            stored = [row[0] for row in self._connection.execute('SELECT id FROM documents')]
+        self.remove([identifier for identifier in stored if identifier not in keep])
+
+    def close(self):
+        with self._lock:
+            self._connection.close()
+
+    def stats(self):
+        return {'reused': self.reused, 'annotated': self.annotated, 'documents': len(self)}
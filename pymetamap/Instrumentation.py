@@ -0,0 +1,223 @@
+# Licensed under the Apache License, Version 2.0 (the "License");
+# you may not use this file except in compliance with the License.
+# You may obtain a copy of the License at
+#
+# http://www.apache.org/licenses/LICENSE-2.0
+#
+# Unless required by applicable law or agreed to in writing, software
+# distributed under the License is distributed on an "AS IS" BASIS,
+# WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.
+# See the License for the specific language governing permissions and
+# limitations under the License.
+
+import collections
+import contextlib
+import json
+import logging
+import threading
+import time
+
+COUNTERS = ('sentences', 'concepts', 'bytes_in', 'bytes_out', 'restarts',
+            'cache_hits', 'cache_misses', 'failed_sentences', 'bisections',
+            'duplicate_sentences')
+
+# Phases reported by the backends:
+#   spawn      starting the MetaMap process
+#   serialize  encoding and writing the input (on the writer thread)
+#   metamap    waiting for MetaMap's output
+#   parse      header skipping and building concepts from the output
+#   cache      looking sentences up in and storing them into the cache
+PHASES = ('spawn', 'serialize', 'metamap', 'parse', 'cache')
+
+
+class CallStats(object):
+    def __init__(self, backend):
+        """ Measurements of a single extract_concepts call: seconds spent
+            per phase and counters such as bytes written to and read from
+            MetaMap. Safe to update from several threads.
+        """
+        self.backend = backend
+        self.started = time.time()
+        self.seconds = 0.0
+        self.error = None
+        self.phases = collections.OrderedDict()
+        self.counters = dict((name, 0) for name in COUNTERS)
+        self._lock = threading.Lock()
+
+    def add(self, counter, amount=1):
+        with self._lock:
+            self.counters[counter] = self.counters.get(counter, 0) + amount
+
+    def add_time(self, phase, seconds):
+        with self._lock:
+            self.phases[phase] = self.phases.get(phase, 0.0) + seconds
+
+    def timer(self, phase):
+        """ Context manager adding the time spent in its block to phase. """
+        return _PhaseTimer(self, phase)
+
+    def count(self, counter, items):
+        """ Adds the number of items to counter. A sized collection is
+            returned as it is; any other iterable is returned wrapped so
+            that its items are counted as they are consumed (e.g. while
+            the input is written), without being read ahead.
+        """
+        if hasattr(items, '__len__'):
+            self.add(counter, len(items))
+            return items
+        return self._counting(counter, items)
+
+    def _counting(self, counter, items):
+        for item in items:
+            self.add(counter)
+            yield item
+
+    def as_dict(self):
+        result = {'backend': self.backend, 'started': self.started,
+                  'seconds': self.seconds, 'error': self.error,
+                  'phases': dict(self.phases)}
+        result.update(self.counters)
+        result['dedup_ratio'] = dedup_ratio(self.counters)
+        return result
+
+
+class NullStats(object):
+    """ Stands in for a CallStats when a backend has no instrumentation;
+        every measurement is discarded.
+    """
+    def add(self, counter, amount=1):
+        pass
+
+    def add_time(self, phase, seconds):
+        pass
+
+    def timer(self, phase):
+        return contextlib.nullcontext()
+
+    def count(self, counter, items):
+        return items
+
+
+NULL_STATS = NullStats()
+
+
+def dedup_ratio(counters):
+    """ Returns the share of sentences that were duplicates of an
+        earlier sentence of the same call, given a counters mapping.
+    """
+    if not counters.get('sentences'):
+        return 0.0
+    return counters.get('duplicate_sentences', 0) / float(counters['sentences'])
+
+
+class _PhaseTimer(object):
+    def __init__(self, stats, phase):
+        self.stats = stats
+        self.phase = phase
+
+    def __enter__(self):
+        self.started = time.perf_counter()
+        return self
+
+    def __exit__(self, exc_type, exc_value, traceback):
+        self.stats.add_time(self.phase, time.perf_counter() - self.started)
+
+
+class TimedLines(object):
+    def __init__(self, lines):
+        """ Iterates over lines while measuring the time spent waiting
+            for each of them and their total length.
+        """
+        self.lines = lines
+        self.waited = 0.0
+        self.size = 0
+
+    def __iter__(self):
+        lines = iter(self.lines)
+        while True:
+            started = time.perf_counter()
+            try:
+                line = next(lines)
+            except StopIteration:
+                return
+            finally:
+                self.waited += time.perf_counter() - started
+            self.size += len(line)
+            yield line
+
+    def record(self, stats, elapsed):
+        """ Adds the waiting time to the metamap phase, the rest of
+            elapsed to the parse phase and the length to bytes_out.
+        """
+        stats.add_time('metamap', self.waited)
+        stats.add_time('parse', max(elapsed - self.waited, 0.0))
+        stats.add('bytes_out', self.size)
+
+
+class Instrumentation(object):
+    def __init__(self, listeners=()):
+        """ Receives the CallStats of every extract_concepts call of the
+            backends it is passed to (as instrumentation=), keeps running
+            totals per backend and forwards each CallStats to the
+            listeners, which are callables taking it as their argument.
+        """
+        self.listeners = list(listeners)
+        self.totals = collections.defaultdict(lambda: collections.defaultdict(float))
+        self._lock = threading.Lock()
+
+    def add_listener(self, listener):
+        self.listeners.append(listener)
+
+    def record(self, stats):
+        with self._lock:
+            totals = self.totals[stats.backend]
+            totals['calls'] += 1
+            totals['seconds'] += stats.seconds
+            if stats.error is not None:
+                totals['errors'] += 1
+            for name, value in stats.counters.items():
+                totals[name] += value
+            for phase, seconds in stats.phases.items():
+                totals['phase_seconds:' + phase] += seconds
+        for listener in self.listeners:
+            listener(stats)
+
+    def snapshot(self):
+        """ Returns the running totals as {backend: {name: value}}. """
+        with self._lock:
+            return dict((backend, dict(totals)) for backend, totals in self.totals.items())
+
+    def to_prometheus(self, prefix='pymetamap'):
+        """ Renders the running totals in the Prometheus text format. """
+        metrics = collections.OrderedDict()
+        for backend, totals in sorted(self.snapshot().items()):
+            for name, value in sorted(totals.items()):
+                labels = 'backend="{0}"'.format(backend)
+                if name.startswith('phase_seconds:'):
+                    labels += ',phase="{0}"'.format(name.split(':', 1)[1])
+                    name = 'phase_seconds'
+                # Seconds keep every digit (repr, unlike '%g'); the other
+                # totals are counts.
+                if name in ('seconds', 'phase_seconds'):
+                    value = repr(float(value))
+                else:
+                    value = str(int(value))
+                metric = '{0}_{1}_total'.format(prefix, name)
+                metrics.setdefault(metric, []).append('{0}{{{1}}} {2}'.format(metric, labels, value))
+        lines = list()
+        for metric, samples in metrics.items():
+            lines.append('# TYPE {0} counter'.format(metric))
+            lines.extend(samples)
+        return '\n'.join(lines) + '\n'
+
+
+def log_listener(logger=None, level=logging.INFO):
+    """ Returns a listener writing every CallStats to logger as one JSON
+        object per call.
+    """
+    if logger is None:
+        logger = logging.getLogger('pymetamap')
+
+    def listener(stats):
+        logger.log(level, json.dumps(stats.as_dict(), sort_keys=True))
+    return listener
@@ -0,0 +1,63 @@
+# Licensed under the Apache License, Version 2.0 (the "License");
+# you may not use this file except in compliance with the License.
+# You may obtain a copy of the License at
+#
+# http://www.apache.org/licenses/LICENSE-2.0
+#
+# Unless required by applicable law or agreed to in writing, software
+# distributed under the License is distributed on an "AS IS" BASIS,
+# WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.
+# See the License for the specific language governing permissions and
+# limitations under the License.
+
+from collections import namedtuple
+
+FailedSentence = namedtuple('FailedSentence', ['id', 'sentence', 'error'])
+
+
+def extract_isolated(run, sentences, ids, corpus_class, stats=None):
+    """ Runs run(sentences, ids), which must return (concepts, error),
+        over the whole batch. A failing batch is split in halves which
+        are run again, recursively, until every sentence either
+        succeeds as part of a batch or fails on its own. Returns
+        (concepts, failed) where concepts holds the results of the
+        succeeding batches in input order and failed is a list of
+        FailedSentence(id, sentence, error) for the isolated sentences.
+
+        The partial output of a failed batch is discarded, since it
+        cannot be told apart from the output of the offending sentence.
+    """
+    sentences = list(sentences)
+    ids = list(ids)
+    concepts = corpus_class()
+    failed = list()
+
+    def attempt(start, end):
+        batch_concepts, error = run(sentences[start:end], ids[start:end])
+        if error is None:
+            concepts.extend(batch_concepts)
+            return
+        if end - start == 1:
+            failed.append(FailedSentence(ids[start], sentences[start], error))
+            if stats is not None:
+                stats.add('failed_sentences')
+            return
+        if stats is not None:
+            stats.add('bisections')
+        middle = (start + end) // 2
+        attempt(start, middle)
+        attempt(middle, end)
+
+    if sentences:
+        attempt(0, len(sentences))
+    return (concepts, failed)
+
+
+def describe_failures(failed):
+    """ Summarizes a list of FailedSentence as an error string, or None
+        if it is empty.
+    """
+    if not failed:
+        return None
+    return "ERROR: {0} sentence(s) failed: {1}".format(
+        len(failed), ', '.join(str(failure.id) for failure in failed))
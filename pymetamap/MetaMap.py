@@ -34,6 +34,7 @@ class MetaMap:
         assert isabs(self.metamap_filename), "metamap_filename: {0} should be an absolute path".format(self.metamap_filename)
         if version is None:
             version = DEFAULT_METAMAP_VERSION
+        self.version = version
 
     @abc.abstractmethod
     def extract_concepts(self, sentences=None, ids=None,
@@ -41,6 +42,13 @@ class MetaMap:
                          file_format='sldi', word_sense_disambiguation=True):
        """ Extract concepts from a list of sentences using MetaMap. """
 
+    @abc.abstractmethod
+    def iter_concepts(self, sentences=None, ids=None, filename=None,
+                      group_by_id=False, **options):
+        """ Yield concepts from sentences using MetaMap as they are
+            produced.
+        """
+
     @staticmethod
     def get_instance(metamap_filename, version=None, backend='subprocess',
                      **extra_args):
@@ -52,6 +60,15 @@ class MetaMap:
         if backend == 'subprocess':
             from .SubprocessBackend import SubprocessBackend
             return SubprocessBackend(**extra_args)
+        if backend == 'persistent':
+            from .PersistentBackend import PersistentBackend
+            return PersistentBackend(**extra_args)
+        if backend == 'pool':
+            from .PoolBackend import PoolBackend
+            return PoolBackend(**extra_args)
+        if backend == 'async':
+            from .AsyncSubprocessBackend import AsyncSubprocessBackend
+            return AsyncSubprocessBackend(**extra_args)
 
         raise ValueError("Unknown backend: %r (known backends: "
-                         "'subprocess')" % backend)
+                         "'subprocess', 'persistent', 'pool', 'async')" % backend)
@@ -37,6 +37,14 @@ class MetaMapLite:
         """ Extract concepts from a list of sentences using MetaMapLite. """
         return
 
+    @abc.abstractmethod
+    def iter_concepts(self, sentences=None, ids=None, filename=None,
+                      group_by_id=False, **options):
+        """ Yield concepts from sentences using MetaMapLite as they are
+            produced.
+        """
+        return
+
     @staticmethod
     def get_instance(metamap_home, backend='subprocess', **extra_args):
         extra_args.update(metamap_home=metamap_home)
@@ -45,6 +53,12 @@ class MetaMapLite:
         if backend == 'subprocess':
             from .SubprocessBackendLite import SubprocessBackendLite
             return SubprocessBackendLite(**extra_args)
+        if backend == 'persistent':
+            from .PersistentBackendLite import PersistentBackendLite
+            return PersistentBackendLite(**extra_args)
+        if backend == 'async':
+            from .AsyncSubprocessBackendLite import AsyncSubprocessBackendLite
+            return AsyncSubprocessBackendLite(**extra_args)
 
         raise ValueError("Unknown backend: %r (known backends: "
-                         "'subprocess')" % backend)
+                         "'subprocess', 'persistent', 'async')" % backend)
@@ -0,0 +1,68 @@
+# Licensed under the Apache License, Version 2.0 (the "License");
+# you may not use this file except in compliance with the License.
+# You may obtain a copy of the License at
+#
+# http://www.apache.org/licenses/LICENSE-2.0
+#
+# Unless required by applicable law or agreed to in writing, software
+# distributed under the License is distributed on an "AS IS" BASIS,
+# WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.
+# See the License for the specific language governing permissions and
+# limitations under the License.
+
+from .SubprocessBackend import SubprocessBackend
+from .PersistentProcess import PersistentSession
+from .Concept import Corpus
+
+
+class PersistentBackend(PersistentSession, SubprocessBackend):
+    def __init__(self, metamap_filename, version=None, timeout=300,
+                 max_restarts=1, sentinel_text='heart attack', cache=None,
+                 instrumentation=None, deduplicate=False, servers=None, server_index=0):
+        """ Interface to MetaMap that keeps one metamap process alive
+            between calls instead of paying the startup cost on every
+            extract_concepts call. Sentences are written to its stdin
+            and the end of each request is detected by a sentinel
+            sentence sent after the batch. Files passed as filename=
+            still run on a fresh process.
+
+            timeout is the number of seconds to wait for any line of
+            output before the process is considered hung. The process
+            is restarted and the batch resent up to max_restarts times.
+
+            Note: sentinel_text must produce at least one concept with
+                  the options in use (e.g. restrict_to_sts). It is sent
+                  alone to every new process; if it gets no answer
+                  within timeout, that call and all later calls with the
+                  same options return an error saying so.
+        """
+        SubprocessBackend.__init__(self, metamap_filename, version, cache,
+                                   instrumentation, deduplicate=deduplicate, servers=servers,
+                                   server_index=server_index)
+        self._init_session(timeout, max_restarts, sentinel_text)
+
+    def _extract_sentences(self, command, sentences, ids, stats=None):
+        """ Sends the sentences to the running metamap process and
+            returns (concepts, error). Without ids, sentences are
+            numbered by their position so that the sldiID input format
+            can be used.
+        """
+        sentences = list(sentences)
+        if ids is None:
+            ids = list(range(len(sentences)))
+        # The sentinel is recognised by its id, so input always has ids.
+        command = ['--sldiID' if arg == '--sldi' else arg for arg in command]
+        if not sentences:
+            return (Corpus(), None)
+
+        marker = self._next_marker()
+        payload = b''.join(self._format_input(sentences, ids))
+        payload += self._sentinel_line(marker)
+        # A changed server assignment restarts the process on the new servers.
+        command, env = self._server_options(command)
+        lines, error = self._request(command, payload, marker, stats=stats, env=env)
+        if stats is None:
+            return (Corpus.load(lines), error)
+        with stats.timer('parse'):
+            concepts = Corpus.load(lines)
+        return (concepts, error)
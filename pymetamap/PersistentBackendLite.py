@@ -0,0 +1,71 @@
+# Licensed under the Apache License, Version 2.0 (the "License");
+# you may not use this file except in compliance with the License.
+# You may obtain a copy of the License at
+#
+# http://www.apache.org/licenses/LICENSE-2.0
+#
+# Unless required by applicable law or agreed to in writing, software
+# distributed under the License is distributed on an "AS IS" BASIS,
+# WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.
+# See the License for the specific language governing permissions and
+# limitations under the License.
+
+import os
+from .SubprocessBackendLite import SubprocessBackendLite
+from .PersistentProcess import PersistentSession
+from .ConceptLite import CorpusLite
+
+
+class PersistentBackendLite(PersistentSession, SubprocessBackendLite):
+    def __init__(self, metamap_home, timeout=300, max_restarts=1,
+                 sentinel_text='heart attack', command=None, cache=None,
+                 instrumentation=None, deduplicate=False):
+        """ Interface to MetaMapLite that keeps one JVM running between
+            calls. metamaplite.sh is started once in --pipe mode and
+            every batch is written to its stdin; the end of a batch is
+            detected by a sentinel sentence sent after it.
+
+            command replaces the default
+            ['bash', '<metamap_home>/metamaplite.sh', '--pipe'] prefix,
+            e.g. to talk to a differently configured MetaMapLite or to a
+            stand-in script. It must read sldiwi lines from stdin and
+            write MMI rows to stdout.
+
+            Note: sentinel_text must produce at least one concept with
+                  the options in use (e.g. restrict_to_sts). It is sent
+                  alone to every new process; if it gets no answer
+                  within timeout, that call and all later calls with the
+                  same options return an error saying so.
+        """
+        SubprocessBackendLite.__init__(self, metamap_home=metamap_home, cache=cache,
+                                       instrumentation=instrumentation,
+                                       deduplicate=deduplicate)
+        if command is None:
+            command = ["bash", os.path.join(self.metamap_home, "metamaplite.sh"), '--pipe']
+        self.command = list(command)
+        self._init_session(timeout, max_restarts, sentinel_text)
+
+    def _extract_sentences(self, options, sentences, ids, stats=None):
+        """ Sends the sentences to the running MetaMapLite process and
+            returns (concepts, error). Without ids, sentences are
+            numbered by their position so that the sldiwi input format
+            can be used.
+        """
+        sentences = list(sentences)
+        if ids is None:
+            ids = list(range(len(sentences)))
+            options = options + ['--inputformat=sldiwi']
+        if not sentences:
+            return (CorpusLite(), None)
+
+        command = self.command + options + ['--outputformat=mmi']
+        marker = self._next_marker()
+        payload = b''.join(self._format_input(sentences, ids))
+        payload += self._sentinel_line(marker)
+        lines, error = self._request(command, payload, marker, cwd=self.metamap_home,
+                                     stats=stats)
+        if stats is None:
+            return (CorpusLite.load(lines), error)
+        with stats.timer('parse'):
+            concepts = CorpusLite.load(lines)
+        return (concepts, error)
@@ -0,0 +1,254 @@
+# Licensed under the Apache License, Version 2.0 (the "License");
+# you may not use this file except in compliance with the License.
+# You may obtain a copy of the License at
+#
+# http://www.apache.org/licenses/LICENSE-2.0
+#
+# Unless required by applicable law or agreed to in writing, software
+# distributed under the License is distributed on an "AS IS" BASIS,
+# WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.
+# See the License for the specific language governing permissions and
+# limitations under the License.
+
+import collections
+import itertools
+import queue
+import subprocess
+import threading
+import time
+
+
+class ProcessDied(Exception):
+    """ Raised when the child process exits while a reply is expected. """
+
+
+class PersistentProcess(object):
+    def __init__(self, command, cwd=None, env=None):
+        """ Keeps a single child process alive and exchanges lines with
+            it over stdin/stdout. stdout and stderr are drained by reader
+            threads so that reads can time out instead of blocking
+            forever on a hung process.
+        """
+        self.command = list(command)
+        self.cwd = cwd
+        self.env = env
+        self.process = None
+        self.starts = 0
+        self._lines = None
+        self._stderr = collections.deque(maxlen=20)
+
+    def start(self):
+        self.process = subprocess.Popen(self.command,
+                                        stdin=subprocess.PIPE,
+                                        stdout=subprocess.PIPE,
+                                        stderr=subprocess.PIPE,
+                                        cwd=self.cwd, env=self.env)
+        self.starts += 1
+        self._lines = queue.Queue()
+        self._stderr.clear()
+        for target, stream in ((self._read_stdout, self.process.stdout),
+                               (self._read_stderr, self.process.stderr)):
+            thread = threading.Thread(target=target, args=(stream, self._lines))
+            thread.daemon = True
+            thread.start()
+
+    @staticmethod
+    def _read_stdout(stream, lines):
+        for line in iter(stream.readline, b''):
+            lines.put(line)
+        # None marks end of output, i.e. the process went away.
+        lines.put(None)
+
+    def _read_stderr(self, stream, lines):
+        for line in iter(stream.readline, b''):
+            self._stderr.append(line.decode('utf8', 'replace').rstrip())
+
+    def is_alive(self):
+        return self.process is not None and self.process.poll() is None
+
+    def ensure_started(self):
+        if not self.is_alive():
+            self.close()
+            self.start()
+
+    def write(self, data):
+        try:
+            self.process.stdin.write(data)
+            self.process.stdin.flush()
+        except (IOError, OSError):
+            raise ProcessDied(self.describe_exit())
+
+    def readline(self, timeout=None):
+        """ Returns the next decoded line of stdout. Raises queue.Empty
+            on timeout and ProcessDied once the output is exhausted.
+        """
+        line = self._lines.get(timeout=timeout)
+        if line is None:
+            # Keep the marker around for any further reads.
+            self._lines.put(None)
+            raise ProcessDied(self.describe_exit())
+        return line.decode('utf8', 'replace')
+
+    def describe_exit(self):
+        returncode = None
+        if self.process is not None:
+            try:
+                returncode = self.process.wait(timeout=1)
+            except subprocess.TimeoutExpired:
+                pass
+        message = "ERROR: process exited with code {0}".format(returncode)
+        if self._stderr:
+            message += ": " + self._stderr[-1]
+        return message
+
+    def close(self, grace=5):
+        """ Closes stdin and waits up to grace seconds for the process
+            to exit before killing it.
+        """
+        process, self.process = self.process, None
+        if process is None:
+            return
+        try:
+            process.stdin.close()
+        except (IOError, OSError):
+            pass
+        try:
+            process.wait(timeout=grace)
+        except subprocess.TimeoutExpired:
+            process.kill()
+            process.wait()
+        process.stdout.close()
+        process.stderr.close()
+
+
+class SentinelUnanswered(Exception):
+    """ Raised when a freshly started process gives no output row for the
+        sentinel sentence alone.
+    """
+
+
+class PersistentSession(object):
+    """ Mixin for backends that keep one process alive between calls.
+        Each request is terminated by a sentinel input line whose id
+        starts with MARKER_PREFIX; the request is complete once the
+        output row for that id has been read. Every new process is first
+        sent the sentinel alone, so that a sentinel_text which produces
+        no output is reported once instead of every request waiting for
+        the timeout.
+    """
+    MARKER_PREFIX = 'pymetamapEOB'
+
+    def _init_session(self, timeout, max_restarts, sentinel_text):
+        self.timeout = timeout
+        self.max_restarts = max_restarts
+        self.sentinel_text = sentinel_text
+        self.restarts = 0
+        self._session = None
+        self._sentinel_error = None
+        self._batches = itertools.count()
+        self._lock = threading.Lock()
+
+    def close(self):
+        """ Stops the kept-alive process, if running. """
+        with self._lock:
+            if self._session is not None:
+                self._session.close()
+                self._session = None
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, exc_type, exc_value, traceback):
+        self.close()
+
+    def _next_marker(self):
+        return '{0}{1}'.format(self.MARKER_PREFIX, next(self._batches))
+
+    def _request(self, command, payload, marker, cwd=None, stats=None, env=None):
+        """ Sends payload, which must end with the sentinel line for
+            marker, to the process running command (starting or
+            replacing it as needed) and returns (lines, error) where
+            lines are the output rows of this request. The request is
+            retried on a fresh process up to max_restarts times.
+        """
+        with self._lock:
+            if self._session is None or self._session.command != command or \
+                    self._session.env != env:
+                if self._session is not None:
+                    self._session.close()
+                self._session = PersistentProcess(command, cwd=cwd, env=env)
+                self._sentinel_error = None
+            if self._sentinel_error is not None:
+                return ([], self._sentinel_error)
+
+            attempt = 0
+            while True:
+                started = time.perf_counter()
+                lines, error = self._exchange(payload, marker)
+                if stats is not None:
+                    stats.add_time('metamap', time.perf_counter() - started)
+                    stats.add('bytes_in', len(payload))
+                    stats.add('bytes_out', sum(len(line) + 1 for line in lines))
+                if error is None or attempt >= self.max_restarts or \
+                        self._sentinel_error is not None:
+                    return (lines, error)
+                attempt += 1
+                self.restarts += 1
+                if stats is not None:
+                    stats.add('restarts')
+
+    def _sentinel_line(self, marker):
+        """ Returns the encoded sentinel input line for marker. """
+        return b''.join(self._format_input([self.sentinel_text], [marker]))
+
+    def _read_reply(self, session, marker, lines):
+        """ Appends the output rows to lines until the row for marker. """
+        while True:
+            line = session.readline(self.timeout).rstrip('\r\n')
+            fields = line.split('|', 2)
+            # Skip the command echo and anything else that is not MMI.
+            if len(fields) < 2 or fields[1] not in ['MMI', 'AA', 'UA']:
+                continue
+            identifier = fields[0].strip('\'"')
+            if identifier == marker:
+                return
+            if identifier.startswith(self.MARKER_PREFIX):
+                # Trailing rows of an earlier request's sentinel.
+                continue
+            lines.append(line)
+
+    def _start(self, session):
+        """ (Re)starts the process and checks that the sentinel alone is
+            answered.
+        """
+        session.ensure_started()
+        marker = self._next_marker()
+        session.write(self._sentinel_line(marker))
+        try:
+            self._read_reply(session, marker, [])
+        except queue.Empty:
+            raise SentinelUnanswered(
+                "ERROR: sentinel_text {0!r} produced no output within {1} seconds; it must "
+                "produce at least one concept with the options in use".format(
+                    self.sentinel_text, self.timeout))
+
+    def _exchange(self, payload, marker):
+        session = self._session
+        lines = []
+        try:
+            if not session.is_alive():
+                self._start(session)
+            session.write(payload)
+            self._read_reply(session, marker, lines)
+        except SentinelUnanswered as e:
+            session.close(grace=0)
+            self._sentinel_error = str(e)
+            return (lines, self._sentinel_error)
+        except queue.Empty:
+            # A hung process will not exit on its own.
+            session.close(grace=0)
+            return (lines, "ERROR: no response within {0} seconds".format(self.timeout))
+        except ProcessDied as e:
+            session.close()
+            return (lines, str(e))
+        return (lines, None)
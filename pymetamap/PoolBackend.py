@@ -0,0 +1,191 @@
+# Licensed under the Apache License, Version 2.0 (the "License");
+# you may not use this file except in compliance with the License.
+# You may obtain a copy of the License at
+#
+# http://www.apache.org/licenses/LICENSE-2.0
+#
+# Unless required by applicable law or agreed to in writing, software
+# distributed under the License is distributed on an "AS IS" BASIS,
+# WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.
+# See the License for the specific language governing permissions and
+# limitations under the License.
+
+import multiprocessing
+import queue
+import threading
+from .SubprocessBackend import SubprocessBackend
+from .PersistentBackend import PersistentBackend
+from .Concept import Corpus
+from .Isolation import extract_isolated, FailedSentence
+
+
+class PoolBackend(SubprocessBackend):
+    def __init__(self, metamap_filename, version=None, pool_size=None,
+                 batch_size=100, queue_depth=None, worker_backend='subprocess',
+                 cache=None, instrumentation=None, batch_timeout=None,
+                 deduplicate=False, servers=None, **worker_args):
+        """ Interface to MetaMap that shards the input into batches of
+            batch_size sentences (or lines, for filename=) and runs them
+            on pool_size concurrent metamap processes. At most
+            queue_depth batches wait for a free worker at any time.
+            Results are merged back in the original input order.
+
+            worker_backend selects how each worker runs its batches:
+            'subprocess' starts a metamap process per batch while
+            'persistent' keeps one metamap process per worker alive;
+            worker_args are passed on to the PersistentBackend workers.
+            Batches read from a file always run on a fresh process.
+            batch_timeout applies to the 'subprocess' workers; pass
+            timeout= for 'persistent' ones.
+
+            With instrumentation, the phase timings of all batches are
+            summed, so they can exceed the wall-clock time of the call.
+
+            servers is an optional ServerManager whose tagger and WSD
+            servers are assigned to the workers round-robin, anew for
+            every metamap process a worker starts.
+        """
+        SubprocessBackend.__init__(self, metamap_filename, version, cache,
+                                   instrumentation, batch_timeout, deduplicate)
+        if pool_size is None:
+            pool_size = multiprocessing.cpu_count()
+        if queue_depth is None:
+            queue_depth = 2 * pool_size
+        if pool_size < 1 or batch_size < 1 or queue_depth < 1:
+            raise ValueError("pool_size, batch_size and queue_depth must be positive.")
+        if worker_backend not in ['subprocess', 'persistent']:
+            raise ValueError("worker_backend must be either subprocess or persistent")
+        self.pool_size = pool_size
+        self.batch_size = batch_size
+        self.queue_depth = queue_depth
+        self.worker_backend = worker_backend
+        self._workers = list()
+        for worker_index in range(pool_size):
+            if worker_backend == 'persistent':
+                self._workers.append(PersistentBackend(metamap_filename, version, servers=servers,
+                                                       server_index=worker_index, **worker_args))
+            else:
+                self._workers.append(SubprocessBackend(metamap_filename, version,
+                                                       batch_timeout=batch_timeout,
+                                                       servers=servers,
+                                                       server_index=worker_index))
+
+    def close(self):
+        """ Stops any metamap processes kept alive by the workers. """
+        for worker in self._workers:
+            if isinstance(worker, PersistentBackend):
+                worker.close()
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, exc_type, exc_value, traceback):
+        self.close()
+
+    def _batches(self, sentences, ids):
+        sentences = list(sentences)
+        if ids is not None:
+            ids = list(ids)
+        elif self.worker_backend == 'persistent':
+            # Persistent workers number sentences without ids by their
+            # position, which must be the position in the whole input.
+            ids = list(range(len(sentences)))
+        batch_ids = None
+        for start in range(0, len(sentences), self.batch_size):
+            if ids is not None:
+                batch_ids = ids[start:start + self.batch_size]
+            yield (sentences[start:start + self.batch_size], batch_ids)
+
+    def _extract_sentences(self, command, sentences, ids, stats=None):
+        return self._map(self._batches(sentences, ids), lambda worker, batch:
+                         worker._extract_sentences(command, batch[0], batch[1], stats))
+
+    def _extract_isolated(self, command, sentences, ids, stats=None):
+        """ Bisects failing batches on the worker that ran them, so the
+            other batches keep running on the rest of the pool. Each
+            attempt consults the cache if there is one.
+        """
+        def run(worker, batch):
+            if self.cache is not None or self.deduplicate:
+                extract = lambda sentences, ids: self._extract_cached(
+                    command, sentences, ids, stats, worker._extract_sentences)
+            else:
+                extract = lambda sentences, ids: worker._extract_sentences(command, sentences, ids, stats)
+            try:
+                return extract_isolated(extract, batch[0], batch[1], Corpus, stats)
+            except Exception as e:
+                error = "ERROR: {0}".format(e)
+                return (Corpus(), [FailedSentence(identifier, sentence, error)
+                                   for identifier, sentence in zip(batch[1], batch[0])])
+
+        concepts = Corpus()
+        failed = list()
+        for batch_concepts, batch_failed in self._run_batches(self._batches(sentences, ids), run):
+            concepts.extend(batch_concepts)
+            failed.extend(batch_failed)
+        return (concepts, failed)
+
+    def _extract_file(self, command, filename, stats=None):
+        def batches():
+            with open(filename, 'rb') as input_file:
+                batch = list()
+                for line in input_file:
+                    if not line.endswith(b'\n'):
+                        line += b'\n'
+                    batch.append(line)
+                    if len(batch) == self.batch_size:
+                        yield batch
+                        batch = list()
+                if batch:
+                    yield batch
+
+        return self._map(batches(), lambda worker, batch:
+                         SubprocessBackend._run_input(worker, command, batch, stats))
+
+    def _map(self, batches, run):
+        """ Runs run(worker, batch) for every batch on the worker threads
+            and returns the merged (concepts, error).
+        """
+        concepts = Corpus()
+        errors = list()
+        for batch_concepts, batch_error in self._run_batches(batches, run):
+            concepts.extend(batch_concepts)
+            if batch_error is not None:
+                errors.append(batch_error)
+        error = '\n'.join(errors) if errors else None
+        return (concepts, error)
+
+    def _run_batches(self, batches, run):
+        """ Runs run(worker, batch) for every batch on the worker threads
+            and returns the results in batch order.
+        """
+        pending = queue.Queue(maxsize=self.queue_depth)
+        results = dict()
+
+        def work(worker):
+            while True:
+                item = pending.get()
+                if item is None:
+                    break
+                number, batch = item
+                try:
+                    results[number] = run(worker, batch)
+                except Exception as e:
+                    results[number] = (Corpus(), "ERROR: {0}".format(e))
+
+        threads = list()
+        for worker in self._workers:
+            thread = threading.Thread(target=work, args=(worker,))
+            thread.daemon = True
+            thread.start()
+            threads.append(thread)
+        try:
+            for item in enumerate(batches):
+                pending.put(item)
+        finally:
+            for _ in threads:
+                pending.put(None)
+            for thread in threads:
+                thread.join()
+
+        return [results[number] for number in sorted(results)]
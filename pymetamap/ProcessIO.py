@@ -0,0 +1,211 @@
+# Licensed under the Apache License, Version 2.0 (the "License");
+# you may not use this file except in compliance with the License.
+# You may obtain a copy of the License at
+#
+# http://www.apache.org/licenses/LICENSE-2.0
+#
+# Unless required by applicable law or agreed to in writing, software
+# distributed under the License is distributed on an "AS IS" BASIS,
+# WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.
+# See the License for the specific language governing permissions and
+# limitations under the License.
+
+import codecs
+import os
+import signal
+import subprocess
+import threading
+import time
+
+WRITE_CHUNK_SIZE = 64 * 1024
+READ_CHUNK_SIZE = 64 * 1024
+
+
+class ProcessFailed(Exception):
+    """ Raised when a MetaMap process exits with a non-zero status while
+        its output is being streamed.
+    """
+
+
+def write_input(stream, input_lines, chunk_size=WRITE_CHUNK_SIZE, stats=None):
+    """ Writes the encoded input lines to stream in chunks of about
+        chunk_size bytes and closes it. A process that exits early
+        (closing its end of the pipe) is not treated as an error here;
+        its exit status reports the failure. The time spent producing
+        the input, excluding waiting on the pipe, is added to the
+        serialize phase of stats.
+    """
+    started = time.perf_counter()
+    blocked = 0.0
+    written = 0
+    try:
+        chunk = list()
+        size = 0
+        for line in input_lines:
+            chunk.append(line)
+            size += len(line)
+            if size >= chunk_size:
+                data = b''.join(chunk)
+                write_started = time.perf_counter()
+                stream.write(data)
+                blocked += time.perf_counter() - write_started
+                written += len(data)
+                chunk = list()
+                size = 0
+        if chunk:
+            data = b''.join(chunk)
+            write_started = time.perf_counter()
+            stream.write(data)
+            blocked += time.perf_counter() - write_started
+            written += len(data)
+    except (IOError, OSError):
+        pass
+    finally:
+        try:
+            stream.close()
+        except (IOError, OSError):
+            pass
+        if stats is not None:
+            stats.add_time('serialize', time.perf_counter() - started - blocked)
+            stats.add('bytes_in', written)
+
+
+def start_writer(stream, input_lines, stats=None):
+    """ Runs write_input on a background thread so that the process's
+        output can be consumed while its input is still being written.
+    """
+    writer = threading.Thread(target=write_input, args=(stream, input_lines),
+                              kwargs={'stats': stats})
+    writer.daemon = True
+    writer.start()
+    return writer
+
+
+def process_environment(environment):
+    """ Returns the Popen env for a process run with the given extra
+        environment variables, or None to inherit ours unchanged.
+    """
+    if not environment:
+        return None
+    variables = dict(os.environ)
+    variables.update(environment)
+    return variables
+
+
+def popen_options(timeout):
+    """ Returns extra Popen arguments for a process that a Watchdog
+        with the given timeout may have to kill.
+    """
+    if timeout is not None and os.name == 'posix':
+        return {'start_new_session': True}
+    return {}
+
+
+class Watchdog(object):
+    def __init__(self, process, timeout):
+        """ Kills process if it is still running after timeout seconds.
+            expired tells whether that happened. A timeout of None
+            never fires. If the process leads its own process group
+            (see popen_options) the whole group is killed, since the
+            metamap script runs the actual tagger as child processes.
+        """
+        self.process = process
+        self.timeout = timeout
+        self.expired = False
+        self._timer = None
+        if timeout is not None:
+            self._timer = threading.Timer(timeout, self._expire)
+            self._timer.daemon = True
+            self._timer.start()
+
+    def _expire(self):
+        if self.process.poll() is None:
+            self.expired = True
+            try:
+                if hasattr(os, 'killpg') and os.getpgid(self.process.pid) == self.process.pid:
+                    os.killpg(self.process.pid, signal.SIGKILL)
+                else:
+                    self.process.kill()
+            except OSError:
+                pass
+
+    def cancel(self):
+        if self._timer is not None:
+            self._timer.cancel()
+
+
+def _iter_process(command, read, input_lines=None, input_filename=None, cwd=None, env=None):
+    """ Starts command, feeds it input_lines (or the contents of
+        input_filename) on stdin and yields what read makes of its
+        stdout. Raises ProcessFailed if the process exits with a
+        non-zero status. The process is killed if the consumer stops
+        iterating early.
+    """
+    input_file = None
+    if input_filename is not None:
+        input_file = open(input_filename, 'rb')
+    try:
+        process = subprocess.Popen(command,
+                                   stdin=input_file if input_file is not None else subprocess.PIPE,
+                                   stdout=subprocess.PIPE,
+                                   cwd=cwd, env=env)
+    except BaseException:
+        if input_file is not None:
+            input_file.close()
+        raise
+
+    writer = None
+    try:
+        if input_file is None:
+            writer = start_writer(process.stdin, input_lines or ())
+        for item in read(process.stdout):
+            yield item
+        returncode = process.wait()
+        if returncode != 0:
+            raise ProcessFailed("ERROR: MetaMap failed with exit code {0}".format(returncode))
+    finally:
+        if process.poll() is None:
+            process.kill()
+            process.wait()
+        if writer is not None:
+            writer.join()
+        process.stdout.close()
+        if input_file is not None:
+            input_file.close()
+
+
+def _read_lines(stdout):
+    for line in stdout:
+        yield line.decode('utf8', 'replace').rstrip('\r\n')
+
+
+def _read_text(stdout):
+    decoder = codecs.getincrementaldecoder('utf8')('replace')
+    while True:
+        data = stdout.read1(READ_CHUNK_SIZE)
+        if not data:
+            break
+        text = decoder.decode(data)
+        if text:
+            yield text
+    text = decoder.decode(b'', True)
+    if text:
+        yield text
+
+
+def iter_process_lines(command, input_lines=None, input_filename=None, cwd=None, env=None):
+    """ Starts command, feeds it input_lines (or the contents of
+        input_filename) on stdin and yields its decoded stdout lines as
+        they are produced. Raises ProcessFailed if the process exits
+        with a non-zero status. The process is killed if the consumer
+        stops iterating early.
+    """
+    return _iter_process(command, _read_lines, input_lines, input_filename, cwd, env)
+
+
+def iter_process_text(command, input_lines=None, input_filename=None, cwd=None, env=None):
+    """ Like iter_process_lines, but yields the decoded stdout in chunks
+        of whatever size is available, for output that is not split
+        into lines (such as MetaMap's JSON).
+    """
+    return _iter_process(command, _read_text, input_lines, input_filename, cwd, env)
@@ -0,0 +1,295 @@
+# Licensed under the Apache License, Version 2.0 (the "License");
+# you may not use this file except in compliance with the License.
+# You may obtain a copy of the License at
+#
+# http://www.apache.org/licenses/LICENSE-2.0
+#
+# Unless required by applicable law or agreed to in writing, software
+# distributed under the License is distributed on an "AS IS" BASIS,
+# WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.
+# See the License for the specific language governing permissions and
+# limitations under the License.
+
+import collections
+import os
+import socket
+import subprocess
+import threading
+import time
+
+TAGGER_PORT = 1795
+WSD_PORT = 5554
+
+# How metamap is told which server to use: the host as a command line
+# option, the port through the environment of its start script.
+HOST_OPTIONS = {'tagger': '--tagger_server', 'wsd': '--WSD_SERVER'}
+PORT_VARIABLES = {'tagger': 'TAGGER_SERVER_PORT', 'wsd': 'WSD_SERVER_PORT'}
+
+# Request sent by check(); both servers answer a line of text.
+PROBE = b'heart attack\n'
+
+# Control scripts of a MetaMap installation, in <public_mm>/bin.
+CONTROL_SCRIPTS = {'tagger': 'skrmedpostctl', 'wsd': 'wsdserverctl'}
+
+ServerAssignment = collections.namedtuple('ServerAssignment', ['arguments', 'environment'])
+
+
+class ServerUnavailable(Exception):
+    """ Raised when a tagger or WSD server does not accept connections
+        within the start timeout.
+    """
+
+
+def as_assignment(servers, worker_index=0):
+    """ Returns the ServerAssignment for servers, which may be a
+        ServerManager, a ServerAssignment or None.
+    """
+    if servers is None or isinstance(servers, ServerAssignment):
+        return servers
+    return servers.assignment(worker_index)
+
+
+class ManagedServer(object):
+    def __init__(self, kind, host, port, command=None, stop_command=None, history=100,
+                 probe=PROBE):
+        """ A tagger or WSD server listening on host:port. command, if
+            given, starts it: a long running server process which stop()
+            terminates or, with stop_command, a control script which
+            starts the server in the background and exits. Without
+            command the server is only health-checked.
+
+            Every check() sends the server probe and records how long
+            it took to answer; the last history latencies are kept.
+        """
+        self.kind = kind
+        self.host = host
+        self.port = port
+        self.command = command
+        self.stop_command = stop_command
+        self.probe = probe
+        self.latencies = collections.deque(maxlen=history)
+        self.checks = 0
+        self.failures = 0
+        self.restarts = 0
+        self.healthy = None
+        self.owned = False
+        self.process = None
+
+    @property
+    def name(self):
+        return '{0}:{1}:{2}'.format(self.kind, self.host, self.port)
+
+    def check(self, timeout=5):
+        """ Sends probe to the server and returns the seconds until it
+            answered (or closed the connection), or None if it did not
+            accept a connection or answer within timeout. A server which
+            accepts connections but is hung or overloaded is therefore
+            reported too.
+        """
+        self.checks += 1
+        started = time.perf_counter()
+        try:
+            connection = socket.create_connection((self.host, self.port), timeout)
+            try:
+                connection.settimeout(max(timeout - (time.perf_counter() - started), 0.001))
+                connection.sendall(self.probe)
+                connection.recv(1)
+            finally:
+                connection.close()
+        except (IOError, OSError):
+            self.failures += 1
+            self.healthy = False
+            return None
+        latency = time.perf_counter() - started
+        self.latencies.append(latency)
+        self.healthy = True
+        return latency
+
+    def launch(self):
+        """ Runs command, unless the server is already accepting
+            connections. Returns whether it was run.
+        """
+        if self.command is None or self.check() is not None:
+            return False
+        if self.stop_command is not None:
+            subprocess.call(self.command, stdout=subprocess.DEVNULL)
+        else:
+            self.process = subprocess.Popen(self.command, stdin=subprocess.DEVNULL,
+                                            stdout=subprocess.DEVNULL)
+        self.owned = True
+        return True
+
+    def wait(self, timeout):
+        """ Waits until the server accepts connections and raises
+            ServerUnavailable after timeout seconds.
+        """
+        deadline = time.time() + timeout
+        while self.check(timeout=max(min(deadline - time.time(), 5), 0.01)) is None:
+            if self.process is not None and self.process.poll() is not None:
+                raise ServerUnavailable("{0} exited with status {1}".format(
+                    self.name, self.process.returncode))
+            if time.time() >= deadline:
+                raise ServerUnavailable("{0} did not start within {1} seconds".format(
+                    self.name, timeout))
+            time.sleep(0.1)
+
+    def stop(self):
+        """ Stops the server if it was started by launch(). """
+        if not self.owned:
+            return
+        if self.stop_command is not None:
+            subprocess.call(self.stop_command, stdout=subprocess.DEVNULL)
+        elif self.process is not None and self.process.poll() is None:
+            self.process.terminate()
+            try:
+                self.process.wait(5)
+            except subprocess.TimeoutExpired:
+                self.process.kill()
+                self.process.wait()
+        self.process = None
+        self.owned = False
+
+    def stats(self):
+        latencies = list(self.latencies)
+        return {'host': self.host, 'port': self.port, 'healthy': self.healthy,
+                'checks': self.checks, 'failures': self.failures, 'restarts': self.restarts,
+                'last_latency': latencies[-1] if latencies else None,
+                'mean_latency': sum(latencies) / len(latencies) if latencies else None,
+                'max_latency': max(latencies) if latencies else None}
+
+
+class ServerManager(object):
+    def __init__(self, public_mm=None, tagger_ports=(TAGGER_PORT,), wsd_ports=(WSD_PORT,),
+                 host='localhost', tagger_command=None, wsd_command=None,
+                 start_timeout=300, check_timeout=5):
+        """ Starts, health-checks and shares out the SKR/MedPost tagger
+            and WSD servers MetaMap depends on. One server runs on each
+            of tagger_ports and wsd_ports; pass an empty list to leave
+            one kind out (the WSD server is only used with
+            word_sense_disambiguation).
+
+            tagger_command and wsd_command start one server and may
+            contain '{port}', which is replaced by its port; they allow
+            several servers per kind, or a local stand-in. Otherwise,
+            if public_mm (the MetaMap installation directory) is given,
+            its skrmedpostctl and wsdserverctl scripts are used, which
+            only start a server on the default port. Servers that are
+            already running are used as they are, and with neither
+            option they are only monitored.
+
+            Workers are given servers round-robin by assignment(), so
+            with as many servers as workers no worker waits on
+            another's requests. Backends ask for their assignment every
+            time they start a metamap process, so servers found
+            unhealthy by a check are skipped from then on.
+        """
+        self.host = host
+        self.start_timeout = start_timeout
+        self.check_timeout = check_timeout
+        self.servers = list()
+        for kind, ports, command in (('tagger', tagger_ports, tagger_command),
+                                     ('wsd', wsd_ports, wsd_command)):
+            ports = list(ports)
+            stop_command = None
+            if command is None and public_mm is not None and ports:
+                if len(ports) > 1:
+                    raise ValueError("{0} only starts a server on its default port; pass "
+                                     "{1}_command to run several.".format(CONTROL_SCRIPTS[kind], kind))
+                script = os.path.join(public_mm, 'bin', CONTROL_SCRIPTS[kind])
+                command = [script, 'start']
+                stop_command = [script, 'stop']
+            for port in ports:
+                server_command = None
+                if command is not None:
+                    server_command = [argument.replace('{port}', str(port)) for argument in command]
+                self.servers.append(ManagedServer(kind, host, port, server_command, stop_command))
+        self._monitor = None
+        self._stopping = threading.Event()
+
+    def _kind(self, kind):
+        return [server for server in self.servers if server.kind == kind]
+
+    def start(self):
+        """ Starts every server which is not already running and waits
+            until all of them accept connections.
+        """
+        for server in self.servers:
+            server.launch()
+        deadline = time.time() + self.start_timeout
+        for server in self.servers:
+            server.wait(max(deadline - time.time(), 0))
+
+    def ensure(self):
+        """ Checks every server and restarts the ones that stopped
+            accepting connections and can be started. Returns the
+            servers that were restarted.
+        """
+        restarted = list()
+        for server in self.servers:
+            if server.check(self.check_timeout) is None and server.command is not None:
+                server.stop()
+                server.launch()
+                server.restarts += 1
+                restarted.append(server)
+        for server in restarted:
+            try:
+                server.wait(self.start_timeout)
+            except ServerUnavailable:
+                pass
+        return restarted
+
+    def monitor(self, interval=30):
+        """ Runs ensure() every interval seconds on a background thread
+            until stop() is called.
+        """
+        if self._monitor is not None:
+            return
+
+        def run():
+            while not self._stopping.wait(interval):
+                self.ensure()
+
+        self._stopping.clear()
+        self._monitor = threading.Thread(target=run)
+        self._monitor.daemon = True
+        self._monitor.start()
+
+    def stop(self):
+        """ Stops the monitor and every server started by this manager. """
+        if self._monitor is not None:
+            self._stopping.set()
+            self._monitor.join()
+            self._monitor = None
+        for server in self.servers:
+            server.stop()
+
+    def __enter__(self):
+        self.start()
+        return self
+
+    def __exit__(self, exc_type, exc_value, traceback):
+        self.stop()
+
+    def assignment(self, worker_index):
+        """ Returns the ServerAssignment of a worker: the metamap
+            arguments and environment variables pointing it at one
+            server of each kind, chosen round-robin among the healthy
+            ones.
+        """
+        arguments = list()
+        environment = dict()
+        for kind in ('tagger', 'wsd'):
+            servers = self._kind(kind)
+            servers = [server for server in servers if server.healthy is not False] or servers
+            if not servers:
+                continue
+            server = servers[worker_index % len(servers)]
+            arguments.extend([HOST_OPTIONS[kind], server.host])
+            environment[PORT_VARIABLES[kind]] = str(server.port)
+        return ServerAssignment(arguments, environment)
+
+    def stats(self):
+        """ Returns the health and request latency of every server,
+            keyed by kind:host:port.
+        """
+        return dict((server.name, server.stats()) for server in self.servers)
@@ -0,0 +1,326 @@
+# Licensed under the Apache License, Version 2.0 (the "License");
+# you may not use this file except in compliance with the License.
+# You may obtain a copy of the License at
+#
+# http://www.apache.org/licenses/LICENSE-2.0
+#
+# Unless required by applicable law or agreed to in writing, software
+# distributed under the License is distributed on an "AS IS" BASIS,
+# WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.
+# See the License for the specific language governing permissions and
+# limitations under the License.
+
+""" Typed objects for MetaMap's JSON output (--JSONn) and MetaMapLite's
+    JSON and brat outputs, and decoders which build them incrementally
+    from a stream of text, one document at a time.
+"""
+
+import json
+import re
+from collections import namedtuple
+
+Span = namedtuple('Span', ('start', 'length'))
+
+Candidate = namedtuple('Candidate', ('score', 'cui', 'matched', 'preferred_name',
+                                     'matched_words', 'semtypes', 'sources', 'spans',
+                                     'is_head', 'is_overmatch', 'negated'))
+
+Mapping = namedtuple('Mapping', ('score', 'candidates'))
+
+Phrase = namedtuple('Phrase', ('text', 'start', 'length', 'candidates', 'mappings'))
+
+Negation = namedtuple('Negation', ('type', 'trigger', 'trigger_spans', 'cuis', 'spans'))
+
+Utterance = namedtuple('Utterance', ('id', 'section', 'number', 'text', 'start', 'length',
+                                     'phrases', 'negations'))
+
+LiteEvidence = namedtuple('LiteEvidence', ('id', 'score', 'matched_text', 'start', 'length',
+                                           'cui', 'preferred_name', 'concept_string',
+                                           'semtypes', 'sources'))
+
+LiteEntity = namedtuple('LiteEntity', ('id', 'document_id', 'field_id', 'matched_text',
+                                       'start', 'length', 'negated', 'evidence'))
+
+BratAnnotation = namedtuple('BratAnnotation', ('id', 'type', 'spans', 'text', 'cuis',
+                                               'notes', 'attributes'))
+
+WHITESPACE = ' \t\r\n'
+READ_SIZE = 64 * 1024
+CUI_PATTERN = re.compile(r'C\d{7}')
+
+
+class StreamDecoder(object):
+    def __init__(self, chunks):
+        """ Decodes JSON values one at a time from an iterable of text
+            chunks (e.g. the lines of a process's output, with their
+            line breaks). Only the value being decoded is held in
+            memory, not the whole output.
+        """
+        self.chunks = iter(chunks)
+        self.decoder = json.JSONDecoder()
+        self.buffer = ''
+        self.position = 0
+
+    def _fill(self, size=READ_SIZE):
+        """ Appends about size more characters to the buffer. Returns
+            False at the end of the stream.
+        """
+        parts = [self.buffer[self.position:]]
+        added = 0
+        for chunk in self.chunks:
+            parts.append(chunk)
+            added += len(chunk)
+            if added >= size:
+                break
+        self.buffer = ''.join(parts)
+        self.position = 0
+        return added > 0
+
+    def peek(self):
+        """ Returns the next character that is not whitespace, or None
+            at the end of the stream.
+        """
+        while True:
+            while self.position < len(self.buffer) and self.buffer[self.position] in WHITESPACE:
+                self.position += 1
+            if self.position < len(self.buffer):
+                return self.buffer[self.position]
+            if not self._fill():
+                return None
+
+    def skip(self):
+        self.position += 1
+
+    def skip_line(self):
+        """ Skips to the start of the next line (non-JSON output). """
+        while True:
+            end = self.buffer.find('\n', self.position)
+            if end >= 0:
+                self.position = end + 1
+                return
+            self.position = len(self.buffer)
+            if not self._fill():
+                return
+
+    def find(self, text):
+        """ Skips past the next occurrence of text. Returns False if the
+            stream ends first.
+        """
+        while True:
+            found = self.buffer.find(text, self.position)
+            if found >= 0:
+                self.position = found + len(text)
+                return True
+            # Keep a possible partial match at the end of the buffer.
+            self.position = max(self.position, len(self.buffer) - len(text) + 1)
+            if not self._fill():
+                return False
+
+    def value(self):
+        """ Decodes the JSON value at the current position. """
+        self.peek()
+        size = READ_SIZE
+        while True:
+            try:
+                value, end = self.decoder.raw_decode(self.buffer, self.position)
+                # A number at the end of the buffer may continue.
+                if end < len(self.buffer) or isinstance(value, (dict, list, str)):
+                    self.position = end
+                    return value
+            except ValueError:
+                pass
+            if not self._fill(size):
+                value, end = self.decoder.raw_decode(self.buffer, self.position)
+                self.position = end
+                return value
+            # Grow the reads so large values are not re-parsed too often.
+            size *= 2
+
+    def items(self):
+        """ Yields the elements of the JSON array at the current
+            position one by one.
+        """
+        if self.peek() != '[':
+            raise ValueError("Expected a JSON array")
+        self.skip()
+        while True:
+            char = self.peek()
+            if char is None:
+                raise ValueError("Unterminated JSON array")
+            if char == ']':
+                self.skip()
+                return
+            if char == ',':
+                self.skip()
+                continue
+            yield self.value()
+
+
+def _int(value, default=None):
+    try:
+        return int(value)
+    except (TypeError, ValueError):
+        return default
+
+
+def _spans(positions):
+    return [Span(_int(position.get('StartPos')), _int(position.get('Length')))
+            for position in positions or ()]
+
+
+def _candidate(candidate):
+    return Candidate(score=_int(candidate.get('CandidateScore')),
+                     cui=candidate.get('CandidateCUI'),
+                     matched=candidate.get('CandidateMatched'),
+                     preferred_name=candidate.get('CandidatePreferred'),
+                     matched_words=candidate.get('MatchedWords', []),
+                     semtypes=candidate.get('SemTypes', []),
+                     sources=candidate.get('Sources', []),
+                     spans=_spans(candidate.get('ConceptPIs')),
+                     is_head=candidate.get('IsHead') == 'yes',
+                     is_overmatch=candidate.get('IsOverMatch') == 'yes',
+                     negated=candidate.get('Negated') == '1')
+
+
+def _phrase(phrase):
+    return Phrase(text=phrase.get('PhraseText'),
+                  start=_int(phrase.get('PhraseStartPos')),
+                  length=_int(phrase.get('PhraseLength')),
+                  candidates=[_candidate(candidate) for candidate in phrase.get('Candidates', [])],
+                  mappings=[Mapping(_int(mapping.get('MappingScore')),
+                                    [_candidate(candidate)
+                                     for candidate in mapping.get('MappingCandidates', [])])
+                            for mapping in phrase.get('Mappings', [])])
+
+
+def _negation(negation):
+    return Negation(type=negation.get('NegType'),
+                    trigger=negation.get('NegTrigger'),
+                    trigger_spans=_spans(negation.get('NegTriggerPIs')),
+                    cuis=[concept.get('NegConcCUI') for concept in negation.get('NegConcepts', [])],
+                    spans=_spans(negation.get('NegConcPIs')))
+
+
+def parse_document(document):
+    """ Returns the Utterances of one element of MetaMap's AllDocuments
+        array. Each utterance gets the document's negations whose
+        trigger lies within it.
+    """
+    document = document.get('Document', document)
+    negations = [_negation(negation) for negation in document.get('Negations', [])]
+    utterances = list()
+    for utterance in document.get('Utterances', []):
+        start = _int(utterance.get('UttStartPos'), 0)
+        length = _int(utterance.get('UttLength'), 0)
+        utterances.append(Utterance(
+            id=utterance.get('PMID'),
+            section=utterance.get('UttSection'),
+            number=_int(utterance.get('UttNum')),
+            text=utterance.get('UttText'),
+            start=start,
+            length=length,
+            phrases=[_phrase(phrase) for phrase in utterance.get('Phrases', [])],
+            negations=[negation for negation in negations
+                       if any(start <= span.start < start + length
+                              for span in negation.trigger_spans)]))
+    return utterances
+
+
+def iter_utterances(chunks):
+    """ Yields Utterances from MetaMap --JSONn output given as text
+        chunks. Documents are decoded one at a time; anything around
+        the JSON (e.g. the command line MetaMap echoes) is skipped.
+    """
+    decoder = StreamDecoder(chunks)
+    while decoder.find('"AllDocuments"'):
+        if decoder.peek() != ':':
+            continue
+        decoder.skip()
+        for document in decoder.items():
+            for utterance in parse_document(document):
+                yield utterance
+
+
+def parse_lite_entity(entity):
+    """ Returns the LiteEntity for one entity of MetaMapLite's JSON
+        output.
+    """
+    evidence = list()
+    for item in entity.get('evlist', []):
+        info = item.get('conceptinfo', {})
+        evidence.append(LiteEvidence(id=item.get('id'),
+                                     score=item.get('score'),
+                                     matched_text=item.get('matchedtext'),
+                                     start=_int(item.get('start')),
+                                     length=_int(item.get('length')),
+                                     cui=info.get('cui'),
+                                     preferred_name=info.get('preferredname'),
+                                     concept_string=info.get('conceptstring'),
+                                     semtypes=info.get('semantictypes', []),
+                                     sources=info.get('sources', [])))
+    return LiteEntity(id=entity.get('id'),
+                      document_id=entity.get('docid'),
+                      field_id=entity.get('fieldid'),
+                      matched_text=entity.get('matchedtext'),
+                      start=_int(entity.get('start')),
+                      length=_int(entity.get('length')),
+                      negated=bool(entity.get('negated', False)),
+                      evidence=evidence)
+
+
+def iter_lite_entities(chunks):
+    """ Yields LiteEntities from MetaMapLite JSON output given as text
+        chunks: a sequence of arrays of entities (or single entities),
+        decoded one entity at a time. Lines that are not JSON (logging)
+        are skipped.
+    """
+    decoder = StreamDecoder(chunks)
+    while True:
+        char = decoder.peek()
+        if char is None:
+            return
+        if char == '[':
+            for entity in decoder.items():
+                yield parse_lite_entity(entity)
+        elif char == '{':
+            yield parse_lite_entity(decoder.value())
+        else:
+            decoder.skip_line()
+
+
+def iter_brat(lines):
+    """ Yields BratAnnotations from brat standoff lines. Notes (#) and
+        attributes (A) are attached to the text-bound annotation (T)
+        they follow, which is yielded once the next one starts.
+    """
+    pending = None
+    for line in lines:
+        line = line.rstrip('\r\n')
+        fields = line.split('\t')
+        if not line or len(fields) < 2:
+            continue
+        if line.startswith('T'):
+            if pending is not None:
+                yield pending
+            kind, _, locations = fields[1].partition(' ')
+            spans = list()
+            for location in locations.split(';'):
+                start, _, end = location.partition(' ')
+                if _int(start) is not None and _int(end) is not None:
+                    spans.append(Span(int(start), int(end) - int(start)))
+            pending = BratAnnotation(id=fields[0], type=kind, spans=spans,
+                                     text=fields[2] if len(fields) > 2 else '',
+                                     cuis=CUI_PATTERN.findall(kind), notes=[], attributes=[])
+        elif pending is not None and line.startswith('#'):
+            target = fields[1].split(' ')
+            if target[-1] == pending.id and len(fields) > 2:
+                pending.notes.append(fields[2])
+                pending.cuis.extend(cui for cui in CUI_PATTERN.findall(fields[2])
+                                    if cui not in pending.cuis)
+        elif pending is not None and line.startswith('A'):
+            attribute = fields[1].split(' ')
+            if len(attribute) > 1 and attribute[1] == pending.id:
+                pending.attributes.append(attribute[0] if len(attribute) == 2
+                                          else (attribute[0], attribute[2]))
+    if pending is not None:
+        yield pending
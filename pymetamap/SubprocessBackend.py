@@ -12,18 +12,78 @@
 
 import os
 import subprocess
-import sys
-import tempfile
+import time
 from .MetaMap import MetaMap
-from .Concept import Corpus
+from .Concept import Corpus, skip_header, group_by_index
+from .Cache import extract_cached
+from .ProcessIO import iter_process_lines, iter_process_text, start_writer, popen_options, process_environment, Watchdog
+from .Instrumentation import CallStats, NULL_STATS, TimedLines
+from .Isolation import extract_isolated, describe_failures
+from .ServerManager import as_assignment
+from .StructuredOutput import iter_utterances
+
+
+def input_offsets(sentence):
+    """ Maps offsets into sentence as the MetaMap backends write it with
+        ids (a quoted Python literal, see SubprocessBackend._format_input)
+        to offsets into sentence, for the pos_info MetaMap reports. The
+        returned list has an entry for every input offset up to and
+        including the end. MetaMapLite input is written as it is and
+        needs no mapping.
+    """
+    literal = repr(sentence)
+    quote = literal[0]
+    offsets = [0]
+    for position, char in enumerate(sentence):
+        if char == quote:
+            width = 2
+        else:
+            width = len(repr(char)) - 2
+        offsets.extend([position] * width)
+    offsets.extend([len(sentence), len(sentence)])
+    if len(offsets) != len(literal) + 1:
+        # Unexpected quoting; fall back to skipping the quote only.
+        offsets = [0] + list(range(len(sentence) + 1)) + [len(sentence)]
+    return offsets
 
 
 class SubprocessBackend(MetaMap):
-    def __init__(self, metamap_filename, version=None):
+    def __init__(self, metamap_filename, version=None, cache=None,
+                 instrumentation=None, batch_timeout=None, deduplicate=False,
+                 servers=None, server_index=0):
         """ Interface to MetaMap using subprocess. This creates a
             command line call to a specified metamap process.
+
+            cache is an optional MemoryCache, SQLiteCache or TieredCache
+            (see pymetamap.Cache). Sentences found in it are served
+            without running MetaMap.
+
+            instrumentation is an optional Instrumentation (see
+            pymetamap.Instrumentation) which receives per-phase timings
+            and counters for every extract_concepts call.
+
+            batch_timeout is the number of seconds after which a metamap
+            process is killed and its batch reported as failed.
+
+            With deduplicate, identical sentences of one call are sent
+            to MetaMap once and their concepts copied to every id. As
+            with the cache, concepts of sentences passed without ids
+            are then indexed by position.
+
+            servers is an optional ServerManager or ServerAssignment
+            (see pymetamap.ServerManager) naming the tagger and WSD
+            servers the metamap processes should use. A ServerManager
+            is asked for its assignment number server_index whenever a
+            metamap process is started, so unhealthy servers are left
+            out as soon as they are detected.
         """
         MetaMap.__init__(self, metamap_filename, version)
+        self.cache = cache
+        self.instrumentation = instrumentation
+        self.batch_timeout = batch_timeout
+        self.deduplicate = deduplicate
+        self.servers = servers
+        self.server_index = server_index
 
     def extract_concepts(self,
                          sentences=None,
@@ -89,6 +149,176 @@ class SubprocessBackend(MetaMap):
                   and whatever was processed, if anything, will be
                   returned along with the error found.
         """
+        command = self._build_command(sentences=sentences,
+                                      ids=ids,
+                                      composite_phrase=composite_phrase,
+                                      filename=filename,
+                                      file_format=file_format,
+                                      allow_acronym_variants=allow_acronym_variants,
+                                      word_sense_disambiguation=word_sense_disambiguation,
+                                      allow_large_n=allow_large_n,
+                                      strict_model=strict_model,
+                                      relaxed_model=relaxed_model,
+                                      allow_overmatches=allow_overmatches,
+                                      allow_concept_gaps=allow_concept_gaps,
+                                      term_processing=term_processing,
+                                      no_derivational_variants=no_derivational_variants,
+                                      derivational_variants=derivational_variants,
+                                      ignore_word_order=ignore_word_order,
+                                      unique_acronym_variants=unique_acronym_variants,
+                                      prefer_multiple_concepts=prefer_multiple_concepts,
+                                      ignore_stop_phrases=ignore_stop_phrases,
+                                      compute_all_mappings=compute_all_mappings,
+                                      prune=prune,
+                                      mm_data_version=mm_data_version,
+                                      exclude_sources=exclude_sources,
+                                      restrict_to_sources=restrict_to_sources,
+                                      restrict_to_sts=restrict_to_sts,
+                                      exclude_sts=exclude_sts,
+                                      no_nums=no_nums)
+
+        stats = self._call_stats()
+        started = time.perf_counter()
+        if sentences is not None and stats is not None:
+            sentences = stats.count('sentences', sentences)
+        if sentences is not None:
+            if self.cache is not None or self.deduplicate:
+                concepts, error = self._extract_cached(command, sentences, ids, stats)
+            else:
+                concepts, error = self._extract_sentences(command, sentences, ids, stats)
+        else:
+            concepts, error = self._extract_file(command, filename, stats)
+        self._record(stats, started, concepts, error)
+        return (concepts, error)
+
+    def _call_stats(self):
+        """ Returns a CallStats for a call, or None without
+            instrumentation.
+        """
+        if self.instrumentation is None:
+            return None
+        return CallStats(self.__class__.__name__)
+
+    def _record(self, stats, started, concepts, error):
+        """ Completes stats and passes them to the instrumentation. """
+        if self.instrumentation is None:
+            return
+        stats.seconds = time.perf_counter() - started
+        stats.error = error
+        stats.add('concepts', len(concepts))
+        self.instrumentation.record(stats)
+
+    def extract_concepts_isolated(self, sentences, ids=None, **options):
+        """ Fault-tolerant variant of extract_concepts for a list of
+            sentences. A batch on which MetaMap fails (or, with
+            batch_timeout, hangs) is bisected and retried until the
+            offending sentences are isolated, so one bad sentence does
+            not cost the results of the rest.
+
+            options are the same keyword arguments as extract_concepts
+            takes. Returns (concepts, failed) where failed is a list of
+            FailedSentence(id, sentence, error). Without ids, sentences
+            are identified by their position.
+        """
+        sentences = list(sentences)
+        if ids is None:
+            ids = list(range(len(sentences)))
+        command = self._build_command(sentences=sentences, ids=ids, **options)
+
+        stats = self._call_stats()
+        started = time.perf_counter()
+        if stats is not None:
+            stats.add('sentences', len(sentences))
+        concepts, failed = self._extract_isolated(command, sentences, ids, stats)
+        self._record(stats, started, concepts, describe_failures(failed))
+        return (concepts, failed)
+
+    def iter_concepts(self, sentences=None, ids=None, filename=None,
+                      group_by_id=False, **options):
+        """ iter_concepts is the streaming counterpart of
+            extract_concepts: it takes an iterable of sentences and
+            ids(optional), or a filename, and yields Concept objects as
+            MetaMap writes them, so memory use does not grow with the
+            size of the input. With group_by_id the concepts are yielded
+            as (id, Corpus) pairs, one per input id with concepts.
+
+            options are the same keyword arguments as extract_concepts
+            takes. The cache is not consulted.
+
+            Note: If MetaMap exits with an error, ProcessFailed is
+                  raised after the concepts that were produced.
+        """
+        command, env = self._server_options(self._build_command(sentences=sentences, ids=ids,
+                                                                filename=filename, **options))
+        if sentences is not None:
+            lines = iter_process_lines(command, input_lines=self._format_input(sentences, ids),
+                                       env=env)
+        else:
+            lines = iter_process_lines(command, input_filename=filename, env=env)
+        concepts = Corpus.iter_load(skip_header(lines))
+        if group_by_id:
+            return group_by_index(concepts, Corpus)
+        return concepts
+
+    def iter_utterances(self, sentences=None, ids=None, filename=None,
+                        show_candidates=False, **options):
+        """ iter_utterances runs MetaMap once with JSON output (--JSONn)
+            instead of MMI and yields an Utterance per utterance, with
+            its phrases, their mappings and the negations it contains.
+            With show_candidates (-c) every phrase also carries its full
+            candidate list. The output is decoded one document at a
+            time, so memory use does not grow with the size of the
+            input.
+
+            options are the same keyword arguments as extract_concepts
+            takes. The cache is not consulted.
+
+            Note: If MetaMap exits with an error, ProcessFailed is
+                  raised after the utterances that were produced.
+        """
+        command = self._build_command(sentences=sentences, ids=ids, filename=filename, **options)
+        command = ['--JSONn' if argument == '-N' else argument for argument in command]
+        if show_candidates:
+            command.insert(2, '-c')
+        command, env = self._server_options(command)
+        if sentences is not None:
+            chunks = iter_process_text(command, input_lines=self._format_input(sentences, ids),
+                                       env=env)
+        else:
+            chunks = iter_process_text(command, input_filename=filename, env=env)
+        return iter_utterances(chunks)
+
+    def _build_command(self,
+                       sentences=None,
+                       ids=None,
+                       composite_phrase=4,
+                       filename=None,
+                       file_format='sldi',
+                       allow_acronym_variants=False,
+                       word_sense_disambiguation=False,
+                       allow_large_n=False,
+                       strict_model=False,
+                       relaxed_model=False,
+                       allow_overmatches=False,
+                       allow_concept_gaps=False,
+                       term_processing=False,
+                       no_derivational_variants=False,
+                       derivational_variants=False,
+                       ignore_word_order=False,
+                       unique_acronym_variants=False,
+                       prefer_multiple_concepts=False,
+                       ignore_stop_phrases=False,
+                       compute_all_mappings=False,
+                       prune=False,
+                       mm_data_version=False,
+                       exclude_sources=[],
+                       restrict_to_sources=[],
+                       restrict_to_sts=[],
+                       exclude_sts=[],
+                       no_nums=[]):
+        """ Builds the metamap command line for the given options.
+            Raises ValueError for invalid option combinations.
+        """
         if allow_acronym_variants and unique_acronym_variants:
             raise ValueError("You can't use both allow_acronym_variants and unique_acronym_variants.")
         if (sentences is not None and filename is not None) or \
@@ -97,148 +327,189 @@ class SubprocessBackend(MetaMap):
         if file_format not in ['sldi', 'sldiID']:
             raise ValueError("file_format must be either sldi or sldiID")
 
-        input_file = None
-        output_file = None
-        error = None
+        command = list()
+        command.append(self.metamap_filename)
+        command.append('-N')
+        command.append('-Q')
+        command.append(str(composite_phrase))
+        if mm_data_version is not False:
+            if mm_data_version not in ['Base', 'USAbase', 'NLM']:
+                raise ValueError("mm_data_version must be Base, USAbase, or NLM.")
+            command.append('-V')
+            command.append(str(mm_data_version))
+        if word_sense_disambiguation:
+            command.append('-y')
+        if strict_model:
+            command.append('-A')
+        if prune is not False:
+            command.append('--prune')
+            command.append(str(prune))
+        if relaxed_model:
+            command.append('-C')
+        if allow_large_n:
+            command.append('-l')
+        if allow_overmatches:
+            command.append('-o')
+        if allow_concept_gaps:
+            command.append('-g')
+        if term_processing:
+            command.append('-z')
+        if no_derivational_variants:
+            command.append('-d')
+        if derivational_variants:
+            command.append('-D')
+        if ignore_word_order:
+            command.append('-i')
+        if allow_acronym_variants:
+            command.append('-a')
+        if unique_acronym_variants:
+            command.append('-u')
+        if prefer_multiple_concepts:
+            command.append('-Y')
+        if ignore_stop_phrases:
+            command.append('-K')
+        if compute_all_mappings:
+            command.append('-b')
+        if len(exclude_sources) > 0:
+            command.append('-e')
+            command.append(str(','.join(exclude_sources)))
+        if len(restrict_to_sources) > 0:
+            command.append('-R')
+            command.append(str(','.join(restrict_to_sources)))
+        if len(restrict_to_sts) > 0:
+            command.append('-J')
+            command.append(str(','.join(restrict_to_sts)))
+        if len(exclude_sts) > 0:
+            command.append('-k')
+            command.append(str(','.join(exclude_sts)))
+        if len(no_nums) > 0:
+            command.append('--no_nums')
+            command.append(str(','.join(no_nums)))
+        if ids is not None or (file_format == 'sldiID' and sentences is None):
+            command.append('--sldiID')
+        else:
+            command.append('--sldi')
+
+        command.append('--silent')
+
+        return command
+
+    def _cached_command(self, command):
+        """ Returns the command to run cache misses with, which always
+            passes ids, and the fingerprint the cache is keyed by.
+        """
+        command = ['--sldiID' if arg == '--sldi' else arg for arg in command]
+        # The cache is keyed by everything that can change the output:
+        # the binary, the MetaMap version and every option.
+        return (command, '\0'.join([str(self.version)] + command))
+
+    def _extract_cached(self, command, sentences, ids, stats=None, extract_sentences=None):
+        """ Looks the sentences up in self.cache (if any) and only runs
+            MetaMap on the distinct misses, with extract_sentences
+            (default: self._extract_sentences). Without ids, concepts
+            are indexed by the position of their sentence.
+        """
+        if extract_sentences is None:
+            extract_sentences = self._extract_sentences
+        command, fingerprint = self._cached_command(command)
+        return extract_cached(self.cache, fingerprint, sentences, ids,
+                              lambda sentences, ids: extract_sentences(command, sentences, ids, stats),
+                              Corpus, stats)
+
+    def _extract_isolated(self, command, sentences, ids, stats=None):
+        """ Runs extract_isolated over the sentences, consulting the
+            cache if there is one.
+        """
+        if self.cache is not None or self.deduplicate:
+            run = lambda sentences, ids: self._extract_cached(command, sentences, ids, stats)
+        else:
+            run = lambda sentences, ids: self._extract_sentences(command, sentences, ids, stats)
+        return extract_isolated(run, sentences, ids, Corpus, stats)
+
+    def _server_options(self, command):
+        """ Returns (command, env) for starting one metamap process:
+            command with the server options of self.servers added and
+            the Popen env pointing it at their ports.
+        """
+        assignment = as_assignment(self.servers, self.server_index)
+        if assignment is None:
+            return (command, None)
+        return (command[:1] + assignment.arguments + command[1:],
+                process_environment(assignment.environment))
 
+    @staticmethod
+    def _format_input(sentences, ids=None):
+        """ Yields one encoded sldi (or sldiID when ids are given) input
+            line per sentence.
+        """
+        if ids is not None:
+            for identifier, sentence in zip(ids, sentences):
+                yield '{0!r}|{1!r}\n'.format(identifier, sentence).encode('utf8')
+        else:
+            for sentence in sentences:
+                yield '{0!r}\n'.format(sentence).encode('utf8')
+
+    def _extract_sentences(self, command, sentences, ids, stats=None):
+        """ Runs a single metamap process over the given sentences and
+            returns (concepts, error).
+        """
+        return self._run_input(command, self._format_input(sentences, ids), stats)
+
+    def _run_input(self, command, input_lines, stats=None, input_file=None):
+        """ Runs a single metamap process over already encoded input
+            lines, or over the contents of the open binary input_file,
+            and returns (concepts, error). Input goes to stdin and
+            results are parsed from stdout as they arrive; nothing is
+            written to disk.
+        """
+        if stats is None:
+            stats = NULL_STATS
+        error = None
+        command, env = self._server_options(command)
+        with stats.timer('spawn'):
+            metamap_process = subprocess.Popen(command, stdout=subprocess.PIPE,
+                                               stdin=subprocess.PIPE if input_file is None else input_file,
+                                               env=env,
+                                               **popen_options(self.batch_timeout))
+        watchdog = Watchdog(metamap_process, self.batch_timeout)
+        # The input is streamed to stdin from a separate thread, so the
+        # batch size is not limited by the pipe buffer or by ARG_MAX.
+        writer = None
+        if input_file is None:
+            writer = start_writer(metamap_process.stdin, input_lines, stats)
+        output = TimedLines(metamap_process.stdout)
+        started = time.perf_counter()
         try:
-            command = list()
-            command.append(self.metamap_filename)
-            command.append('-N')
-            command.append('-Q')
-            command.append(str(composite_phrase))
-            if mm_data_version is not False:
-                if mm_data_version not in ['Base', 'USAbase', 'NLM']:
-                    raise ValueError("mm_data_version must be Base, USAbase, or NLM.")
-                command.append('-V')
-                command.append(str(mm_data_version))
-            if word_sense_disambiguation:
-                command.append('-y')
-            if strict_model:
-                command.append('-A')
-            if prune is not False:
-                command.append('--prune')
-                command.append(str(prune))
-            if relaxed_model:
-                command.append('-C')
-            if allow_large_n:
-                command.append('-l')
-            if allow_overmatches:
-                command.append('-o')
-            if allow_concept_gaps:
-                command.append('-g')
-            if term_processing:
-                command.append('-z')
-            if no_derivational_variants:
-                command.append('-d')
-            if derivational_variants:
-                command.append('-D')
-            if ignore_word_order:
-                command.append('-i')
-            if allow_acronym_variants:
-                command.append('-a')
-            if unique_acronym_variants:
-                command.append('-u')
-            if prefer_multiple_concepts:
-                command.append('-Y')
-            if ignore_stop_phrases:
-                command.append('-K')
-            if compute_all_mappings:
-                command.append('-b')
-            if len(exclude_sources) > 0:
-                command.append('-e')
-                command.append(str(','.join(exclude_sources)))
-            if len(restrict_to_sources) > 0:
-                command.append('-R')
-                command.append(str(','.join(restrict_to_sources)))
-            if len(restrict_to_sts) > 0:
-                command.append('-J')
-                command.append(str(','.join(restrict_to_sts)))
-            if len(exclude_sts) > 0:
-                command.append('-k')
-                command.append(str(','.join(exclude_sts)))
-            if len(no_nums) > 0:
-                command.append('--no_nums')
-                command.append(str(','.join(no_nums)))
-            if ids is not None or (file_format == 'sldiID' and sentences is None):
-                command.append('--sldiID')
-            else:
-                command.append('--sldi')
-
-            command.append('--silent')
-
-            if sentences is not None:
-                input_text = None
-                if ids is not None:
-                    for identifier, sentence in zip(ids, sentences):
-                        if input_text is None:
-                            input_text = '{0!r}|{1!r}\n'.format(identifier, sentence).encode('utf8')
-                        else:
-                            input_text += '{0!r}|{1!r}\n'.format(identifier, sentence).encode('utf8')
-                else:
-                    for sentence in sentences:
-                        if input_text is None:
-                            input_text = '{0!r}\n'.format(sentence).encode('utf8')
-                        else:
-                            input_text += '{0!r}\n'.format(sentence).encode('utf8')
-
-                input_command = list()
-                input_command.append('echo')
-                input_command.append('-e')
-                input_command.append(input_text)
-
-                input_process = subprocess.Popen(input_command, stdout=subprocess.PIPE)
-                metamap_process = subprocess.Popen(command, stdout=subprocess.PIPE, stdin=input_process.stdout)
-
-                output, error = metamap_process.communicate()
-                if sys.version_info[0] > 2:
-                    if isinstance(output, bytes):
-                        output = output.decode()
-
-                # "Processing" sentences are returned as stderr. Hence success/failure of metamap_process needs to be
-                #  checked by its returncode.
-                if metamap_process.returncode == 0:
-                    # Initial line(s) of output contains MetaMap command and MetaMap details.
-                    # Even on using --silent option, MetaMap command is sent to stdout.
-                    # Hence pre-processing is required to segregate these from MetaMap output in stdout.
-                    prev_new_line = -1
-                    while (prev_new_line + 1) < len(output):
-                        next_new_line = output.find('\n', prev_new_line + 1)
-                        if next_new_line < 0:
-                            next_new_line = len(output)
-                        # Check if the current line is in MMI output format i.e. fields separated by '|'
-                        fields = output[prev_new_line + 1:next_new_line].split('|')
-                        # https://metamap.nlm.nih.gov/Docs/MMI_Output_2016.pdf
-                        #   This document explains the various fields in MMI output.
-                        if len(fields) > 1 and fields[1] in ['MMI', 'AA', 'UA']:
-                            break
-                        else:
-                            prev_new_line = next_new_line
-
-                    output = output[prev_new_line + 1:]
-                else:
-                    error = "ERROR: MetaMap failed"
-            else:
-                input_file = open(filename, 'r')
-                output_file = tempfile.NamedTemporaryFile(mode="r", delete=False)
-
-                command.append(input_file.name)
-                command.append(output_file.name)
-
-                metamap_process = subprocess.Popen(command, stdout=subprocess.PIPE)
-                while metamap_process.poll() is None:
-                    stdout = str(metamap_process.stdout.readline())
-                    if 'ERROR' in stdout:
-                        metamap_process.terminate()
-                        error = stdout.rstrip()
-                output = str(output_file.read())
+            # Initial line(s) of output contains MetaMap command and MetaMap details.
+            # Even on using --silent option, MetaMap command is sent to stdout.
+            # Hence these are skipped before parsing, line by line as the output is read.
+            # https://metamap.nlm.nih.gov/Docs/MMI_Output_2016.pdf
+            #   This document explains the various fields in MMI output.
+            lines = (line.decode('utf8') for line in output)
+            concepts = Corpus.load(skip_header(lines))
         finally:
-            if sentences is not None:
-                # os.remove(input_file.name)
-                pass
-            else:
-                input_file.close()
-                os.remove(output_file.name)
+            metamap_process.stdout.close()
+            metamap_process.wait()
+            watchdog.cancel()
+            if writer is not None:
+                writer.join()
+        output.record(stats, time.perf_counter() - started)
+
+        # "Processing" sentences are returned as stderr. Hence success/failure of metamap_process needs to be
+        #  checked by its returncode.
+        if watchdog.expired:
+            error = "ERROR: MetaMap did not finish within {0} seconds".format(self.batch_timeout)
+        elif metamap_process.returncode != 0:
+            error = "ERROR: MetaMap failed"
 
-        concepts = Corpus.load(output.splitlines())
         return (concepts, error)
+
+    def _extract_file(self, command, filename, stats=None):
+        """ Runs a single metamap process with filename as its stdin and
+            returns (concepts, error).
+        """
+        if stats is None:
+            stats = NULL_STATS
+        with open(filename, 'rb') as input_file:
+            stats.add('bytes_in', os.fstat(input_file.fileno()).st_size)
+            return self._run_input(command, None, stats, input_file)
@@ -12,17 +12,43 @@
 
 import os
 import subprocess
-import tempfile
+import time
 from .MetaMapLite import MetaMapLite
 from .ConceptLite import CorpusLite
+from .Concept import group_by_index
+from .Cache import extract_cached
+from .ProcessIO import iter_process_lines, iter_process_text, start_writer, popen_options, Watchdog
+from .Instrumentation import CallStats, NULL_STATS, TimedLines
+from .Isolation import extract_isolated, describe_failures
+from .StructuredOutput import iter_lite_entities, iter_brat
 
 
 class SubprocessBackendLite(MetaMapLite):
-    def __init__(self, metamap_home):
+    def __init__(self, metamap_home, cache=None, instrumentation=None,
+                 batch_timeout=None, deduplicate=False):
         """ Interface to MetaMap using subprocess. This creates a
             command line call to a specified metamap process.
+
+            cache is an optional MemoryCache, SQLiteCache or TieredCache
+            (see pymetamap.Cache). Sentences found in it are served
+            without running MetaMapLite.
+
+            instrumentation is an optional Instrumentation (see
+            pymetamap.Instrumentation) which receives per-phase timings
+            and counters for every extract_concepts call.
+
+            batch_timeout is the number of seconds after which a
+            MetaMapLite process is killed and its batch reported as
+            failed.
+
+            With deduplicate, identical sentences of one call are sent
+            to MetaMapLite once and their concepts copied to every id.
         """
         MetaMapLite.__init__(self, metamap_home=metamap_home)
+        self.cache = cache
+        self.instrumentation = instrumentation
+        self.batch_timeout = batch_timeout
+        self.deduplicate = deduplicate
 
     def extract_concepts(self, sentences=None, ids=None, filename=None,
                          restrict_to_sts=None, restrict_to_sources=None):
@@ -46,82 +72,253 @@ class SubprocessBackendLite(MetaMapLite):
             raise ValueError("You must either pass a list of sentences "
                              "OR a filename.")
 
-        input_file = None
+        options = self._build_options(ids=ids,
+                                      restrict_to_sts=restrict_to_sts,
+                                      restrict_to_sources=restrict_to_sources)
+        stats = self._call_stats()
+        started = time.perf_counter()
+        if sentences is not None and stats is not None:
+            sentences = stats.count('sentences', sentences)
         if sentences is not None:
-            input_file = tempfile.NamedTemporaryFile(mode="wb", delete=False, suffix='.mmi')
+            if self.cache is not None or self.deduplicate:
+                concepts, error = self._extract_cached(options, sentences, ids, stats)
+            else:
+                concepts, error = self._extract_sentences(options, sentences, ids, stats)
         else:
-            input_file = open(filename, 'r')
+            concepts, error = self._extract_file(options, filename, stats)
+        self._record(stats, started, concepts, error)
+        return (concepts, error)
+
+    def _call_stats(self):
+        """ Returns a CallStats for a call, or None without
+            instrumentation.
+        """
+        if self.instrumentation is None:
+            return None
+        return CallStats(self.__class__.__name__)
+
+    def _record(self, stats, started, concepts, error):
+        """ Completes stats and passes them to the instrumentation. """
+        if self.instrumentation is None:
+            return
+        stats.seconds = time.perf_counter() - started
+        stats.error = error
+        stats.add('concepts', len(concepts))
+        self.instrumentation.record(stats)
 
-        # Unlike MetaMap, MetaMapLite does not take an output filename as a parameter.
-        # It creates a new output file at same location as "input_file" with the default file extension ".mmi".
-        # output_file = tempfile.NamedTemporaryFile(mode="r", delete=False)
-        output_file_name = None
+    def extract_concepts_isolated(self, sentences, ids=None, restrict_to_sts=None,
+                                  restrict_to_sources=None):
+        """ Fault-tolerant variant of extract_concepts for a list of
+            sentences. A batch on which MetaMapLite fails (or, with
+            batch_timeout, hangs) is bisected and retried until the
+            offending sentences are isolated. Returns (concepts, failed)
+            where failed is a list of FailedSentence(id, sentence,
+            error). Without ids, sentences are identified by their
+            position.
+        """
+        sentences = list(sentences)
+        if ids is None:
+            ids = list(range(len(sentences)))
+        options = self._build_options(ids=ids,
+                                      restrict_to_sts=restrict_to_sts,
+                                      restrict_to_sources=restrict_to_sources)
+
+        stats = self._call_stats()
+        started = time.perf_counter()
+        if stats is not None:
+            stats.add('sentences', len(sentences))
+        if self.cache is not None or self.deduplicate:
+            run = lambda sentences, ids: self._extract_cached(options, sentences, ids, stats)
+        else:
+            run = lambda sentences, ids: self._extract_sentences(options, sentences, ids, stats)
+        concepts, failed = extract_isolated(run, sentences, ids, CorpusLite, stats)
+        self._record(stats, started, concepts, describe_failures(failed))
+        return (concepts, failed)
+
+    def iter_concepts(self, sentences=None, ids=None, filename=None,
+                      group_by_id=False, restrict_to_sts=None,
+                      restrict_to_sources=None):
+        """ iter_concepts is the streaming counterpart of
+            extract_concepts: it runs metamaplite.sh in --pipe mode,
+            writes the sentences (or the contents of filename) to its
+            stdin and yields Concept objects as they are written, so
+            memory use does not grow with the size of the input. With
+            group_by_id the concepts are yielded as (id, CorpusLite)
+            pairs, one per input id with concepts.
+
+            Note: If MetaMapLite exits with an error, ProcessFailed is
+                  raised after the concepts that were produced.
+        """
+        if (sentences is not None and filename is not None) or \
+                (sentences is None and filename is None):
+            raise ValueError("You must either pass a list of sentences "
+                             "OR a filename.")
+
+        command = self._pipe_command(self._build_options(ids=ids,
+                                                         restrict_to_sts=restrict_to_sts,
+                                                         restrict_to_sources=restrict_to_sources))
+        if sentences is not None:
+            lines = iter_process_lines(command, input_lines=self._format_input(sentences, ids),
+                                       cwd=self.metamap_home)
+        else:
+            lines = iter_process_lines(command, input_filename=filename,
+                                       cwd=self.metamap_home)
+        # Only keep MMI rows; anything else on stdout is logging.
+        lines = (line for line in lines if line.split('|', 2)[1:2] == ['MMI'])
+        concepts = CorpusLite.iter_load(lines)
+        if group_by_id:
+            return group_by_index(concepts, CorpusLite)
+        return concepts
+
+    def iter_entities(self, sentences=None, ids=None, filename=None,
+                      output_format='json', restrict_to_sts=None,
+                      restrict_to_sources=None):
+        """ iter_entities runs MetaMapLite with JSON or brat output
+            instead of MMI and yields a LiteEntity (with its evidence
+            list and negation) or a BratAnnotation per entity, decoded
+            as they are written, so memory use does not grow with the
+            size of the input.
+
+            Note: If MetaMapLite exits with an error, ProcessFailed is
+                  raised after the entities that were produced.
+        """
+        if (sentences is not None and filename is not None) or \
+                (sentences is None and filename is None):
+            raise ValueError("You must either pass a list of sentences "
+                             "OR a filename.")
+        if output_format not in ['json', 'brat']:
+            raise ValueError("output_format must be either json or brat")
+
+        command = self._pipe_command(self._build_options(ids=ids,
+                                                         restrict_to_sts=restrict_to_sts,
+                                                         restrict_to_sources=restrict_to_sources),
+                                     output_format)
+        if output_format == 'brat':
+            run, parse = (iter_process_lines, iter_brat)
+        else:
+            run, parse = (iter_process_text, iter_lite_entities)
+        if sentences is not None:
+            output = run(command, input_lines=self._format_input(sentences, ids),
+                         cwd=self.metamap_home)
+        else:
+            output = run(command, input_filename=filename, cwd=self.metamap_home)
+        return parse(output)
+
+    def _build_options(self, ids=None, restrict_to_sts=None,
+                       restrict_to_sources=None):
+        """ Builds the metamaplite.sh options, excluding the input file. """
+        options = list()
+        if restrict_to_sts:
+            if isinstance(restrict_to_sts, str):
+                restrict_to_sts = [restrict_to_sts]
+            if len(restrict_to_sts) > 0:
+                options.append('--restrict_to_sts={}'.format(str(','.join(restrict_to_sts))))
+
+        if restrict_to_sources:
+            if isinstance(restrict_to_sources, str):
+                restrict_to_sources = [restrict_to_sources]
+            if len(restrict_to_sources) > 0:
+                options.append('--restrict_to_sources')
+                options.append(str(','.join(restrict_to_sources)))
+
+        if ids is not None:
+            options.append('--inputformat=sldiwi')
+        return options
+
+    def _cached_options(self, options, ids):
+        """ Returns the options to run cache misses with, which always
+            pass ids, and the fingerprint the cache is keyed by.
+        """
+        if ids is None:
+            options = options + ['--inputformat=sldiwi']
+        # metamap_home identifies the MetaMapLite release and its data.
+        return (options, '\0'.join(['metamaplite', self.metamap_home] + options))
+
+    def _extract_cached(self, options, sentences, ids, stats=None):
+        """ Looks the sentences up in self.cache (if any) and only runs
+            MetaMapLite on the distinct misses. Without ids, concepts are
+            indexed by the position of their sentence.
+        """
+        options, fingerprint = self._cached_options(options, ids)
+        return extract_cached(self.cache, fingerprint, sentences, ids,
+                              lambda sentences, ids: self._extract_sentences(options, sentences, ids, stats),
+                              CorpusLite, stats)
+
+    @staticmethod
+    def _format_input(sentences, ids=None):
+        """ Yields one encoded input line (sldiwi when ids are given) per
+            sentence.
+        """
+        if ids is not None:
+            for identifier, sentence in zip(ids, sentences):
+                yield '{0!r}|{1}\n'.format(identifier, sentence).encode('utf8')
+        else:
+            for sentence in sentences:
+                yield '{0!r}\n'.format(sentence).encode('utf8')
+
+    def _pipe_command(self, options, output_format='mmi'):
+        """ Returns the metamaplite.sh command reading sldi(wi) input on
+            stdin and writing output_format on stdout.
+        """
+        command = ["bash", os.path.join(self.metamap_home, "metamaplite.sh"), '--pipe']
+        command.extend(options)
+        command.append('--outputformat={0}'.format(output_format))
+        return command
+
+    def _extract_sentences(self, options, sentences, ids, stats=None):
+        return self._run_input(options, self._format_input(sentences, ids), stats)
+
+    def _extract_file(self, options, filename, stats=None):
+        """ Runs MetaMapLite with filename as its stdin. In --pipe mode
+            MetaMapLite writes to stdout, so no output file is created
+            next to the input.
+        """
+        if stats is None:
+            stats = NULL_STATS
+        with open(filename, 'rb') as input_file:
+            stats.add('bytes_in', os.fstat(input_file.fileno()).st_size)
+            return self._run_input(options, None, stats, input_file)
+
+    def _run_input(self, options, input_lines, stats=None, input_file=None):
+        """ Runs a single MetaMapLite process over encoded input lines,
+            or over the open binary input_file, and returns (concepts,
+            error). Results are parsed from stdout as they arrive.
+        """
+        if stats is None:
+            stats = NULL_STATS
         error = None
+        with stats.timer('spawn'):
+            metamap_process = subprocess.Popen(self._pipe_command(options),
+                                               stdin=subprocess.PIPE if input_file is None else input_file,
+                                               stdout=subprocess.PIPE, cwd=self.metamap_home,
+                                               **popen_options(self.batch_timeout))
+        watchdog = Watchdog(metamap_process, self.batch_timeout)
+        writer = None
+        if input_file is None:
+            writer = start_writer(metamap_process.stdin, input_lines, stats)
+        output = TimedLines(metamap_process.stdout)
+        started = time.perf_counter()
+        rows = list()
         try:
-            if sentences is not None:
-                if ids is not None:
-                    for identifier, sentence in zip(ids, sentences):
-                        input_file.write('{0!r}|{1}\n'.format(identifier, sentence).encode('utf8'))
-                else:
-                    for sentence in sentences:
-                        input_file.write('{0!r}\n'.format(sentence).encode('utf8'))
-                input_file.flush()
-                input_file.close()
-
-            command = ["bash", os.path.join(self.metamap_home, "metamaplite.sh")]
-            if restrict_to_sts:
-                if isinstance(restrict_to_sts, str):
-                    restrict_to_sts = [restrict_to_sts]
-                if len(restrict_to_sts) > 0:
-                    command.append('--restrict_to_sts={}'.format(str(','.join(restrict_to_sts))))
-                    #command.append(str(','.join(restrict_to_sts)))
-
-            if restrict_to_sources:
-                if isinstance(restrict_to_sources, str):
-                    restrict_to_sources = [restrict_to_sources]
-                if len(restrict_to_sources) > 0:
-                    command.append('--restrict_to_sources')
-                    command.append(str(','.join(restrict_to_sources)))
-
-            if ids is not None:
-                command.append('--inputformat=sldiwi')
-
-            command.append(input_file.name)
-            command.append('--overwrite')
-            #command.append('--indexdir={}data/ivf/2020AA/USAbase'.format(self.metamap_home))
-            #command.append('--specialtermsfile={}data/specialterms.txt'.format(self.metamap_home))
-            # command.append(output_file.name)
-
-            output_file_name, file_extension = os.path.splitext(input_file.name)
-            output_file_name += "." + "mmi"
-
-            output_file_name, file_extension = os.path.splitext(input_file.name)
-            output_file_name += "." + "mmi"
-
-            # output = str(output_file.read())
-            metamap_process = subprocess.Popen(command, stdout=subprocess.PIPE)
-            while metamap_process.poll() is None:
-                stdout = str(metamap_process.stdout.readline())
-                if 'ERROR' in stdout:
+            for line in output:
+                line = line.decode('utf8', 'replace')
+                # Only keep MMI rows; anything else on stdout is logging.
+                if line.split('|', 2)[1:2] == ['MMI']:
+                    rows.append(line)
+                elif 'ERROR' in line and error is None:
                     metamap_process.terminate()
-                    error = stdout.rstrip()
-
-            # print("input file name: {0}".format(input_file.name))
-            output_file_name, file_extension = os.path.splitext(input_file.name)
-            output_file_name += "." + "mmi"
-            # print("output_file_name: {0}".format(output_file_name))
-            with open(output_file_name) as fd:
-                output = fd.read()
-            # output = str(output_file.read())
-            # print("output: {0}".format(output))
-        except:
-            pass
-        concepts = CorpusLite.load(output.splitlines())
-        return concepts, error
-#finally:
-#    if sentences is not None:
-#        os.remove(input_file.name)
-#    else:
-#        input_file.close()
-#    # os.remove(output_file.name)
-#    #os.remove(output_file_name)
+                    error = line.rstrip()
+        finally:
+            metamap_process.stdout.close()
+            metamap_process.wait()
+            watchdog.cancel()
+            if writer is not None:
+                writer.join()
+        concepts = CorpusLite.load(rows)
+        output.record(stats, time.perf_counter() - started)
+
+        if watchdog.expired:
+            error = "ERROR: MetaMapLite did not finish within {0} seconds".format(self.batch_timeout)
+        elif error is None and metamap_process.returncode != 0:
+            error = "ERROR: MetaMapLite failed"
+        return (concepts, error)
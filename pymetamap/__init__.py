@@ -18,8 +18,31 @@ from .Concept import ConceptUA
 from .Concept import Corpus
 from .ConceptLite import ConceptLiteMMI
 from .ConceptLite import CorpusLite
+from .ColumnarCorpus import ColumnarCorpus
 from .SubprocessBackend import SubprocessBackend
 from .SubprocessBackendLite import SubprocessBackendLite
+from .PersistentBackend import PersistentBackend
+from .PersistentBackendLite import PersistentBackendLite
+from .PoolBackend import PoolBackend
+from .Cache import MemoryCache
+from .Cache import SQLiteCache
+from .Cache import TieredCache
+from .ProcessIO import ProcessFailed
+from .Instrumentation import Instrumentation
+from .Instrumentation import CallStats
+from .Isolation import FailedSentence
+from .BulkJob import BulkJob
+from .AdaptiveBatcher import AdaptiveBatcher
+from .DocumentAnnotator import DocumentAnnotator
+from .CorpusIndex import CorpusIndex
+from .ArrowCorpus import ArrowCorpus
+from .IncrementalAnnotator import IncrementalAnnotator
+from .ServerManager import ServerManager
+from .Distributed import Coordinator
+from .Distributed import Worker
+from .StructuredOutput import Utterance
+from .StructuredOutput import LiteEntity
+from .StructuredOutput import BratAnnotation
 
 
 __all__ = (MetaMap, MetaMapLite, Concept, ConceptLite, Corpus, CorpusLite)
@@ -18,5 +18,12 @@ setup(name='pymetamap',
       ],
       license='Apache 2.0',
       packages=['pymetamap'],
+      extras_require={
+          'arrow': ['pyarrow'],
+      },
+      entry_points={
+          'console_scripts': ['pymetamap=pymetamap.CommandLine:main',
+                              'pymetamap-worker=pymetamap.Distributed:main'],
+      },
       zip_safe=False)
 
@@ -0,0 +1,116 @@
+# Licensed under the Apache License, Version 2.0 (the "License");
+# you may not use this file except in compliance with the License.
+# You may obtain a copy of the License at
+#
+# http://www.apache.org/licenses/LICENSE-2.0
+#
+# Unless required by applicable law or agreed to in writing, software
+# distributed under the License is distributed on an "AS IS" BASIS,
+# WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.
+# See the License for the specific language governing permissions and
+# limitations under the License.
+
+import itertools
+import unittest
+from unittest import mock
+
+from pymetamap import AdaptiveBatcher, Corpus
+
+SENTENCE = 'a' * 19
+OVERHEAD = 2.0
+PER_CHAR = 0.001
+
+
+class FakeMetaMap(object):
+    """ Takes OVERHEAD plus PER_CHAR seconds per character, on a fake
+        clock, for every extract_concepts call.
+    """
+    def __init__(self, fail_on=None):
+        self.now = 0.0
+        self.batches = list()
+        self.fail_on = fail_on
+
+    def clock(self):
+        return self.now
+
+    def extract_concepts(self, sentences, ids):
+        self.batches.append((len(sentences), sum(len(sentence) for sentence in sentences)))
+        self.now += OVERHEAD + PER_CHAR * sum(len(sentence) for sentence in sentences)
+        if self.fail_on is not None and len(self.batches) == self.fail_on:
+            return (Corpus(), 'ERROR: MetaMap failed')
+        return (Corpus(), None)
+
+
+class AdaptiveBatcherTest(unittest.TestCase):
+    def run_batches(self, metamap, batcher, count):
+        with mock.patch('pymetamap.AdaptiveBatcher.time') as fake_time:
+            fake_time.perf_counter = metamap.clock
+            results = list(itertools.islice(batcher.run(itertools.repeat(SENTENCE)), count))
+        return results
+
+    def check_growth(self, batches, max_growth):
+        for (_, previous), (_, chars) in zip(batches, batches[1:]):
+            # At most one sentence over the budget.
+            self.assertLessEqual(chars, max_growth * previous + len(SENTENCE))
+
+    def test_converges_with_capped_growth(self):
+        metamap = FakeMetaMap()
+        batcher = AdaptiveBatcher(metamap, max_overhead=0.1, initial_batch=10)
+        self.run_batches(metamap, batcher, 40)
+        sizes = [size for size, _ in metamap.batches]
+        self.assertEqual(sizes[0], 10)
+        self.check_growth(metamap.batches, 2.0)
+        # Overhead is 10% of the batch time at 18000 characters, i.e.
+        # about 947 sentences, reached in a handful of doublings.
+        ideal = OVERHEAD * 0.9 / (0.1 * PER_CHAR) / len(SENTENCE)
+        settled = sizes.index(max(sizes))
+        self.assertLessEqual(settled, 8)
+        for size in sizes[settled:]:
+            self.assertAlmostEqual(size, ideal, delta=1)
+        self.assertLess(max(sizes), batcher.max_batch)
+
+    def test_model(self):
+        metamap = FakeMetaMap()
+        batcher = AdaptiveBatcher(metamap)
+        self.run_batches(metamap, batcher, 12)
+        overhead, per_char = batcher.model()
+        self.assertAlmostEqual(overhead, OVERHEAD)
+        self.assertAlmostEqual(per_char, PER_CHAR)
+
+    def test_target_latency(self):
+        metamap = FakeMetaMap()
+        batcher = AdaptiveBatcher(metamap, target_latency=5.0, max_growth=3.0)
+        self.run_batches(metamap, batcher, 30)
+        self.check_growth(metamap.batches, 3.0)
+        # (5 - 2) seconds of characters.
+        ideal = (5.0 - OVERHEAD) / PER_CHAR / len(SENTENCE)
+        for size, _ in metamap.batches[-10:]:
+            self.assertAlmostEqual(size, ideal, delta=1)
+
+    def test_failed_batches_not_modelled(self):
+        metamap = FakeMetaMap(fail_on=2)
+        batcher = AdaptiveBatcher(metamap)
+        results = self.run_batches(metamap, batcher, 4)
+        self.assertEqual([error for _, error in results],
+                         [None, 'ERROR: MetaMap failed', None, None])
+        self.assertEqual(len(batcher.history), 3)
+        # The failed batch does not count as the size to grow from.
+        self.assertEqual(metamap.batches[2], metamap.batches[1])
+
+    def test_ids(self):
+        batcher = AdaptiveBatcher(FakeMetaMap(), initial_batch=2)
+        seen = list()
+        batcher.metamap.extract_concepts = lambda sentences, ids: (seen.extend(ids), (Corpus(), None))[1]
+        list(batcher.run(['a', 'b', 'c'], ids=['x', 'y', 'z']))
+        list(batcher.run(['a', 'b', 'c']))
+        self.assertEqual(seen, ['x', 'y', 'z', 0, 1, 2])
+
+    def test_invalid_arguments(self):
+        for options in ({'min_batch': 0}, {'initial_batch': 20, 'max_batch': 10},
+                        {'max_overhead': 1}, {'max_growth': 1}):
+            with self.assertRaises(ValueError):
+                AdaptiveBatcher(FakeMetaMap(), **options)
+
+
+if __name__ == '__main__':
+    unittest.main()
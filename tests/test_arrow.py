@@ -0,0 +1,101 @@
+# Licensed under the Apache License, Version 2.0 (the "License");
+# you may not use this file except in compliance with the License.
+# You may obtain a copy of the License at
+#
+# http://www.apache.org/licenses/LICENSE-2.0
+#
+# Unless required by applicable law or agreed to in writing, software
+# distributed under the License is distributed on an "AS IS" BASIS,
+# WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.
+# See the License for the specific language governing permissions and
+# limitations under the License.
+
+import os
+import shutil
+import tempfile
+import unittest
+
+from pymetamap import Corpus, CorpusLite
+
+try:
+    import pyarrow
+except ImportError:
+    pyarrow = None
+
+MMI = """1|MMI|5.18|Myocardial Infarction|C0027051|[dsyn]|["Heart attack"-tx-1-"heart attack"-noun-0]|TX|1/12|C14.280
+1|MMI|3.46|Pain|C0030193|[sosy]|["Pain"-tx-1-"pain"-noun-0]|TX|20/4;30/4|
+2|MMI|bad|Fever|C0015967|[fndg,sosy]|["Fever"-tx-1-"fever"-noun-0]|TX|1/5|C23.888
+2|AA|HA|heart attack|1|2|2|12|1:12
+"""
+
+
+@unittest.skipUnless(pyarrow, 'pyarrow is not installed')
+class ArrowCorpusTest(unittest.TestCase):
+    def setUp(self):
+        self.directory = tempfile.mkdtemp()
+        self.addCleanup(shutil.rmtree, self.directory)
+        self.concepts = Corpus.load(MMI.splitlines())
+
+    def path(self, name):
+        return os.path.join(self.directory, name)
+
+    def test_arrow_round_trip(self):
+        path = self.path('concepts.arrow')
+        table = self.concepts.to_arrow(path)
+        self.assertEqual(table.num_rows, 4)
+        saved = Corpus.open(path)
+        self.assertEqual(len(saved), 4)
+        self.assertEqual(list(saved), list(self.concepts))
+        self.assertEqual(saved[-1], self.concepts[-1])
+        self.assertEqual(saved.to_corpus(), self.concepts)
+        self.assertIsInstance(saved.to_corpus(), Corpus)
+
+    def test_parquet_round_trip(self):
+        path = self.path('concepts.parquet')
+        self.concepts.to_parquet(path)
+        saved = Corpus.open(path)
+        self.assertEqual(list(saved), list(self.concepts))
+
+    def test_typed_columns(self):
+        table = self.concepts.to_arrow()
+        self.assertEqual(table.column('score_value').to_pylist(), [5.18, 3.46, None, None])
+        self.assertEqual(table.column('pos_start').to_pylist(), [1, 20, 1, None])
+        self.assertEqual(table.column('semtype_list').to_pylist(),
+                         [['dsyn'], ['sosy'], ['fndg', 'sosy'], None])
+
+    def test_filter(self):
+        path = self.path('concepts.arrow')
+        self.concepts.to_arrow(path)
+        saved = Corpus.open(path)
+        self.assertEqual([concept.cui for concept in saved.filter(min_score=4)], ['C0027051'])
+        self.assertEqual([concept.cui for concept in saved.filter(max_score=4)], ['C0030193'])
+        self.assertEqual([concept.cui for concept in saved.filter(semtypes='sosy')],
+                         ['C0030193', 'C0015967'])
+        self.assertEqual([concept.cui for concept in saved.filter(cuis=['C0015967'],
+                                                                  semtypes=['fndg'])],
+                         ['C0015967'])
+        self.assertEqual(len(saved.filter(min_score=4, semtypes=['sosy'])), 0)
+        self.assertIs(saved.filter(), saved)
+
+    def test_class_mismatch(self):
+        path = self.path('concepts.arrow')
+        self.concepts.to_arrow(path)
+        with self.assertRaises(ValueError) as context:
+            CorpusLite.open(path)
+        self.assertIn('holds a Corpus, not a CorpusLite', str(context.exception))
+
+    def test_empty_corpus(self):
+        for name, write in (('empty.arrow', Corpus().to_arrow),
+                            ('empty.parquet', Corpus().to_parquet)):
+            path = self.path(name)
+            write(path)
+            saved = Corpus.open(path)
+            self.assertEqual(len(saved), 0)
+            self.assertEqual(list(saved), [])
+            self.assertEqual(len(saved.filter(min_score=1, semtypes=['dsyn'])), 0)
+            with self.assertRaises(IndexError):
+                saved[0]
+
+
+if __name__ == '__main__':
+    unittest.main()
@@ -0,0 +1,129 @@
+# Licensed under the Apache License, Version 2.0 (the "License");
+# you may not use this file except in compliance with the License.
+# You may obtain a copy of the License at
+#
+# http://www.apache.org/licenses/LICENSE-2.0
+#
+# Unless required by applicable law or agreed to in writing, software
+# distributed under the License is distributed on an "AS IS" BASIS,
+# WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.
+# See the License for the specific language governing permissions and
+# limitations under the License.
+
+import asyncio
+import os
+import threading
+import unittest
+
+from pymetamap import MetaMap, MetaMapLite, MemoryCache, Instrumentation
+
+STUBS = os.path.join(os.path.dirname(os.path.dirname(os.path.abspath(__file__))),
+                     'benchmarks', 'stubs')
+METAMAP = os.path.join(STUBS, 'metamap')
+LITE_HOME = os.path.join(STUBS, 'public_mm_lite')
+
+
+class AsyncBackendTest(unittest.TestCase):
+    def run_loop(self, coroutine_function, timeout=60):
+        """ Runs coroutine_function() in asyncio.run() on a thread, so
+            that a loop which cannot shut down fails the test instead of
+            hanging it.
+        """
+        outcome = dict()
+
+        def run():
+            try:
+                outcome['result'] = asyncio.run(coroutine_function())
+            except BaseException as e:
+                outcome['error'] = e
+
+        thread = threading.Thread(target=run)
+        thread.daemon = True
+        thread.start()
+        thread.join(timeout)
+        self.assertFalse(thread.is_alive(), "the event loop did not finish")
+        if 'error' in outcome:
+            raise outcome['error']
+        return outcome['result']
+
+    def check_event_loops(self, backend):
+        async def contended():
+            # More requests than max_concurrency, so they wait on the limiter.
+            requests = [backend.extract_concepts(['fever'], [number]) for number in range(3)]
+            return await asyncio.wait_for(asyncio.gather(*requests), 20)
+
+        for _ in range(2):
+            # Each asyncio.run() has its own event loop.
+            results = self.run_loop(contended)
+            self.assertEqual([error for _, error in results], [None] * 3)
+            self.assertEqual([len(concepts) for concepts, _ in results], [3] * 3)
+
+    def test_metamap_across_event_loops(self):
+        self.check_event_loops(MetaMap.get_instance(METAMAP, backend='async', max_concurrency=1))
+
+    def test_lite_across_event_loops(self):
+        self.check_event_loops(MetaMapLite.get_instance(LITE_HOME, backend='async',
+                                                        max_concurrency=1))
+
+    def check_matches_sync(self, get_instance):
+        sentences = ['heart attack', 'fever', 'heart attack', 'cough']
+        for ids in ([10, 'b', 12, 'd'], None):
+            expected, error = get_instance().extract_concepts(sentences, ids)
+            self.assertIsNone(error)
+            for options in ({}, {'deduplicate': True}, {'cache': MemoryCache()}):
+                backend = get_instance(backend='async', **options)
+                concepts, error = self.run_loop(lambda: backend.extract_concepts(sentences, ids))
+                self.assertIsNone(error)
+                if options and ids is None:
+                    # Deduplicated and cached concepts are indexed by position.
+                    expected = get_instance(**options).extract_concepts(sentences, ids)[0]
+                self.assertEqual(concepts, expected, (ids, options))
+
+    def test_metamap_matches_sync(self):
+        self.check_matches_sync(lambda **options: MetaMap.get_instance(METAMAP, **options))
+
+    def test_lite_matches_sync(self):
+        self.check_matches_sync(lambda **options: MetaMapLite.get_instance(LITE_HOME, **options))
+
+    def check_cache(self, get_instance):
+        cache = MemoryCache()
+        instrumentation = Instrumentation()
+        expected, error = get_instance(cache=cache).extract_concepts(['fever', 'cough'], [1, 2])
+        self.assertIsNone(error)
+        backend = get_instance(backend='async', cache=cache, instrumentation=instrumentation,
+                               deduplicate=True)
+        concepts, error = self.run_loop(lambda: backend.extract_concepts(
+            ['cough', 'fever', 'rash', 'rash'], [2, 1, 3, 4]))
+        self.assertIsNone(error)
+        self.assertEqual(concepts[:6], expected[3:] + expected[:3])
+        # The async and sync backends share cache entries; only the
+        # new sentence, once, reaches MetaMap.
+        totals = instrumentation.snapshot()[backend.__class__.__name__]
+        self.assertEqual((totals['cache_hits'], totals['cache_misses']), (2, 2))
+        self.assertEqual(totals['duplicate_sentences'], 1)
+        self.assertEqual(totals['concepts'], 12)
+
+    def test_metamap_cache(self):
+        self.check_cache(lambda **options: MetaMap.get_instance(METAMAP, **options))
+
+    def test_lite_cache(self):
+        self.check_cache(lambda **options: MetaMapLite.get_instance(LITE_HOME, **options))
+
+    def test_no_sync_methods(self):
+        for backend in (MetaMap.get_instance(METAMAP, backend='async'),
+                        MetaMapLite.get_instance(LITE_HOME, backend='async')):
+            self.assertFalse(hasattr(backend, 'iter_concepts'))
+            self.assertFalse(hasattr(backend, 'extract_concepts_isolated'))
+            self.assertTrue(asyncio.iscoroutinefunction(backend.extract_concepts))
+
+    def test_unsupported_arguments(self):
+        with self.assertRaises(TypeError):
+            MetaMap.get_instance(METAMAP, backend='async', batch_timeout=5)
+        with self.assertRaises(TypeError):
+            MetaMapLite.get_instance(LITE_HOME, backend='async', servers=object())
+        with self.assertRaises(ValueError):
+            MetaMap.get_instance(METAMAP, backend='async', max_concurrency=0)
+
+
+if __name__ == '__main__':
+    unittest.main()
@@ -0,0 +1,133 @@
+# Licensed under the Apache License, Version 2.0 (the "License");
+# you may not use this file except in compliance with the License.
+# You may obtain a copy of the License at
+#
+# http://www.apache.org/licenses/LICENSE-2.0
+#
+# Unless required by applicable law or agreed to in writing, software
+# distributed under the License is distributed on an "AS IS" BASIS,
+# WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.
+# See the License for the specific language governing permissions and
+# limitations under the License.
+
+import collections
+import os
+import shutil
+import tempfile
+import unittest
+from unittest import mock
+
+from pymetamap import MetaMap, MetaMapLite, BulkJob
+
+STUBS = os.path.join(os.path.dirname(os.path.dirname(os.path.abspath(__file__))),
+                     'benchmarks', 'stubs')
+METAMAP = os.path.join(STUBS, 'metamap')
+LITE_HOME = os.path.join(STUBS, 'public_mm_lite')
+
+WORDS = ['heart attack', 'fever', 'chest pain', 'aspirin', 'cough', 'diabetes', 'rash']
+LINES = 23
+CHUNK_SIZE = 5
+CHUNKS = 5
+
+
+class BulkJobTest(unittest.TestCase):
+    def setUp(self):
+        self.directory = tempfile.mkdtemp()
+        self.addCleanup(shutil.rmtree, self.directory)
+        self.input_filename = os.path.join(self.directory, 'input.txt')
+        with open(self.input_filename, 'w') as input_file:
+            for number in range(LINES):
+                input_file.write('s{0}|{1} {0}\n'.format(number, WORDS[number % len(WORDS)]))
+        self.output_dir = os.path.join(self.directory, 'output')
+        self.metamap = MetaMap.get_instance(METAMAP)
+        expected, error = self.metamap.extract_concepts(filename=self.input_filename,
+                                                        file_format='sldiID')
+        self.assertIsNone(error)
+        self.expected = list(expected)
+
+    def job(self, metamap=None, **options):
+        options.setdefault('chunk_size', CHUNK_SIZE)
+        return BulkJob(metamap or self.metamap, self.input_filename, self.output_dir,
+                       file_format='sldiID', **options)
+
+    def test_run(self):
+        job = self.job()
+        entries = job.run()
+        self.assertEqual([entry['chunk'] for entry in entries], list(range(CHUNKS)))
+        self.assertEqual([entry['first_line'] for entry in entries], [0, 5, 10, 15, 20])
+        self.assertEqual(sum(entry['lines'] for entry in entries), LINES)
+        self.assertTrue(all(entry['error'] is None for entry in entries))
+        self.assertEqual(list(job.iter_concepts()), self.expected)
+        self.assertEqual(job.completed_chunks(), list(range(CHUNKS)))
+        # Nothing is left to do, and no temporary files are left behind.
+        self.assertEqual(self.job().run(), [])
+        self.assertEqual(sorted(name for name in os.listdir(self.output_dir)
+                                if not name.startswith('chunk-') or not name.endswith('.mmi')),
+                         ['manifest-0-of-1.jsonl'])
+
+    def test_lite(self):
+        lite = MetaMapLite.get_instance(LITE_HOME)
+        job = BulkJob(lite, self.input_filename, self.output_dir, chunk_size=CHUNK_SIZE)
+        job.run()
+        expected, error = lite.extract_concepts(filename=self.input_filename)
+        self.assertIsNone(error)
+        self.assertEqual(list(job.iter_concepts()), list(expected))
+
+    def test_resume_after_interruption(self):
+        self.assertEqual(len(self.job().run(max_chunks=2)), 2)
+
+        # The next run is interrupted while MetaMap works on its chunk.
+        job = self.job()
+        with mock.patch.object(self.metamap, 'extract_concepts', side_effect=KeyboardInterrupt):
+            with self.assertRaises(KeyboardInterrupt):
+                job.run()
+        # A crash while appending to the manifest leaves a partial line.
+        with open(job.manifest_filename, 'a') as manifest:
+            manifest.write('{"chunk": 2, "err')
+
+        self.assertEqual(self.job().completed_chunks(), [0, 1])
+        entries = self.job().run()
+        self.assertEqual([entry['chunk'] for entry in entries], [2, 3, 4])
+        concepts = list(self.job().iter_concepts())
+        self.assertEqual(concepts, self.expected)
+        # Every line's concepts are written exactly once.
+        counts = collections.Counter(concept.index for concept in concepts)
+        self.assertEqual(set(counts.values()), set([3]))
+        self.assertEqual(len(counts), LINES)
+
+    def test_failed_chunk_is_retried(self):
+        with mock.patch.dict(os.environ, {'FAKE_METAMAP_FAIL_ON': 's7|'}):
+            entries = self.job().run()
+        failed = [entry for entry in entries if entry['error'] is not None]
+        self.assertEqual([entry['chunk'] for entry in failed], [1])
+        self.assertEqual(failed[0]['error'], 'ERROR: MetaMap failed')
+        self.assertNotIn('output', failed[0])
+        self.assertFalse(os.path.exists(self.job().output_filename(1)))
+        self.assertEqual(self.job().completed_chunks(), [0, 2, 3, 4])
+
+        entries = self.job().run()
+        self.assertEqual([(entry['chunk'], entry['error']) for entry in entries], [(1, None)])
+        self.assertEqual(list(self.job().iter_concepts()), self.expected)
+
+    def test_workers_split_chunks(self):
+        first = self.job(worker_index=0, worker_count=2).run()
+        second = self.job(worker_index=1, worker_count=2).run()
+        self.assertEqual([entry['chunk'] for entry in first], [0, 2, 4])
+        self.assertEqual([entry['chunk'] for entry in second], [1, 3])
+        self.assertEqual(list(self.job(worker_index=1, worker_count=2).iter_concepts()),
+                         self.expected)
+
+    def test_manifest_of_other_input(self):
+        self.job().run(max_chunks=1)
+        with self.assertRaises(ValueError):
+            self.job(chunk_size=7).run()
+
+    def test_invalid_arguments(self):
+        for options in ({'chunk_size': 0}, {'worker_count': 0},
+                        {'worker_index': 2, 'worker_count': 2}):
+            with self.assertRaises(ValueError):
+                self.job(**options)
+
+
+if __name__ == '__main__':
+    unittest.main()
@@ -0,0 +1,71 @@
+# Licensed under the Apache License, Version 2.0 (the "License");
+# you may not use this file except in compliance with the License.
+# You may obtain a copy of the License at
+#
+# http://www.apache.org/licenses/LICENSE-2.0
+#
+# Unless required by applicable law or agreed to in writing, software
+# distributed under the License is distributed on an "AS IS" BASIS,
+# WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.
+# See the License for the specific language governing permissions and
+# limitations under the License.
+
+import os
+import unittest
+
+from pymetamap import MetaMap, MetaMapLite
+from pymetamap.Cache import MemoryCache
+
+STUBS = os.path.join(os.path.dirname(os.path.dirname(os.path.abspath(__file__))),
+                     'benchmarks', 'stubs')
+METAMAP = os.path.join(STUBS, 'metamap')
+LITE_HOME = os.path.join(STUBS, 'public_mm_lite')
+
+SENTENCES = ['heart attack', 'fever and pain', 'heart attack']
+
+
+class CacheIndexTest(unittest.TestCase):
+    def check_cached(self, get_instance, ids):
+        expected, error = get_instance().extract_concepts(SENTENCES, ids)
+        self.assertIsNone(error)
+        backend = get_instance(cache=MemoryCache())
+        for _ in range(2):
+            # Filled on the first call, served from the cache on the second.
+            concepts, error = backend.extract_concepts(SENTENCES, ids)
+            self.assertIsNone(error)
+            self.assertEqual(concepts, expected)
+
+    def test_metamap_string_ids(self):
+        self.check_cached(lambda **options: MetaMap.get_instance(METAMAP, **options),
+                          ['a', 'b', 'c'])
+
+    def test_metamap_int_ids(self):
+        self.check_cached(lambda **options: MetaMap.get_instance(METAMAP, **options),
+                          [1, 2, 3])
+
+    def test_lite_string_ids(self):
+        self.check_cached(lambda **options: MetaMapLite.get_instance(LITE_HOME, **options),
+                          ['a', 'b', 'c'])
+
+
+class DeduplicateIndexTest(unittest.TestCase):
+    def check_deduplicated(self, get_instance, ids):
+        expected, error = get_instance().extract_concepts(SENTENCES, ids)
+        self.assertIsNone(error)
+        concepts, error = get_instance(deduplicate=True).extract_concepts(SENTENCES, ids)
+        self.assertIsNone(error)
+        self.assertEqual(concepts, expected)
+
+    def test_metamap(self):
+        get_instance = lambda **options: MetaMap.get_instance(METAMAP, **options)
+        self.check_deduplicated(get_instance, ['a', 'b', 'c'])
+        self.check_deduplicated(get_instance, [1, 2, 3])
+
+    def test_lite(self):
+        get_instance = lambda **options: MetaMapLite.get_instance(LITE_HOME, **options)
+        self.check_deduplicated(get_instance, ['a', 'b', 'c'])
+        self.check_deduplicated(get_instance, [1, 2, 3])
+
+
+if __name__ == '__main__':
+    unittest.main()
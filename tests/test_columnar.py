@@ -0,0 +1,100 @@
+# Licensed under the Apache License, Version 2.0 (the "License");
+# you may not use this file except in compliance with the License.
+# You may obtain a copy of the License at
+#
+# http://www.apache.org/licenses/LICENSE-2.0
+#
+# Unless required by applicable law or agreed to in writing, software
+# distributed under the License is distributed on an "AS IS" BASIS,
+# WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.
+# See the License for the specific language governing permissions and
+# limitations under the License.
+
+import unittest
+from array import array
+from unittest import mock
+
+from pymetamap import ColumnarCorpus, Corpus, CorpusLite
+
+MMI = """1|MMI|5.18|Myocardial Infarction|C0027051|[dsyn]|["Heart attack"-tx-1-"heart attack"-noun-0]|TX|1/12|C14.280
+1|MMI|3.50|Pain|C0030193|[sosy]|["Pain"-tx-1-"pain"-noun-0]|TX|20/4;30/4|
+2|MMI|1000|Fever|C0015967|[fndg,sosy]|["Fever"-tx-1-"fever"-noun-0]|TX|1/5|C23.888
+2|AA|HA|heart attack|1|2|2|12|1:12
+3|MMI|bad|Pain|C0030193|[sosy]|["ache"-tx-1-"ache"-noun-0]|TX|7/4|
+"""
+
+LITE = """'d1'|MMI|3.5|Fever|C0015967|sosy|"fever"-text-0-"fever"-NN-0|0/5|
+'d1'|MMI|3.25|Pain|C0030193|sosy|"pain"-text-1-"pain"-NN-0|10/4|
+"""
+
+
+class ColumnarCorpusTest(unittest.TestCase):
+    def setUp(self):
+        self.concepts = Corpus.load(MMI.splitlines())
+        self.columnar = ColumnarCorpus.from_corpus(self.concepts)
+
+    def test_round_trip(self):
+        self.assertEqual(len(self.columnar), 5)
+        self.assertEqual(list(self.columnar), list(self.concepts))
+        self.assertEqual(list(ColumnarCorpus.load(MMI.splitlines())), list(self.concepts))
+        lite = CorpusLite.load(LITE.splitlines())
+        self.assertEqual(list(ColumnarCorpus.from_corpus(lite)), list(lite))
+
+    def test_typed_columns(self):
+        self.assertEqual(list(self.columnar.score[:3]), [5.18, 3.5, 1000.0])
+        # Score text is rebuilt from the float and its decimals.
+        self.assertEqual([concept.score for concept in self.columnar if concept[1] == 'MMI'],
+                         ['5.18', '3.50', '1000', 'bad'])
+        self.assertEqual(self.columnar.score_text, {4: 'bad'})
+        self.assertEqual(list(self.columnar.pos_start), [1, 20, 1, -1, 7])
+        self.assertEqual(self.columnar.semtypes(2), ['fndg', 'sosy'])
+        self.assertEqual(self.columnar.semtypes(3), [])
+
+    def test_unique_text_not_interned(self):
+        strings = set(self.columnar.strings.strings)
+        for concept in self.concepts:
+            if concept[1] == 'MMI':
+                self.assertNotIn(concept.trigger, strings)
+                self.assertNotIn(concept.pos_info, strings)
+                self.assertNotIn(concept.score, strings)
+        self.assertIn('C0030193', strings)
+
+    def test_indexing_and_slices(self):
+        self.assertEqual(self.columnar[0], self.concepts[0])
+        self.assertEqual(self.columnar[-1], self.concepts[-1])
+        self.assertIs(self.columnar[3], self.concepts[3])
+        for bad in (5, -6):
+            with self.assertRaises(IndexError):
+                self.columnar[bad]
+        for window in (slice(1, 4), slice(None, None, -2), slice(10, 20)):
+            subset = self.columnar[window]
+            self.assertIsInstance(subset, ColumnarCorpus)
+            self.assertEqual(list(subset), self.concepts[window])
+        self.assertIs(self.columnar[1:].strings, self.columnar.strings)
+
+    def check_select(self):
+        columnar = self.columnar
+        for rows, expected in ((columnar.select(min_score=4), [0, 2]),
+                               (columnar.select(max_score=4), [1]),
+                               (columnar.select(cuis='C0030193'), [1, 4]),
+                               (columnar.select(semtypes=['fndg', 'dsyn']), [0, 2]),
+                               (columnar.select(semtypes='sosy', min_score=2), [1, 2]),
+                               (columnar.select(cuis=['C9999999']), []),
+                               (columnar.select(), [0, 1, 2, 3, 4]),
+                               (ColumnarCorpus().select(min_score=1), [])):
+            self.assertIsInstance(rows, array)
+            self.assertEqual(rows.typecode, 'i')
+            self.assertEqual(list(rows), expected)
+        filtered = columnar.filter(semtypes='sosy')
+        self.assertEqual(list(filtered), [self.concepts[row] for row in (1, 2, 4)])
+
+    def test_select(self):
+        self.check_select()
+
+    def test_select_without_numpy(self):
+        with mock.patch('pymetamap.ColumnarCorpus.numpy', None):
+            self.check_select()
+
+
+if __name__ == '__main__':
+    unittest.main()
@@ -0,0 +1,136 @@
+# Licensed under the Apache License, Version 2.0 (the "License");
+# you may not use this file except in compliance with the License.
+# You may obtain a copy of the License at
+#
+# http://www.apache.org/licenses/LICENSE-2.0
+#
+# Unless required by applicable law or agreed to in writing, software
+# distributed under the License is distributed on an "AS IS" BASIS,
+# WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.
+# See the License for the specific language governing permissions and
+# limitations under the License.
+
+import contextlib
+import io
+import json
+import os
+import shutil
+import tempfile
+import unittest
+from unittest import mock
+
+from pymetamap import MetaMap, MetaMapLite
+from pymetamap.CommandLine import main
+
+STUBS = os.path.join(os.path.dirname(os.path.dirname(os.path.abspath(__file__))),
+                     'benchmarks', 'stubs')
+METAMAP = os.path.join(STUBS, 'metamap')
+LITE_HOME = os.path.join(STUBS, 'public_mm_lite')
+
+TEXTS = ['heart attack', 'fever', 'chest pain', 'aspirin daily', 'cough', 'no fever', 'rash']
+IDS = ['n{0}'.format(number) for number in range(len(TEXTS))]
+
+
+class CommandLineTest(unittest.TestCase):
+    def setUp(self):
+        self.directory = tempfile.mkdtemp()
+        self.addCleanup(shutil.rmtree, self.directory)
+
+    def write(self, name, lines):
+        path = os.path.join(self.directory, name)
+        with open(path, 'w') as input_file:
+            input_file.write(''.join(line + '\n' for line in lines))
+        return path
+
+    def run_main(self, argv, stdin=''):
+        """ Returns (exit status, stdout, stderr) of main(argv). """
+        stdout = io.StringIO()
+        stderr = io.StringIO()
+        with mock.patch('sys.stdin', io.StringIO(stdin)), \
+                contextlib.redirect_stdout(stdout), contextlib.redirect_stderr(stderr):
+            status = main(argv)
+        return status, stdout.getvalue(), stderr.getvalue()
+
+    def expected_mmi(self, backend, ids=IDS):
+        concepts, error = backend.extract_concepts(TEXTS, ids)
+        self.assertIsNone(error)
+        return ''.join(concept.as_mmi() + '\n' for concept in concepts)
+
+    def test_sldi_id_file_to_mmi_file(self):
+        source = self.write('notes.txt', ['{0}|{1}'.format(*item) for item in zip(IDS, TEXTS)])
+        output = os.path.join(self.directory, 'notes.mmi')
+        status, stdout, stderr = self.run_main(['--metamap', METAMAP, '--input-format', 'sldiID',
+                                                '-o', output, source])
+        self.assertEqual(status, 0)
+        self.assertEqual(stdout, '')
+        with open(output) as output_file:
+            self.assertEqual(output_file.read(), self.expected_mmi(MetaMap.get_instance(METAMAP)))
+        self.assertIn('7 documents, 21 concepts, 0 failed batches', stderr)
+
+    def test_sldi_stdin_numbered_in_order(self):
+        # Batches run on several workers but are written in input order.
+        status, stdout, stderr = self.run_main(['--metamap', METAMAP, '--workers', '3',
+                                                '--batch-size', '2', '--progress-interval', '0'],
+                                               stdin='\n'.join(TEXTS) + '\n\n')
+        self.assertEqual(status, 0)
+        self.assertEqual(stdout, self.expected_mmi(MetaMap.get_instance(METAMAP),
+                                                   list(range(len(TEXTS)))))
+        self.assertEqual(stderr, '')
+
+    def test_sldi_numbering_across_files(self):
+        first = self.write('first.txt', TEXTS[:3])
+        second = self.write('second.txt', TEXTS[3:])
+        status, stdout, stderr = self.run_main(['--metamap', METAMAP, '--batch-size', '4',
+                                                first, second])
+        self.assertEqual(status, 0)
+        self.assertEqual(stdout, self.expected_mmi(MetaMap.get_instance(METAMAP),
+                                                   list(range(len(TEXTS)))))
+
+    def test_jsonl_lite(self):
+        source = self.write('notes.jsonl', [json.dumps({'doc': identifier, 'body': text})
+                                            for identifier, text in zip(IDS, TEXTS)])
+        status, stdout, stderr = self.run_main(['--lite', LITE_HOME, '--input-format', 'jsonl',
+                                                '--id-field', 'doc', '--text-field', 'body',
+                                                '--output-format', 'jsonl', '--backend', 'persistent',
+                                                '--workers', '2', '--batch-size', '3', source])
+        self.assertEqual(status, 0)
+        rows = [json.loads(line) for line in stdout.splitlines()]
+        concepts, error = MetaMapLite.get_instance(LITE_HOME).extract_concepts(TEXTS, IDS)
+        self.assertEqual(rows, [dict(concept._asdict(), index=concept.index.strip("'"))
+                                for concept in concepts])
+        self.assertEqual([row['index'] for row in rows[::3]], IDS)
+
+    def test_failed_batch(self):
+        with mock.patch.dict(os.environ, {'FAKE_METAMAP_FAIL_ON': 'cough'}):
+            status, stdout, stderr = self.run_main(['--metamap', METAMAP, '--batch-size', '2'],
+                                                   stdin='\n'.join(TEXTS))
+        self.assertEqual(status, 1)
+        self.assertIn('ERROR: MetaMap failed', stderr)
+        self.assertIn('1 failed batches', stderr)
+        # The other batches are still written.
+        self.assertEqual(set(line.split('|')[0] for line in stdout.splitlines()),
+                         set(['0', '1', '2', '3', '6']))
+
+    def test_cache_across_runs(self):
+        cache = os.path.join(self.directory, 'cache.db')
+        argv = ['--metamap', METAMAP, '--cache', cache, '--memory-cache', '10', '--deduplicate']
+        status, expected, stderr = self.run_main(argv, stdin='\n'.join(TEXTS))
+        self.assertEqual(status, 0)
+        # Served from the cache although MetaMap now fails on everything.
+        with mock.patch.dict(os.environ, {'FAKE_METAMAP_FAIL_ON': '|'}):
+            status, stdout, stderr = self.run_main(argv, stdin='\n'.join(TEXTS))
+        self.assertEqual(status, 0)
+        self.assertEqual(stdout, expected)
+
+    def test_argument_errors(self):
+        for argv in ([], ['--metamap', METAMAP, '--lite', LITE_HOME],
+                     ['--metamap', METAMAP, '--workers', '0'],
+                     ['--metamap', METAMAP, '--batch-size', '0'],
+                     ['--metamap', METAMAP, '--input-format', 'xml']):
+            with self.assertRaises(SystemExit) as context:
+                self.run_main(argv)
+            self.assertEqual(context.exception.code, 2)
+
+
+if __name__ == '__main__':
+    unittest.main()
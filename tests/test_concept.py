@@ -0,0 +1,79 @@
+# Licensed under the Apache License, Version 2.0 (the "License");
+# you may not use this file except in compliance with the License.
+# You may obtain a copy of the License at
+#
+# http://www.apache.org/licenses/LICENSE-2.0
+#
+# Unless required by applicable law or agreed to in writing, software
+# distributed under the License is distributed on an "AS IS" BASIS,
+# WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.
+# See the License for the specific language governing permissions and
+# limitations under the License.
+
+import unittest
+from unittest import mock
+
+from pymetamap import Corpus, CorpusLite
+from pymetamap.Concept import Trigger
+
+MMI = ('1|MMI|5.18|Fever|C0015967|[fndg,sosy]|["Fever"-tx-1-"fever"-noun-0,'
+       '"pyrexia"-tx-2-"pyrexia"-noun-1]|TX|228/6;136/5|C23.888')
+MMI_OLD = '2|MMI|4.00|Diabetes Mellitus, Type 2|C0011860|[dsyn]|["Type-2 diabetes"-ab-1-"type-2 diabetes"]|AB|[4061/10,4075/11],[5000/3]|'
+MMI_EMPTY = '3|MMI|1.00|Pain|C0030193|[]||TX||'
+AA = '4|AA|HA|heart attack|1|2|2|12|1:12'
+LITE = "'d1'|MMI|3.5|Fever|C0015967|fndg,sosy|\"fever\"-text-0-\"fever\"-NN-0|0/5|"
+LITE_EMPTY = "'d2'|MMI|3.5|Fever|C0015967|||0:5;10:5|"
+
+
+class ConceptAccessorTest(unittest.TestCase):
+    def test_semtype_list(self):
+        concepts = Corpus.load([MMI, MMI_OLD, MMI_EMPTY])
+        self.assertEqual([concept.semtype_list for concept in concepts],
+                         [['fndg', 'sosy'], ['dsyn'], []])
+        lite = CorpusLite.load([LITE, LITE_EMPTY])
+        self.assertEqual([concept.semtype_list for concept in lite], [['fndg', 'sosy'], []])
+
+    def test_spans(self):
+        concepts = Corpus.load([MMI, MMI_OLD, MMI_EMPTY, AA])
+        self.assertEqual([concept.spans for concept in concepts],
+                         [[(228, 6), (136, 5)], [(4061, 10), (4075, 11), (5000, 3)], [], [(1, 12)]])
+        lite = CorpusLite.load([LITE, LITE_EMPTY])
+        self.assertEqual([concept.spans for concept in lite], [[(0, 5)], [(0, 5), (10, 5)]])
+
+    def test_triggers(self):
+        concept, old, empty = Corpus.load([MMI, MMI_OLD, MMI_EMPTY])
+        self.assertEqual(concept.triggers,
+                         [Trigger('Fever', 'tx', 1, 'fever', 'noun', False),
+                          Trigger('pyrexia', 'tx', 2, 'pyrexia', 'noun', True)])
+        # Older MetaMap versions omit part of speech and negation.
+        self.assertEqual(old.triggers,
+                         [Trigger('Type-2 diabetes', 'ab', 1, 'type-2 diabetes', None, None)])
+        self.assertEqual(empty.triggers, [])
+        lite, lite_empty = CorpusLite.load([LITE, LITE_EMPTY])
+        self.assertEqual(lite.triggers, [Trigger('fever', 'text', 0, 'fever', 'NN', False)])
+        self.assertEqual(lite_empty.triggers, [])
+
+    def test_parsed_once_and_cached(self):
+        concept = Corpus.load([MMI])[0]
+        self.assertNotIn('spans', concept.__dict__)
+        with mock.patch('pymetamap.Concept.parse_spans', wraps=lambda pos_info: [(0, 1)]) as parse:
+            first = concept.spans
+            second = concept.spans
+        self.assertIs(first, second)
+        self.assertEqual(parse.call_count, 1)
+        self.assertIn('spans', concept.__dict__)
+        # Cached values are not part of the tuple.
+        self.assertEqual(concept, Corpus.load([MMI])[0])
+        self.assertEqual(concept.as_mmi(), MMI)
+
+    def test_unused_fields_not_parsed(self):
+        with mock.patch('pymetamap.Concept.parse_triggers') as parse_triggers, \
+                mock.patch('pymetamap.Concept.parse_semtypes') as parse_semtypes:
+            concepts = Corpus.load([MMI, MMI_OLD])
+            [concept.cui for concept in concepts]
+        self.assertFalse(parse_triggers.called)
+        self.assertFalse(parse_semtypes.called)
+
+
+if __name__ == '__main__':
+    unittest.main()
@@ -0,0 +1,99 @@
+# Licensed under the Apache License, Version 2.0 (the "License");
+# you may not use this file except in compliance with the License.
+# You may obtain a copy of the License at
+#
+# http://www.apache.org/licenses/LICENSE-2.0
+#
+# Unless required by applicable law or agreed to in writing, software
+# distributed under the License is distributed on an "AS IS" BASIS,
+# WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.
+# See the License for the specific language governing permissions and
+# limitations under the License.
+
+import random
+import unittest
+
+from pymetamap import Corpus, CorpusLite, ColumnarCorpus, CorpusIndex
+from pymetamap.Concept import parse_spans
+
+MMI = """'d1'|MMI|14.64|Myocardial Infarction|C0027051|[dsyn]|["Heart attack"-tx-1-"heart attack"-noun-0]|TX|0/12|C14.280
+'d1'|MMI|5.18|Fever|C0015967|[fndg,sosy]|["Fever"-tx-1-"fever"-noun-0]|TX|20/5|C23.888
+'d1'|MMI|3.46|Pain|C0030193|[sosy]|["Pain"-tx-1-"pain"-noun-0]|TX|30/4;50/4|C23.888
+'d2'|MMI|9.00|Myocardial Infarction|C0027051|[dsyn]|["MI"-tx-1-"mi"-noun-0]|TX|[4/2],[100/2]|C14.280
+d3|MMI|bad|Aspirin|C0004057|[orch,phsu]|["Aspirin"-tx-1-"aspirin"-noun-0]|TX|7/7|D02
+"""
+
+LITE = """d1|MMI|3.5|Fever|C0015967|sosy|"fever"-text-0-"fever"-NN-0|0/5|
+d1|MMI|3.25|Pain|C0030193|sosy|"pain"-text-1-"pain"-NN-0|10/4|
+"""
+
+
+class CorpusIndexTest(unittest.TestCase):
+    def setUp(self):
+        self.concepts = Corpus.load(MMI.splitlines())
+        self.index = CorpusIndex(self.concepts)
+
+    def names(self, concepts):
+        return [concept.preferred_name for concept in concepts]
+
+    def test_keeps_indexable_corpus(self):
+        self.assertIs(self.index.concepts, self.concepts)
+        columnar = ColumnarCorpus.from_corpus(self.concepts)
+        self.assertIs(CorpusIndex(columnar).concepts, columnar)
+        index = CorpusIndex(concept for concept in self.concepts)
+        self.assertEqual(list(index.concepts), list(self.concepts))
+        self.assertEqual(len(index), 5)
+
+    def test_query(self):
+        self.assertEqual(self.names(self.index.query(cuis='C0027051')),
+                         ['Myocardial Infarction', 'Myocardial Infarction'])
+        self.assertEqual(self.names(self.index.query(semtypes=['sosy'], ids='d1')), ['Fever', 'Pain'])
+        self.assertEqual(self.names(self.index.query(min_score=5, max_score=10)),
+                         ['Fever', 'Myocardial Infarction'])
+        self.assertEqual(self.names(self.index.query(cuis='C0027051', min_score=10)),
+                         ['Myocardial Infarction'])
+        self.assertEqual(self.index.query(cuis='C9999999'), [])
+        self.assertEqual(self.index.query(), list(self.concepts))
+
+    def test_ids(self):
+        self.assertEqual(self.index.ids(cui='C0027051'), ['d1', 'd2'])
+        self.assertEqual(self.index.ids(semtype='orch'), ['d3'])
+
+    def test_overlapping(self):
+        self.assertEqual(self.names(self.index.overlapping('d1', 10, 31)),
+                         ['Myocardial Infarction', 'Fever', 'Pain'])
+        self.assertEqual(self.names(self.index.overlapping("'d1'", 25, 30)), [])
+        self.assertEqual(self.names(self.index.overlapping('d1', 52, 53)), ['Pain'])
+        self.assertEqual(self.names(self.index.overlapping('d2', 101, 200)), ['Myocardial Infarction'])
+        self.assertEqual(self.index.overlapping('d4', 0, 100), [])
+
+    def test_lite(self):
+        index = CorpusIndex(CorpusLite.load(LITE.splitlines()))
+        self.assertEqual(self.names(index.overlapping('d1', 4, 11)), ['Fever', 'Pain'])
+        self.assertEqual(self.names(index.query(min_score=3.3)), ['Fever'])
+
+    def test_overlapping_matches_scan(self):
+        generator = random.Random(7)
+        lines = list()
+        for row in range(500):
+            spans = list()
+            for _ in range(generator.randint(1, 3)):
+                # Mostly short spans, with a few covering most of the text.
+                length = generator.choice([generator.randint(0, 10)] * 9 + [generator.randint(500, 5000)])
+                spans.append('{0}/{1}'.format(generator.randint(0, 5000), length))
+            lines.append("d{0}|MMI|1.0|Name|C{1:07d}|[dsyn]|[]|TX|{2}|".format(
+                row % 3, row, ';'.join(spans)))
+        concepts = Corpus.load(lines)
+        index = CorpusIndex(concepts)
+        for _ in range(300):
+            identifier = 'd{0}'.format(generator.randint(0, 3))
+            start = generator.randint(-10, 5100)
+            end = start + generator.randint(0, 200)
+            expected = [concept for concept in concepts if concept.index == identifier and
+                        any(begin < end and begin + length > start
+                            for begin, length in parse_spans(concept.pos_info))]
+            self.assertEqual(index.overlapping(identifier, start, end), expected, (identifier, start, end))
+
+
+if __name__ == '__main__':
+    unittest.main()
@@ -0,0 +1,126 @@
+# Licensed under the Apache License, Version 2.0 (the "License");
+# you may not use this file except in compliance with the License.
+# You may obtain a copy of the License at
+#
+# http://www.apache.org/licenses/LICENSE-2.0
+#
+# Unless required by applicable law or agreed to in writing, software
+# distributed under the License is distributed on an "AS IS" BASIS,
+# WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.
+# See the License for the specific language governing permissions and
+# limitations under the License.
+
+import os
+import socket
+import threading
+import time
+import unittest
+
+from pymetamap import MetaMap, Coordinator, Worker
+from pymetamap.Distributed import send_message, receive_message
+
+STUBS = os.path.join(os.path.dirname(os.path.dirname(os.path.abspath(__file__))),
+                     'benchmarks', 'stubs')
+METAMAP = os.path.join(STUBS, 'metamap')
+
+
+class DistributedTest(unittest.TestCase):
+    def coordinator(self, **options):
+        coordinator = Coordinator(**options)
+        self.addCleanup(coordinator.close)
+        return coordinator
+
+    def start_workers(self, coordinator, count):
+        threads = list()
+        for _ in range(count):
+            worker = Worker(MetaMap.get_instance(METAMAP), coordinator.address,
+                            poll_interval=0.05)
+            thread = threading.Thread(target=worker.run)
+            thread.daemon = True
+            thread.start()
+            threads.append((worker, thread))
+        return threads
+
+    def test_two_workers_in_order_once(self):
+        coordinator = self.coordinator(batch_size=3)
+        workers = self.start_workers(coordinator, 2)
+        sentences = ['heart attack', 'fever', 'pain', 'aspirin'] * 5
+        ids = list(range(len(sentences)))
+
+        batches = list(coordinator.run(sentences, ids))
+        coordinator.close()
+        for worker, thread in workers:
+            thread.join(10)
+            self.assertFalse(thread.is_alive())
+
+        self.assertEqual(len(batches), 7)
+        self.assertTrue(all(error is None for _, error in batches))
+        indexes = [concept.index for concepts, _ in batches for concept in concepts]
+        # Three concepts per sentence, every sentence once, in input order.
+        self.assertEqual(indexes, [str(i) for i in ids for _ in range(3)])
+        self.assertEqual(sum(worker.batches for worker, _ in workers), 7)
+
+        expected, error = MetaMap.get_instance(METAMAP).extract_concepts(sentences, ids)
+        self.assertEqual([concept for concepts, _ in batches for concept in concepts],
+                         list(expected))
+
+    def lease(self, coordinator):
+        connection = socket.create_connection(coordinator.address)
+        stream = connection.makefile('rwb')
+        send_message(stream, {'type': 'lease'})
+        message = receive_message(stream)
+        return connection, stream, message
+
+    def test_disconnects_count_as_attempts(self):
+        coordinator = self.coordinator(max_attempts=2)
+        leases = list()
+
+        def disconnecting_worker():
+            # Leases the batch and goes away without answering.
+            while len(leases) < 2:
+                connection, stream, message = self.lease(coordinator)
+                if message['type'] == 'batch':
+                    leases.append(message['attempt'])
+                stream.close()
+                connection.close()
+
+        thread = threading.Thread(target=disconnecting_worker)
+        thread.daemon = True
+        thread.start()
+        concepts, error = coordinator.extract_concepts(['fever'], [1])
+        thread.join(10)
+        self.assertEqual(leases, [1, 2])
+        self.assertEqual(len(concepts), 0)
+        self.assertIn('disconnected', error)
+
+    def test_expired_leases_count_as_attempts(self):
+        coordinator = self.coordinator(max_attempts=2, lease_timeout=0.2)
+        held = list()
+
+        def silent_worker():
+            # Leases the batch and never answers nor disconnects.
+            connection = socket.create_connection(coordinator.address)
+            stream = connection.makefile('rwb')
+            while len(held) < 2:
+                send_message(stream, {'type': 'lease'})
+                message = receive_message(stream)
+                if message['type'] == 'batch':
+                    held.append(message['attempt'])
+                else:
+                    time.sleep(0.05)
+            held.append((connection, stream))
+
+        thread = threading.Thread(target=silent_worker)
+        thread.daemon = True
+        thread.start()
+        concepts, error = coordinator.extract_concepts(['fever'], [1])
+        thread.join(10)
+        self.assertEqual(held[:2], [1, 2])
+        self.assertIn('not answered within 0.2 seconds', error)
+        for item in held[2:]:
+            item[1].close()
+            item[0].close()
+
+
+if __name__ == '__main__':
+    unittest.main()
@@ -0,0 +1,106 @@
+# Licensed under the Apache License, Version 2.0 (the "License");
+# you may not use this file except in compliance with the License.
+# You may obtain a copy of the License at
+#
+# http://www.apache.org/licenses/LICENSE-2.0
+#
+# Unless required by applicable law or agreed to in writing, software
+# distributed under the License is distributed on an "AS IS" BASIS,
+# WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.
+# See the License for the specific language governing permissions and
+# limitations under the License.
+
+import os
+import re
+import unittest
+from unittest import mock
+
+from pymetamap import MetaMap, MetaMapLite, DocumentAnnotator, Corpus, CorpusLite
+from pymetamap.DocumentAnnotator import segment_text
+from pymetamap.SubprocessBackend import input_offsets
+
+STUBS = os.path.join(os.path.dirname(os.path.dirname(os.path.abspath(__file__))),
+                     'benchmarks', 'stubs')
+METAMAP = os.path.join(STUBS, 'metamap')
+LITE_HOME = os.path.join(STUBS, 'public_mm_lite')
+
+DOCUMENTS = ['Fever and chest pain.\n\nHe said "it\'s bad" about aspirin today.',
+             'Back\\slash caf\xe9 nausea\there.']
+MATCHED = re.compile(r'"([^"]*)"')
+
+
+class InputOffsetsTest(unittest.TestCase):
+    def test_maps_literal_to_sentence(self):
+        for sentence in ['heart attack', "it's", 'say "it\'s"', 'a\\b', 'tab\there', 'caf\xe9', '']:
+            literal = repr(sentence)
+            offsets = input_offsets(sentence)
+            self.assertEqual(len(offsets), len(literal) + 1)
+            self.assertEqual((offsets[0], offsets[1], offsets[-1]), (0, 0, len(sentence)))
+            for position, char in enumerate(sentence):
+                # The first input offset of each character's escape.
+                self.assertEqual(offsets[1 + len(repr(sentence[:position])) - 2], position)
+
+
+class DocumentAnnotatorTest(object):
+    """ Tests shared by MetaMap and MetaMapLite; subclasses set backend
+        and corpus_class.
+    """
+    def annotate(self, documents, ids=None):
+        with mock.patch.dict(os.environ, {'FAKE_METAMAP_CONCEPTS': '5'}):
+            concepts, error = DocumentAnnotator(self.backend(), max_segment_length=40).extract_concepts(
+                documents, ids)
+        self.assertIsNone(error)
+        self.assertIsInstance(concepts, self.corpus_class)
+        return concepts
+
+    def test_pos_info_points_into_document(self):
+        concepts = self.annotate(DOCUMENTS, ['a', 'b'])
+        self.assertEqual(sorted(set(concept.index for concept in concepts)), ['a', 'b'])
+        documents = dict(zip(['a', 'b'], DOCUMENTS))
+        matched = set()
+        for concept in concepts:
+            word = MATCHED.search(concept.trigger).group(1)
+            start, length = [int(number) for number in re.split('[/:]', concept.pos_info)]
+            self.assertEqual(documents[concept.index][start:start + length], word, concept)
+            matched.add((concept.index, word, start))
+        # Words after an escaped quote, backslash or non-ASCII character.
+        self.assertIn(('a', 'about', 42), matched)
+        self.assertIn(('b', 'nausea', 16), matched)
+
+    def test_ids_default_to_position(self):
+        concepts = self.annotate(DOCUMENTS)
+        self.assertEqual(sorted(set(concept.index for concept in concepts)), ['0', '1'])
+
+    def test_empty_documents(self):
+        self.assertEqual(self.annotate(['', ' \n\n ']), self.corpus_class())
+
+
+class MetaMapDocumentAnnotatorTest(DocumentAnnotatorTest, unittest.TestCase):
+    corpus_class = Corpus
+
+    def backend(self):
+        return MetaMap.get_instance(METAMAP)
+
+
+class MetaMapLiteDocumentAnnotatorTest(DocumentAnnotatorTest, unittest.TestCase):
+    corpus_class = CorpusLite
+
+    def backend(self):
+        return MetaMapLite.get_instance(LITE_HOME)
+
+
+class SegmentTextTest(unittest.TestCase):
+    def test_segments(self):
+        text = 'First paragraph.\n\n  Second one. It is longer than the limit here.'
+        segments = segment_text(text, max_length=20)
+        for start, segment in segments:
+            self.assertEqual(text[start:start + len(segment)], segment)
+            self.assertLessEqual(len(segment), 20)
+        self.assertEqual([segment for _, segment in segments],
+                         ['First paragraph.', 'Second one.', 'It is longer than', 'the limit here.'])
+        with self.assertRaises(ValueError):
+            segment_text(text, max_length=0)
+
+
+if __name__ == '__main__':
+    unittest.main()
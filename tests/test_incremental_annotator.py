@@ -0,0 +1,160 @@
+# Licensed under the Apache License, Version 2.0 (the "License");
+# you may not use this file except in compliance with the License.
+# You may obtain a copy of the License at
+#
+# http://www.apache.org/licenses/LICENSE-2.0
+#
+# Unless required by applicable law or agreed to in writing, software
+# distributed under the License is distributed on an "AS IS" BASIS,
+# WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.
+# See the License for the specific language governing permissions and
+# limitations under the License.
+
+import os
+import shutil
+import tempfile
+import unittest
+from unittest import mock
+
+from pymetamap import (MetaMap, MetaMapLite, IncrementalAnnotator, DocumentAnnotator,
+                       Corpus, CorpusLite)
+
+STUBS = os.path.join(os.path.dirname(os.path.dirname(os.path.abspath(__file__))),
+                     'benchmarks', 'stubs')
+METAMAP = os.path.join(STUBS, 'metamap')
+LITE_HOME = os.path.join(STUBS, 'public_mm_lite')
+
+DOCUMENTS = ['heart attack', 'fever', 'chest pain', 'aspirin daily', 'cough']
+IDS = ['n1', 'n2', 'n3', 'n4', 'n5']
+
+
+class IncrementalAnnotatorTest(unittest.TestCase):
+    def setUp(self):
+        self.directory = tempfile.mkdtemp()
+        self.addCleanup(shutil.rmtree, self.directory)
+        self.path = os.path.join(self.directory, 'manifest.db')
+        self.sent = list()
+
+    def annotator(self, metamap=None, **options):
+        if metamap is None:
+            metamap = MetaMap.get_instance(METAMAP)
+        original = metamap.extract_concepts
+
+        def extract_concepts(documents, ids, **extract_options):
+            self.sent.append(list(documents))
+            return original(documents, ids, **extract_options)
+
+        metamap.extract_concepts = extract_concepts
+        annotator = IncrementalAnnotator(metamap, self.path, **options)
+        self.addCleanup(annotator.close)
+        return annotator
+
+    def refresh(self, annotator, documents=DOCUMENTS, ids=IDS, **options):
+        del self.sent[:]
+        concepts, error = annotator.refresh(documents, ids, **options)
+        self.assertIsNone(error)
+        return concepts
+
+    def by_id(self, concepts):
+        grouped = dict()
+        for concept in concepts:
+            grouped.setdefault(concept.index, list()).append(concept)
+        return grouped
+
+    def test_unchanged_documents_are_reused(self):
+        annotator = self.annotator()
+        first = self.refresh(annotator)
+        self.assertEqual(self.sent, [DOCUMENTS])
+        self.assertIsInstance(first, Corpus)
+        self.assertEqual([concept.index for concept in first][::3], IDS)
+        second = self.refresh(annotator)
+        self.assertEqual(self.sent, [])
+        self.assertEqual(second, first)
+        self.assertEqual(annotator.stats(), {'reused': 5, 'annotated': 5, 'documents': 5})
+
+    def test_only_edited_documents_are_annotated(self):
+        annotator = self.annotator()
+        before = self.by_id(self.refresh(annotator))
+        edited = list(DOCUMENTS)
+        edited[1] = 'high fever'
+        edited[3] = 'aspirin twice daily'
+        after = self.by_id(self.refresh(annotator, edited))
+        self.assertEqual(self.sent, [['high fever', 'aspirin twice daily']])
+        for identifier in ('n1', 'n3', 'n5'):
+            self.assertEqual(after[identifier], before[identifier])
+        for identifier in ('n2', 'n4'):
+            self.assertNotEqual(after[identifier], before[identifier])
+        self.assertEqual(after['n2'][0].trigger, '["high"-tx-1-"high"-noun-0]')
+
+    def test_new_documents_and_order(self):
+        annotator = self.annotator()
+        self.refresh(annotator, DOCUMENTS[:3], IDS[:3])
+        concepts = self.refresh(annotator, DOCUMENTS[::-1], IDS[::-1])
+        self.assertEqual(self.sent, [['cough', 'aspirin daily']])
+        self.assertEqual([concept.index for concept in concepts][::3], IDS[::-1])
+
+    def test_manifest_survives_reopening(self):
+        self.refresh(self.annotator())
+        annotator = self.annotator()
+        self.refresh(annotator)
+        self.assertEqual(self.sent, [])
+        self.assertEqual(len(annotator), 5)
+
+    def test_fingerprint_changes_reannotate(self):
+        annotator = self.annotator(data_version='2020AA')
+        self.refresh(annotator)
+        self.refresh(annotator, composite_phrase=8)
+        self.assertEqual(self.sent, [DOCUMENTS])
+        self.refresh(annotator, composite_phrase=8)
+        self.assertEqual(self.sent, [])
+        annotator.close()
+        annotator = self.annotator(data_version='2021AA')
+        self.refresh(annotator, composite_phrase=8)
+        self.assertEqual(self.sent, [DOCUMENTS])
+
+    def test_failed_batches_are_retried(self):
+        annotator = self.annotator(batch_size=2)
+        with mock.patch.dict(os.environ, {'FAKE_METAMAP_FAIL_ON': 'aspirin'}):
+            concepts, error = annotator.refresh(DOCUMENTS, IDS)
+        self.assertEqual(error, 'ERROR: MetaMap failed')
+        self.assertNotIn('n4', set(concept.index for concept in concepts))
+        self.assertEqual(len(annotator), 3)
+        self.refresh(annotator)
+        self.assertEqual(self.sent, [['chest pain', 'aspirin daily']])
+
+    def test_remove_missing(self):
+        annotator = self.annotator()
+        self.refresh(annotator)
+        self.refresh(annotator, DOCUMENTS[:2], IDS[:2], remove_missing=True)
+        self.assertEqual(len(annotator), 2)
+        annotator.remove(['n1'])
+        self.refresh(annotator, DOCUMENTS[:2], IDS[:2])
+        self.assertEqual(self.sent, [['heart attack']])
+
+    def test_lite(self):
+        annotator = self.annotator(MetaMapLite.get_instance(LITE_HOME))
+        concepts = self.refresh(annotator)
+        self.assertIsInstance(concepts, CorpusLite)
+        self.assertEqual(self.refresh(annotator), concepts)
+        self.assertEqual(self.sent, [])
+
+    def test_document_annotator(self):
+        annotator = self.annotator(DocumentAnnotator(MetaMap.get_instance(METAMAP)))
+        documents = ['Fever.\n\nChest pain.', 'Heart attack.']
+        concepts = self.refresh(annotator, documents, IDS[:2])
+        self.assertEqual(sorted(set(concept.index for concept in concepts)), ['n1', 'n2'])
+        self.refresh(annotator, ['Fever.\n\nChest pain.', 'Heart attack. Aspirin.'], IDS[:2])
+        self.assertEqual(self.sent, [['Heart attack. Aspirin.']])
+
+    def test_invalid_arguments(self):
+        annotator = self.annotator()
+        with self.assertRaises(ValueError):
+            annotator.refresh(DOCUMENTS, IDS[:2])
+        with self.assertRaises(ValueError):
+            annotator.refresh(DOCUMENTS[:2], ['n1', 'n1'])
+        with self.assertRaises(ValueError):
+            IncrementalAnnotator(MetaMap.get_instance(METAMAP), self.path, batch_size=0)
+
+
+if __name__ == '__main__':
+    unittest.main()
@@ -0,0 +1,66 @@
+# Licensed under the Apache License, Version 2.0 (the "License");
+# you may not use this file except in compliance with the License.
+# You may obtain a copy of the License at
+#
+# http://www.apache.org/licenses/LICENSE-2.0
+#
+# Unless required by applicable law or agreed to in writing, software
+# distributed under the License is distributed on an "AS IS" BASIS,
+# WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.
+# See the License for the specific language governing permissions and
+# limitations under the License.
+
+import os
+import unittest
+from unittest import mock
+
+from pymetamap import MetaMap, MetaMapLite, Instrumentation, CallStats
+
+STUBS = os.path.join(os.path.dirname(os.path.dirname(os.path.abspath(__file__))),
+                     'benchmarks', 'stubs')
+METAMAP = os.path.join(STUBS, 'metamap')
+LITE_HOME = os.path.join(STUBS, 'public_mm_lite')
+
+
+class InstrumentationTest(unittest.TestCase):
+    def test_prometheus_keeps_precision(self):
+        instrumentation = Instrumentation()
+        stats = CallStats('SubprocessBackend')
+        stats.seconds = 1234.56789
+        stats.add_time('metamap', 0.123456789)
+        stats.add('bytes_in', 123456789)
+        instrumentation.record(stats)
+        lines = instrumentation.to_prometheus().splitlines()
+        self.assertIn('pymetamap_seconds_total{backend="SubprocessBackend"} 1234.56789', lines)
+        self.assertIn('pymetamap_phase_seconds_total{backend="SubprocessBackend",phase="metamap"} '
+                      '0.123456789', lines)
+        self.assertIn('pymetamap_bytes_in_total{backend="SubprocessBackend"} 123456789', lines)
+        self.assertIn('pymetamap_calls_total{backend="SubprocessBackend"} 1', lines)
+
+    def test_no_stats_without_instrumentation(self):
+        for module, get_instance in (
+                ('SubprocessBackend', lambda: MetaMap.get_instance(METAMAP)),
+                ('SubprocessBackendLite', lambda: MetaMapLite.get_instance(LITE_HOME))):
+            backend = get_instance()
+            with mock.patch('pymetamap.{0}.CallStats'.format(module),
+                            side_effect=AssertionError('CallStats built')):
+                concepts, error = backend.extract_concepts(['heart attack'], [1])
+            self.assertIsNone(error)
+            self.assertEqual(len(concepts), 3)
+
+    def test_stats_with_instrumentation(self):
+        instrumentation = Instrumentation()
+        backend = MetaMap.get_instance(METAMAP, instrumentation=instrumentation)
+        concepts, error = backend.extract_concepts(['heart attack', 'fever'], [1, 2])
+        self.assertIsNone(error)
+        totals = instrumentation.snapshot()['SubprocessBackend']
+        self.assertEqual(totals['calls'], 1)
+        self.assertEqual(totals['sentences'], 2)
+        self.assertEqual(totals['concepts'], 6)
+        self.assertGreater(totals['bytes_in'], 0)
+        self.assertGreater(totals['bytes_out'], 0)
+        self.assertIn('phase_seconds:spawn', totals)
+
+
+if __name__ == '__main__':
+    unittest.main()
@@ -0,0 +1,76 @@
+# Licensed under the Apache License, Version 2.0 (the "License");
+# you may not use this file except in compliance with the License.
+# You may obtain a copy of the License at
+#
+# http://www.apache.org/licenses/LICENSE-2.0
+#
+# Unless required by applicable law or agreed to in writing, software
+# distributed under the License is distributed on an "AS IS" BASIS,
+# WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.
+# See the License for the specific language governing permissions and
+# limitations under the License.
+
+import os
+import unittest
+from unittest import mock
+
+from pymetamap import MetaMap, MetaMapLite
+from pymetamap.Cache import MemoryCache
+
+STUBS = os.path.join(os.path.dirname(os.path.dirname(os.path.abspath(__file__))),
+                     'benchmarks', 'stubs')
+METAMAP = os.path.join(STUBS, 'metamap')
+LITE_HOME = os.path.join(STUBS, 'public_mm_lite')
+
+SENTENCES = ['heart attack', 'fever', 'boom today', 'pain', 'aspirin', 'boom again', 'cough']
+IDS = list(range(len(SENTENCES)))
+
+
+class IsolationTest(unittest.TestCase):
+    def setUp(self):
+        patcher = mock.patch.dict(os.environ, {'FAKE_METAMAP_FAIL_ON': 'boom'})
+        patcher.start()
+        self.addCleanup(patcher.stop)
+
+    def expected(self, backend):
+        good = [(identifier, sentence) for identifier, sentence in zip(IDS, SENTENCES)
+                if 'boom' not in sentence]
+        concepts, error = backend.extract_concepts([sentence for _, sentence in good],
+                                                   [identifier for identifier, _ in good])
+        self.assertIsNone(error)
+        return concepts
+
+    def check_isolated(self, backend, expected):
+        concepts, failed = backend.extract_concepts_isolated(SENTENCES, IDS)
+        self.assertEqual([(failure.id, failure.sentence) for failure in failed],
+                         [(2, 'boom today'), (5, 'boom again')])
+        self.assertTrue(all(failure.error for failure in failed))
+        self.assertEqual(concepts, expected)
+
+    def test_metamap(self):
+        backend = MetaMap.get_instance(METAMAP)
+        self.check_isolated(backend, self.expected(backend))
+
+    def test_lite(self):
+        backend = MetaMapLite.get_instance(LITE_HOME)
+        self.check_isolated(backend, self.expected(backend))
+
+    def test_pool(self):
+        backend = MetaMap.get_instance(METAMAP, backend='pool', pool_size=2, batch_size=3)
+        self.check_isolated(backend, self.expected(MetaMap.get_instance(METAMAP)))
+
+    def test_pool_uses_cache(self):
+        cache = MemoryCache()
+        backend = MetaMap.get_instance(METAMAP, backend='pool', pool_size=2, batch_size=3,
+                                       cache=cache)
+        expected = self.expected(MetaMap.get_instance(METAMAP))
+        self.check_isolated(backend, expected)
+        # Every sentence that succeeded was stored ...
+        self.assertEqual(len(cache), len(SENTENCES) - 2)
+        # ... and is served from the cache on the next call, although
+        # MetaMap now fails on every input line.
+        with mock.patch.dict(os.environ, {'FAKE_METAMAP_FAIL_ON': '|'}):
+            self.check_isolated(backend, expected)
+
+if __name__ == '__main__':
+    unittest.main()
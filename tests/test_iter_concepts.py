@@ -0,0 +1,97 @@
+# Licensed under the Apache License, Version 2.0 (the "License");
+# you may not use this file except in compliance with the License.
+# You may obtain a copy of the License at
+#
+# http://www.apache.org/licenses/LICENSE-2.0
+#
+# Unless required by applicable law or agreed to in writing, software
+# distributed under the License is distributed on an "AS IS" BASIS,
+# WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.
+# See the License for the specific language governing permissions and
+# limitations under the License.
+
+import os
+import time
+import unittest
+from unittest import mock
+
+from pymetamap import MetaMap, MetaMapLite, Corpus, CorpusLite
+from pymetamap.ProcessIO import ProcessFailed
+
+STUBS = os.path.join(os.path.dirname(os.path.dirname(os.path.abspath(__file__))),
+                     'benchmarks', 'stubs')
+METAMAP = os.path.join(STUBS, 'metamap')
+LITE_HOME = os.path.join(STUBS, 'public_mm_lite')
+
+SENTENCES = ['heart attack', 'fever', 'chest pain', 'aspirin daily', 'cough']
+IDS = [10, 'b', 12, 'd', 14]
+DELAY = 0.3
+
+
+class IterConceptsTest(object):
+    """ Tests shared by MetaMap and MetaMapLite; subclasses set backend
+        and corpus_class.
+    """
+    def test_matches_extract_concepts(self):
+        for ids in (IDS, None):
+            expected, error = self.backend().extract_concepts(SENTENCES, ids)
+            self.assertIsNone(error)
+            self.assertEqual(list(self.backend().iter_concepts(SENTENCES, ids)), expected)
+
+    def test_indexes_in_input_order(self):
+        concepts = list(self.backend().iter_concepts(iter(SENTENCES), iter(IDS)))
+        indexes = [concept.index for concept in concepts]
+        self.assertEqual(indexes, [repr(identifier) for identifier in IDS for _ in range(3)])
+
+    def test_group_by_id(self):
+        groups = list(self.backend().iter_concepts(SENTENCES, IDS, group_by_id=True))
+        self.assertEqual([index for index, _ in groups], [repr(identifier) for identifier in IDS])
+        for index, concepts in groups:
+            self.assertIsInstance(concepts, self.corpus_class)
+            self.assertEqual(len(concepts), 3)
+            self.assertEqual(set(concept.index for concept in concepts), set([index]))
+
+    def test_yields_incrementally(self):
+        with mock.patch.dict(os.environ, {'FAKE_METAMAP_DELAY': str(DELAY)}):
+            started = time.perf_counter()
+            arrivals = list()
+            for concept in self.backend().iter_concepts(SENTENCES, IDS):
+                arrivals.append((concept.index, time.perf_counter() - started))
+        # The concepts of the first sentence arrive while the stand-in is
+        # still working on the others, about DELAY seconds apart.
+        self.assertEqual([index for index, _ in arrivals][::3], [repr(identifier) for identifier in IDS])
+        first, last = arrivals[0][1], arrivals[-1][1]
+        self.assertGreaterEqual(last - first, DELAY * (len(SENTENCES) - 2))
+
+    def test_stopping_early_kills_process(self):
+        with mock.patch.dict(os.environ, {'FAKE_METAMAP_DELAY': '5'}):
+            started = time.perf_counter()
+            concepts = self.backend().iter_concepts(SENTENCES, IDS)
+            concepts.close()
+        self.assertLess(time.perf_counter() - started, 4)
+
+    def test_failure_raises_after_concepts(self):
+        with mock.patch.dict(os.environ, {'FAKE_METAMAP_FAIL_ON': 'chest'}):
+            received = list()
+            with self.assertRaises(ProcessFailed):
+                for concept in self.backend().iter_concepts(SENTENCES, IDS):
+                    received.append(concept.index)
+        self.assertEqual(received, [repr(identifier) for identifier in IDS[:2] for _ in range(3)])
+
+
+class MetaMapIterConceptsTest(IterConceptsTest, unittest.TestCase):
+    corpus_class = Corpus
+
+    def backend(self):
+        return MetaMap.get_instance(METAMAP)
+
+
+class MetaMapLiteIterConceptsTest(IterConceptsTest, unittest.TestCase):
+    corpus_class = CorpusLite
+
+    def backend(self):
+        return MetaMapLite.get_instance(LITE_HOME)
+
+
+if __name__ == '__main__':
+    unittest.main()
@@ -9,3 +9,40 @@
 # WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.
 # See the License for the specific language governing permissions and
 # limitations under the License.
+
+import os
+import unittest
+
+from pymetamap import MetaMap, MetaMapLite, Instrumentation
+
+STUBS = os.path.join(os.path.dirname(os.path.dirname(os.path.abspath(__file__))),
+                     'benchmarks', 'stubs')
+METAMAP = os.path.join(STUBS, 'metamap')
+LITE_HOME = os.path.join(STUBS, 'public_mm_lite')
+
+
+class ExtractConceptsTest(unittest.TestCase):
+    def check_generator_input(self, get_instance):
+        sentences = ['heart attack', 'fever']
+        expected, error = get_instance().extract_concepts(sentences, [1, 2])
+        self.assertIsNone(error)
+        self.assertEqual(len(expected), 6)
+        for instrumentation in (None, Instrumentation()):
+            backend = get_instance(instrumentation=instrumentation)
+            concepts, error = backend.extract_concepts((sentence for sentence in sentences),
+                                                       iter([1, 2]))
+            self.assertIsNone(error)
+            self.assertEqual(concepts, expected)
+        # The sentences of the generator are counted as they are written.
+        totals = list(instrumentation.snapshot().values())[0]
+        self.assertEqual(totals['sentences'], 2)
+
+    def test_metamap_generator_input(self):
+        self.check_generator_input(lambda **options: MetaMap.get_instance(METAMAP, **options))
+
+    def test_lite_generator_input(self):
+        self.check_generator_input(lambda **options: MetaMapLite.get_instance(LITE_HOME, **options))
+
+
+if __name__ == '__main__':
+    unittest.main()
@@ -0,0 +1,134 @@
+# Licensed under the Apache License, Version 2.0 (the "License");
+# you may not use this file except in compliance with the License.
+# You may obtain a copy of the License at
+#
+# http://www.apache.org/licenses/LICENSE-2.0
+#
+# Unless required by applicable law or agreed to in writing, software
+# distributed under the License is distributed on an "AS IS" BASIS,
+# WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.
+# See the License for the specific language governing permissions and
+# limitations under the License.
+
+import os
+import time
+import unittest
+from unittest import mock
+
+from pymetamap import MetaMap, MetaMapLite
+
+STUBS = os.path.join(os.path.dirname(os.path.dirname(os.path.abspath(__file__))),
+                     'benchmarks', 'stubs')
+METAMAP = os.path.join(STUBS, 'metamap')
+LITE_HOME = os.path.join(STUBS, 'public_mm_lite')
+
+
+class PersistentBackendTest(unittest.TestCase):
+    def backend(self, **options):
+        backend = MetaMap.get_instance(METAMAP, backend='persistent', **options)
+        self.addCleanup(backend.close)
+        return backend
+
+    def test_matches_subprocess_backend(self):
+        sentences = ['heart attack', 'fever and pain', 'aspirin']
+        for ids in ([1, 2, 3], ['a', 'b', 'c']):
+            expected, error = MetaMap.get_instance(METAMAP).extract_concepts(sentences, ids)
+            self.assertIsNone(error)
+            backend = self.backend()
+            for attempt in range(2):
+                concepts, error = backend.extract_concepts(sentences, ids)
+                self.assertIsNone(error)
+                self.assertEqual(concepts, expected)
+            self.assertEqual(backend._session.starts, 1)
+
+    def test_restart_after_process_dies(self):
+        backend = self.backend(timeout=10)
+        concepts, error = backend.extract_concepts(['fever'], [1])
+        self.assertIsNone(error)
+        backend._session.process.kill()
+        backend._session.process.wait()
+
+        concepts, error = backend.extract_concepts(['heart attack'], [2])
+        self.assertIsNone(error)
+        self.assertEqual(len(concepts), 3)
+        self.assertEqual(set(concept.index for concept in concepts), set(['2']))
+        self.assertEqual(backend._session.starts, 2)
+
+    def test_unanswered_sentinel_fails_fast(self):
+        with mock.patch.dict(os.environ, {'FAKE_METAMAP_EMPTY_ON': 'nothing'}):
+            backend = self.backend(timeout=1, sentinel_text='nothing here')
+            started = time.time()
+            concepts, error = backend.extract_concepts(['fever'], [1])
+            self.assertLess(time.time() - started, 10)
+            self.assertIn("sentinel_text 'nothing here' produced no output", error)
+            # Later calls report the same error without waiting again.
+            started = time.time()
+            concepts, error = backend.extract_concepts(['pain'], [2])
+            self.assertLess(time.time() - started, 0.5)
+            self.assertIn("sentinel_text 'nothing here' produced no output", error)
+            self.assertEqual(backend._session.starts, 1)
+
+
+class PersistentBackendLiteTest(unittest.TestCase):
+    def backend(self, **options):
+        backend = MetaMapLite.get_instance(LITE_HOME, backend='persistent', **options)
+        self.addCleanup(backend.close)
+        return backend
+
+    def test_matches_subprocess_backend(self):
+        sentences = ['heart attack', 'fever and pain', 'aspirin']
+        expected, error = MetaMapLite.get_instance(LITE_HOME).extract_concepts(sentences, [1, 2, 3])
+        self.assertIsNone(error)
+        concepts, error = self.backend().extract_concepts(sentences, [1, 2, 3])
+        self.assertIsNone(error)
+        self.assertEqual(concepts, expected)
+
+    def test_sentinel_framing(self):
+        backend = self.backend()
+        first, error = backend.extract_concepts(['heart attack', 'fever'], ['a', 'b'])
+        self.assertIsNone(error)
+        second, error = backend.extract_concepts(['pain'], ['c'])
+        self.assertIsNone(error)
+        # Each call gets exactly its own rows, none of the sentinel's.
+        self.assertEqual(set(concept.index for concept in first), set(["'a'", "'b'"]))
+        self.assertEqual(set(concept.index for concept in second), set(["'c'"]))
+        self.assertEqual(len(first), 6)
+        self.assertEqual(len(second), 3)
+        self.assertEqual(backend._session.starts, 1)
+
+    def test_restart_after_crash(self):
+        backend = self.backend(timeout=10)
+        concepts, error = backend.extract_concepts(['fever'], [1])
+        self.assertIsNone(error)
+        backend._session.process.kill()
+        backend._session.process.wait()
+
+        concepts, error = backend.extract_concepts(['heart attack'], [2])
+        self.assertIsNone(error)
+        self.assertEqual(len(concepts), 3)
+        self.assertEqual(backend._session.starts, 2)
+
+    def test_failing_sentence_reports_error(self):
+        with mock.patch.dict(os.environ, {'FAKE_METAMAP_FAIL_ON': 'boom'}):
+            backend = self.backend(timeout=10, max_restarts=1)
+            concepts, error = backend.extract_concepts(['boom'], [1])
+            self.assertIsNotNone(error)
+            self.assertEqual(backend.restarts, 1)
+            concepts, error = backend.extract_concepts(['fever'], [2])
+        self.assertIsNone(error)
+        self.assertEqual(len(concepts), 3)
+
+    def test_hang_times_out(self):
+        with mock.patch.dict(os.environ, {'FAKE_METAMAP_HANG_ON': 'hang'}):
+            backend = self.backend(timeout=1, max_restarts=0)
+            started = time.time()
+            concepts, error = backend.extract_concepts(['hang'], [1])
+            self.assertLess(time.time() - started, 10)
+            self.assertIn('no response within 1 seconds', error)
+            concepts, error = backend.extract_concepts(['fever'], [2])
+        self.assertIsNone(error)
+        self.assertEqual(len(concepts), 3)
+
+
+if __name__ == '__main__':
+    unittest.main()
@@ -0,0 +1,102 @@
+# Licensed under the Apache License, Version 2.0 (the "License");
+# you may not use this file except in compliance with the License.
+# You may obtain a copy of the License at
+#
+# http://www.apache.org/licenses/LICENSE-2.0
+#
+# Unless required by applicable law or agreed to in writing, software
+# distributed under the License is distributed on an "AS IS" BASIS,
+# WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.
+# See the License for the specific language governing permissions and
+# limitations under the License.
+
+import os
+import shutil
+import tempfile
+import unittest
+from unittest import mock
+
+from pymetamap import MetaMap
+
+STUBS = os.path.join(os.path.dirname(os.path.dirname(os.path.abspath(__file__))),
+                     'benchmarks', 'stubs')
+METAMAP = os.path.join(STUBS, 'metamap')
+
+SENTENCES = ['heart attack', 'fever', 'chest pain', 'aspirin daily', 'cough',
+             'high blood pressure', 'diabetes', 'no fever', 'headache', 'nausea', 'rash']
+IDS = ['s{0}'.format(number) for number in range(len(SENTENCES))]
+
+
+class PoolBackendTest(unittest.TestCase):
+    def pool(self, **options):
+        options.setdefault('pool_size', 3)
+        backend = MetaMap.get_instance(METAMAP, backend='pool', **options)
+        self.addCleanup(backend.close)
+        return backend
+
+    def test_matches_single_backend(self):
+        for ids in (IDS, None):
+            for worker_backend in ('subprocess', 'persistent'):
+                single = MetaMap.get_instance(METAMAP, backend=worker_backend)
+                self.addCleanup(getattr(single, 'close', lambda: None))
+                expected, error = single.extract_concepts(SENTENCES, ids)
+                self.assertIsNone(error)
+                for batch_size in (1, 2, 4, 100):
+                    backend = self.pool(batch_size=batch_size, worker_backend=worker_backend)
+                    concepts, error = backend.extract_concepts(SENTENCES, ids)
+                    self.assertIsNone(error)
+                    # Same concepts in the same (input) order.
+                    self.assertEqual(concepts, expected, (ids, worker_backend, batch_size))
+
+    def test_file_input_matches_subprocess_backend(self):
+        directory = tempfile.mkdtemp()
+        self.addCleanup(shutil.rmtree, directory)
+        filename = os.path.join(directory, 'input.txt')
+        with open(filename, 'w') as input_file:
+            input_file.write(''.join("{0!r}|{1!r}\n".format(identifier, sentence)
+                                     for identifier, sentence in zip(IDS, SENTENCES)))
+        expected, error = MetaMap.get_instance(METAMAP).extract_concepts(filename=filename,
+                                                                         file_format='sldiID')
+        self.assertIsNone(error)
+        for batch_size in (1, 3):
+            concepts, error = self.pool(batch_size=batch_size).extract_concepts(
+                filename=filename, file_format='sldiID')
+            self.assertIsNone(error)
+            self.assertEqual(concepts, expected)
+
+    def test_failing_batch(self):
+        with mock.patch.dict(os.environ, {'FAKE_METAMAP_FAIL_ON': 'cough'}):
+            concepts, error = self.pool(batch_size=2).extract_concepts(SENTENCES, IDS)
+        self.assertEqual(error, 'ERROR: MetaMap failed')
+        # Only the batch holding 'cough' (s4, s5) is lost; the stand-in
+        # exits before answering it.
+        indexes = [concept.index for concept in concepts]
+        self.assertEqual(sorted(set(indexes), key=indexes.index),
+                         ["'s{0}'".format(number) for number in range(len(SENTENCES))
+                          if number not in (4, 5)])
+
+    def test_worker_exception(self):
+        backend = self.pool(batch_size=2)
+
+        def extract(command, sentences, ids, stats=None):
+            if 'diabetes' in sentences:
+                raise RuntimeError('worker crashed')
+            return original(command, sentences, ids, stats)
+
+        original = backend._workers[0]._extract_sentences
+        for worker in backend._workers:
+            worker._extract_sentences = extract
+        concepts, error = backend.extract_concepts(SENTENCES, IDS)
+        self.assertEqual(error, 'ERROR: worker crashed')
+        self.assertNotIn("'s6'", set(concept.index for concept in concepts))
+        self.assertEqual(len(concepts), 3 * (len(SENTENCES) - 2))
+
+    def test_invalid_arguments(self):
+        for options in ({'pool_size': 0}, {'batch_size': 0}, {'queue_depth': 0},
+                        {'worker_backend': 'threads'}):
+            with self.assertRaises(ValueError):
+                MetaMap.get_instance(METAMAP, backend='pool', **options)
+
+
+if __name__ == '__main__':
+    unittest.main()
@@ -0,0 +1,134 @@
+# Licensed under the Apache License, Version 2.0 (the "License");
+# you may not use this file except in compliance with the License.
+# You may obtain a copy of the License at
+#
+# http://www.apache.org/licenses/LICENSE-2.0
+#
+# Unless required by applicable law or agreed to in writing, software
+# distributed under the License is distributed on an "AS IS" BASIS,
+# WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.
+# See the License for the specific language governing permissions and
+# limitations under the License.
+
+import asyncio
+import os
+import socket
+import sys
+import unittest
+from unittest import mock
+
+from pymetamap import MetaMap, ServerManager
+from pymetamap.ServerManager import ManagedServer
+
+STUBS = os.path.join(os.path.dirname(os.path.dirname(os.path.abspath(__file__))),
+                     'benchmarks', 'stubs')
+METAMAP = os.path.join(STUBS, 'metamap')
+SERVER_COMMAND = [sys.executable, os.path.join(STUBS, 'fake_server.py'), '{port}']
+
+
+def free_port():
+    listener = socket.socket()
+    listener.bind(('localhost', 0))
+    port = listener.getsockname()[1]
+    listener.close()
+    return port
+
+
+class ServerManagerTest(unittest.TestCase):
+    def manager(self, tagger_ports, wsd_ports=()):
+        manager = ServerManager(tagger_ports=tagger_ports, wsd_ports=wsd_ports,
+                                tagger_command=SERVER_COMMAND, wsd_command=SERVER_COMMAND,
+                                start_timeout=30)
+        self.addCleanup(manager.stop)
+        manager.start()
+        return manager
+
+    def test_round_robin_assignment(self):
+        ports = [free_port(), free_port()]
+        manager = self.manager(ports)
+        assignments = [manager.assignment(index) for index in range(3)]
+        self.assertEqual([assignment.environment['TAGGER_SERVER_PORT'] for assignment in assignments],
+                         [str(ports[0]), str(ports[1]), str(ports[0])])
+        self.assertEqual(assignments[0].arguments, ['--tagger_server', 'localhost'])
+
+    def test_metamap_uses_assigned_server(self):
+        manager = self.manager([free_port()])
+        concepts, error = MetaMap.get_instance(METAMAP, servers=manager).extract_concepts(
+            ['heart attack'], [1])
+        self.assertIsNone(error)
+        self.assertEqual(len(concepts), 3)
+
+    def test_check_times_request(self):
+        with mock.patch.dict(os.environ, {'FAKE_SERVER_DELAY': '0.2'}):
+            manager = self.manager([free_port()])
+        server = manager.servers[0]
+        latency = server.check()
+        self.assertGreaterEqual(latency, 0.2)
+        self.assertTrue(server.healthy)
+
+    def test_check_detects_unresponsive_server(self):
+        # Accepts connections (into its backlog) but never answers.
+        listener = socket.socket()
+        self.addCleanup(listener.close)
+        listener.bind(('localhost', 0))
+        listener.listen(5)
+        server = ManagedServer('tagger', 'localhost', listener.getsockname()[1])
+        self.assertIsNone(server.check(timeout=0.5))
+        self.assertFalse(server.healthy)
+        self.assertEqual(server.failures, 1)
+
+    def stop_server(self, server):
+        server.process.kill()
+        server.process.wait()
+        self.assertIsNone(server.check())
+
+    def test_backend_follows_healthy_servers(self):
+        manager = self.manager([free_port(), free_port()])
+        backend = MetaMap.get_instance(METAMAP, servers=manager)
+        concepts, error = backend.extract_concepts(['heart attack'], [1])
+        self.assertIsNone(error)
+        # The first server goes away; the next process uses the other one.
+        self.stop_server(manager.servers[0])
+        concepts, error = backend.extract_concepts(['heart attack'], [1])
+        self.assertIsNone(error)
+        self.assertEqual(len(concepts), 3)
+
+    def test_async_backend_follows_healthy_servers(self):
+        manager = self.manager([free_port(), free_port()])
+        backend = MetaMap.get_instance(METAMAP, backend='async', servers=manager)
+        concepts, error = asyncio.run(backend.extract_concepts(['heart attack'], [1]))
+        self.assertIsNone(error)
+        self.stop_server(manager.servers[0])
+        concepts, error = asyncio.run(backend.extract_concepts(['heart attack'], [1]))
+        self.assertIsNone(error)
+        self.assertEqual(len(concepts), 3)
+
+    def test_pool_follows_healthy_servers(self):
+        manager = self.manager([free_port(), free_port()])
+        backends = list()
+        for worker_backend in ('subprocess', 'persistent'):
+            backend = MetaMap.get_instance(METAMAP, backend='pool', pool_size=2, batch_size=1,
+                                           worker_backend=worker_backend, servers=manager)
+            self.addCleanup(backend.close)
+            concepts, error = backend.extract_concepts(['fever', 'pain'], [1, 2])
+            self.assertIsNone(error)
+            backends.append(backend)
+        self.stop_server(manager.servers[1])
+        for backend in backends:
+            concepts, error = backend.extract_concepts(['fever', 'pain', 'aspirin'], [1, 2, 3])
+            self.assertIsNone(error)
+            self.assertEqual(len(concepts), 9)
+
+    def test_ensure_restarts_stopped_server(self):
+        manager = self.manager([free_port()])
+        server = manager.servers[0]
+        server.process.kill()
+        server.process.wait()
+        self.assertEqual(manager.ensure(), [server])
+        self.assertEqual(server.restarts, 1)
+        self.assertIsNotNone(server.check())
+        self.assertEqual(manager.ensure(), [])
+
+
+if __name__ == '__main__':
+    unittest.main()
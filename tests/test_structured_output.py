@@ -0,0 +1,86 @@
+# Licensed under the Apache License, Version 2.0 (the "License");
+# you may not use this file except in compliance with the License.
+# You may obtain a copy of the License at
+#
+# http://www.apache.org/licenses/LICENSE-2.0
+#
+# Unless required by applicable law or agreed to in writing, software
+# distributed under the License is distributed on an "AS IS" BASIS,
+# WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.
+# See the License for the specific language governing permissions and
+# limitations under the License.
+
+import json
+import os
+import unittest
+
+from pymetamap import MetaMap, MetaMapLite
+from pymetamap.StructuredOutput import iter_utterances, iter_lite_entities, iter_brat, Span
+
+STUBS = os.path.join(os.path.dirname(os.path.dirname(os.path.abspath(__file__))),
+                     'benchmarks', 'stubs')
+METAMAP = os.path.join(STUBS, 'metamap')
+LITE_HOME = os.path.join(STUBS, 'public_mm_lite')
+
+
+def document(identifier):
+    return {'Document': {'Negations': [], 'Utterances': [
+        {'PMID': identifier, 'UttNum': '1', 'UttText': 'fever', 'UttStartPos': '0',
+         'UttLength': '5', 'Phrases': []}]}}
+
+
+class DecoderTest(unittest.TestCase):
+    def test_chunk_boundaries(self):
+        text = 'SKRrun echo line\n{"AllDocuments":[' + \
+            ','.join(json.dumps(document(str(number))) for number in range(5)) + ']}\n'
+        # One character per chunk splits every token.
+        utterances = list(iter_utterances(iter(text)))
+        self.assertEqual([utterance.id for utterance in utterances], ['0', '1', '2', '3', '4'])
+        self.assertEqual(utterances[0].length, 5)
+
+    def test_lite_entities_skip_logging(self):
+        text = 'INFO starting\n[{"id": "en0", "docid": "a", "start": 3, "length": 5, ' \
+               '"negated": true, "evlist": [{"conceptinfo": {"cui": "C0015967"}}]}]\n'
+        entities = list(iter_lite_entities([text]))
+        self.assertEqual(len(entities), 1)
+        self.assertTrue(entities[0].negated)
+        self.assertEqual(entities[0].evidence[0].cui, 'C0015967')
+
+    def test_brat_notes(self):
+        lines = ['T1\tsosy 3 8\tfever', '#1\tAnnotatorNotes T1\tFever:C0015967',
+                 'T2\tdsyn 0 2;4 6\tab cd']
+        annotations = list(iter_brat(lines))
+        self.assertEqual([annotation.id for annotation in annotations], ['T1', 'T2'])
+        self.assertEqual(annotations[0].cuis, ['C0015967'])
+        self.assertEqual(annotations[1].spans, [Span(0, 2), Span(4, 2)])
+
+
+class BackendTest(unittest.TestCase):
+    def test_metamap_utterances(self):
+        backend = MetaMap.get_instance(METAMAP)
+        utterances = list(backend.iter_utterances(['no fever today', 'aspirin'], ids=[1, 2],
+                                                  show_candidates=True))
+        self.assertEqual([utterance.id for utterance in utterances], ['1', '2'])
+        self.assertEqual(len(utterances[0].phrases), 3)
+        self.assertEqual(len(utterances[0].phrases[0].candidates), 1)
+        negated = [cui for negation in utterances[0].negations for cui in negation.cuis]
+        mapped = [candidate.cui for phrase in utterances[0].phrases
+                  for mapping in phrase.mappings for candidate in mapping.candidates
+                  if candidate.negated]
+        self.assertEqual(negated, mapped)
+        self.assertEqual(len(negated), 1)
+        self.assertEqual(utterances[1].negations, [])
+
+    def test_lite_entities(self):
+        backend = MetaMapLite.get_instance(LITE_HOME)
+        entities = list(backend.iter_entities(['no fever today'], ids=['a']))
+        self.assertEqual(len(entities), 3)
+        self.assertEqual([entity.negated for entity in entities], [False, True, False])
+        annotations = list(backend.iter_entities(['no fever today'], ids=['a'],
+                                                 output_format='brat'))
+        self.assertEqual(len(annotations), 3)
+        self.assertTrue(all(annotation.cuis for annotation in annotations))
+
+
+if __name__ == '__main__':
+    unittest.main()